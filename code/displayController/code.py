@@ -1,20 +1,39 @@
 import board
+import supervisor
 import terminalio
 import displayio
 import busio
-from digitalio import DigitalInOut, Direction, Pull
+from digitalio import DigitalInOut, Direction
 from adafruit_display_text import label
 # from adafruit_st7789 import ST7789
 import adafruit_ili9341
-import adafruit_imageload
-import time
-from adafruit_debouncer import Debouncer
+from switches import Switches
+from protocol import Command, CommandTable, CMD_DRN, CMD_GOV, CMD_HYP, CMD_PB, CMD_SLG, CMD_STA
+from ticks import ticks_ms, ticks_add, ticks_diff, ticks_expired
+from uartlink import LineReader, LinkUpgrade, TxQueue
+from profiler import Profiler
 import adafruit_aw9523
+from digits import DigitDisplay
+from messages import MessageCache
+from game_state import (
+    GameState, DEFAULT_CRASH_BONUS, MISSION_STATUS_ACTIVE, MISSION_STATUS_NONE, MISSION_STATUS_SELECTED,
+    MODE_BALL_DRAIN, MODE_BALL_LAUNCH, MODE_GAME_OVER, MODE_PLAYING,
+)
+from refresh import RefreshScheduler
+from screen_fx import (
+    AnimationLayer, PaletteCycle, Sprite, burst_sheet, chevron_sheet, gradient_palette, sprite_palette, streak_sheet,
+)
+from lamps import BlinkEngine, FadeEngine, LampFramebuffer, LampGroup, LampSequencer, chase
 import pwmio
 from adafruit_motor import servo
 import random
 import sys
 
+# Boot timing, from here (once the imports are done) to the first frame and to the main loop
+boot_start = ticks_ms()
+boot_first_frame_ms = None
+boot_main_loop_ms = None
+
 # Sound fx keys
 STARTUP_SOUND = 0
 HIGH_SCORE_SOUND = 1
@@ -62,32 +81,14 @@ SPINNER_SOUND = 42
 
 DROP_TARGET_RESET_SOUNDS = [DROP_TARGET_RESET_SOUND_2, DROP_TARGET_RESET_SOUND_3]
 
-# Overall modes for the game
-MODE_STARTUP = 0
-MODE_BALL_LAUNCH = 1
-MODE_PLAYING = 2
-MODE_BALL_DRAIN = 3
-MODE_GAME_OVER = 4
-game_mode = MODE_STARTUP
-
-# Modes for mission progression
-MISSION_STATUS_NONE = 0
-MISSION_STATUS_SELECTED = 1
-MISSION_STATUS_ACTIVE = 2
-mission_status = MISSION_STATUS_NONE
-cur_mission = None
-num_missions_completed = 0
-cur_rank = 0
-mission_hits_left = 0
-DEFAULT_CRASH_BONUS = 1000
-crash_bonus = DEFAULT_CRASH_BONUS
-message_timer = None
-MESSAGE_DELAY = 5.0
-MESSAGE_DELAY_LONGER = 8.0
-next_message = ''
+MESSAGE_DELAY = 5000  # ms
+MESSAGE_DELAY_LONGER = 8000  # ms
 WAITING_MISSION_SELECT_TEXT = "Hit Mission Select Targets"
 WAITING_BALL_LAUNCH_TEXT = "Launch Ball"
-current_status_text = WAITING_MISSION_SELECT_TEXT
+# Everything that changes over a game
+state = GameState(ticks_ms(), WAITING_MISSION_SELECT_TEXT)
+status_text_pending = None  # Set by set_status_text(), drawn by draw_text()
+ball_text_pending = None  # Set by set_ball_text(), drawn by draw_text()
 MISSION_NAMES = [
     'Orbital Refueling',
     'Thruster Tests',
@@ -99,9 +100,9 @@ MISSION_HIT_COUNTS = [
     1,
 ]
 MISSION_TARGETS = [
-    'HYP',
-    'SLG',
-    'PB',
+    CMD_HYP,
+    CMD_SLG,
+    CMD_PB,
 ]
 MISSION_STATUS_TEXT_PLURAL = [
     '{} Hyperspace Launches Left',
@@ -132,7 +133,7 @@ RANK_NAMES = [
 ]
 
 # Servo constants
-SERVO_TIMEOUT = 1.0
+SERVO_TIMEOUT = 1000  # ms
 
 # Lights constants
 pins = [0, 11, 10, 9, 8, 1, 2, 3, 4, 5, 6, 7, 12, 13, 14, 15]  # The physical order of the pins on the I2C expanders
@@ -185,62 +186,37 @@ LIGHT_HYPERSPACE_BAR = [
     [1, pins[14]], # Bar 1 (outer)
 ]
 
-light_state = [[False for _ in range(len(pins))] for _ in range(2)]
+# Light groups compiled to pin bitmasks, for switching a whole group at once
+LAMPS_MISSION_SELECT = LampGroup(LIGHT_MISSION_SELECT)
+LAMPS_HYPERSPACE_ARROW = LampGroup(LIGHT_HYPERSPACE_ARROW)
+LAMPS_MISSION_ARROW = LampGroup(LIGHT_MISSION_ARROW)
+LAMPS_HYPERSPACE_BAR = LampGroup(LIGHT_HYPERSPACE_BAR)
+
 def set_light(arr, state):
-    """Set the light state."""
-    global aw_devices
-    global light_state
-    value = 255 if state else 0
-    print(f'Setting light {arr[0]},{arr[1]} to {state}')
-    aw_devices[arr[0]].set_constant_current(arr[1], value)
-    light_state[arr[0]][arr[1]] = state
-
-light_blink_anims = []
-def blink_light(arr, num_blinks, period, stay_off_on_complete, on_complete=lambda: None):
-    """Blink a light."""
-    global light_blink_anims
+    """Set the light state. It's sent to the expanders when lamps are flushed at the end of the loop."""
+    global lamps
+    fades.stop_lamp(arr[0], arr[1])
+    lamps.set(arr[0], arr[1], 255 if state else 0)
+
+def blink_light(arr, num_blinks, period, stay_off_on_complete, on_complete=None):
+    """Blink a light, toggling it every period ms."""
+    blinks.start(arr, num_blinks, period, stay_off_on_complete, ticks_ms(), on_complete)
+
+def pulse_light(arr, period):
+    """Breathe a light on and off, once every period ms, until it's cancelled or set."""
     cancel_anim(arr)
-    light_blink_anims.append(
-        (arr, num_blinks, period, stay_off_on_complete, time.monotonic(), on_complete)
-    )
+    fades.pulse(arr, period)
 
 def update_blink_anims():
-    """Update the blink animations."""
-    global light_blink_anims, aw_devices, light_state
-    # Iterate backwards so we can delete from the list as we go
-    for i in reversed(range(len(light_blink_anims))):
-        arrs, num_blinks, period, stay_off_on_complete, start_time, on_complete = light_blink_anims[i]
-        if num_blinks == 0:
-            for arr in arrs:
-                set_light(arr, stay_off_on_complete)
-            on_complete()
-            del light_blink_anims[i]
-        else:
-            elapsed = time.monotonic() - start_time
-            if elapsed > period:
-                light_blink_anims[i] = (arrs, num_blinks - 1, period, stay_off_on_complete, time.monotonic(), on_complete)
-                for arr in arrs:
-                    set_light(arr, not light_state[arr[0]][arr[1]])
+    """Update the blink and fade animations."""
+    cur_time = ticks_ms()
+    blinks.update(cur_time)
+    fades.update(cur_time)
 
 def cancel_anim(arr, call_callback=True):
-    """Cancel a blink animation."""
-    global light_blink_anims
-    for i in reversed(range(len(light_blink_anims))):
-        # Test exact array match
-        if light_blink_anims[i][0] == arr:
-            if call_callback:
-                light_blink_anims[i][5]() # Call callback
-            del light_blink_anims[i]
-        else:
-            # Test for one light in the anim matching
-            print(f'i: {light_blink_anims[i]}')
-            print(f'i0: {light_blink_anims[i][0]}')
-            for sub_arr in light_blink_anims[i][0]:
-                if sub_arr in arr:
-                    if call_callback:
-                        light_blink_anims[i][5]()
-                    del light_blink_anims[i]
-                    break
+    """Cancel a blink or pulse animation."""
+    blinks.cancel(arr, call_callback)
+    fades.stop(arr)
 
 # Release any resources currently in use for the displays
 displayio.release_displays()
@@ -252,433 +228,505 @@ led.direction = Direction.OUTPUT
 led.value = True
 
 def set_status_text(str):
-    """Set the status text on the screen."""
-    global text_area_recommendation
-    global message_timer
-    global next_message
-    global current_status_text
-    # Split the string into lines of maximum length 14
-    final_str = ""
-    cur_len = 0
-    for s in str.split(" "):
-        if s == "":
-            continue
-        s_len = len(s)
-        if cur_len + s_len > 14:
-            final_str += "\n" + s
-            cur_len = s_len
+    """Set the status text on the screen. It's drawn by draw_text() at the end of the main loop pass."""
+    global status_text_pending
+    status_text_pending = str
+    state.message_timer = None
+    state.next_message = ''
+    state.current_status_text = str
+
+
+def set_ball_text(str):
+    """Set the ball number on the screen. It's drawn by draw_text() at the end of the main loop pass."""
+    global ball_text_pending
+    ball_text_pending = str
+
+
+def screen_region(group, x, y, width, height):
+    """Return the (x1, y1, x2, y2) screen region of a width x height box at (x, y) inside a group."""
+    scale = group.scale
+    return (
+        group.x + x * scale, group.y + y * scale,
+        group.x + (x + width) * scale, group.y + (y + height) * scale,
+    )
+
+
+def label_region(group, text_label):
+    """Return the screen region a label inside a group covers."""
+    x, y, width, height = text_label.bounding_box
+    return screen_region(group, text_label.x + x, text_label.y + y, width, height)
+
+
+def draw_text():
+    """Draw the ball number and status text set this pass, building each label the first time it's needed."""
+    global text_area_ball
+    global ball_text_pending
+    global status_text_pending
+    if ball_text_pending is not None:
+        if text_area_ball is None:
+            text_area_ball = label.Label(terminalio.FONT, text=ball_text_pending, color=0x727ACA)
+            text_group_ball.append(text_area_ball)  # Subgroup for text scaling
+        else:
+            # Where the old text was has to be redrawn too
+            display_refresh.mark(label_region(text_group_ball, text_area_ball))
+            text_area_ball.text = ball_text_pending
+        ball_text_pending = None
+        display_refresh.mark(label_region(text_group_ball, text_area_ball))
+    if status_text_pending is not None:
+        # Wrapped into lines of maximum length 14 and rendered once, then reused
+        final_str, text_area_recommendation = status_messages.get(status_text_pending)
+        status_text_pending = None
+        if len(text_group_recommendation) == 0:
+            text_group_recommendation.append(text_area_recommendation)  # Subgroup for text scaling
+        elif text_group_recommendation[0] is not text_area_recommendation:
+            # The old message's lines have to be redrawn too
+            display_refresh.mark(label_region(text_group_recommendation, text_group_recommendation[0]))
+            # A label can only be in one group at a time, so don't put the one showing back in its slot
+            text_group_recommendation[0] = text_area_recommendation
         else:
-            final_str += " " + s if cur_len > 0 else s
-            cur_len += s_len + 1
-    text_area_recommendation.text = final_str
-    message_timer = None
-    next_message = ''
-    print("Set status text: " + final_str)
-    current_status_text = str
+            return
+        display_refresh.mark(label_region(text_group_recommendation, text_area_recommendation))
+        print("Set status text: " + final_str)
+
 
+USE_BINARY_FRAMES = True  # Move boards that offer it (INI <board> BIN) over to binary frames
+BINARY_BAUDRATE = 57600  # Baud rate for a link once it's using binary frames
 
 def init_uart(tx_pin, rx_pin):
     """Initialize a UART bus."""
-    uart = busio.UART(tx=tx_pin, rx=rx_pin, baudrate=9600, timeout=0.5)
+    uart = busio.UART(tx=tx_pin, rx=rx_pin, baudrate=9600, timeout=0)
     return uart
 
-score_multiplier = 1
-redeploy_timer = None
-redeploy_ball = True
-REDEPLOY_DELAY = 6.0
+
+def link_upgrade(reader):
+    """Return the LinkUpgrade for the link a LineReader reads from."""
+    return sound_upgrade if reader is sound_reader else solenoid_upgrade
+
+REDEPLOY_DELAY = 6000  # ms
 
 def increase_score(add):
     """Update the score on the screen."""
-    global score
-    global score_multiplier
-    global text_area_score
-    global uart_sound
-    global game_mode
-    global redeploy_timer
-    global cur_hyperspace_trigger_timer
-    score += add * score_multiplier
-    # Reverse because RTL idk what I'm doing
-    text_area_score.text = ''.join(reversed(f"{score}"))
-    if game_mode == MODE_BALL_LAUNCH: # In case there was an IR sensor skipover
-        game_mode = MODE_PLAYING
-        redeploy_timer = time.monotonic() + REDEPLOY_DELAY
-        cur_hyperspace_trigger_timer = time.monotonic()
-        if mission_status == MISSION_STATUS_NONE:
+    global score_display
+    global sound_tx
+    state.score += add * state.score_multiplier
+    # Drawn once per loop by score_display.update(), however many times the score changes
+    score_display.value = state.score
+    if state.game_mode == MODE_BALL_LAUNCH: # In case there was an IR sensor skipover
+        state.game_mode = MODE_PLAYING
+        state.redeploy_timer = ticks_add(ticks_ms(), REDEPLOY_DELAY)
+        state.cur_hyperspace_trigger_timer = ticks_ms()
+        if state.mission_status == MISSION_STATUS_NONE:
             set_status_text(WAITING_MISSION_SELECT_TEXT)
             # Anim mission select buttons
-            blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1.0, False)
-        send_uart(uart_sound, 'PNT')
+            blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1000, False)
+        send_uart(sound_tx, 'PNT')
         # Turn off ball deploy light
         set_light(LIGHT_BALL_DEPLOY, False)
 
 
 def play_sound(sound_idx):
     """Send a sound play request on the UART bus."""
-    global uart_sound
-    snd_str = f"SND {sound_idx}\r\n"
-    uart_sound.write(bytearray(snd_str, "utf-8"))
+    global sound_tx
+    sound_tx.send(f"SND {sound_idx}")
 
 
-def send_uart(uart, str):
-    """Send a message out on a UART bus."""
+def send_uart(tx_queue, str):
+    """Queue a message to go out on a UART bus."""
     print(f'UART send: {str}')
-    write_str = f"{str}\r\n"
-    uart.write(bytearray(write_str, "utf-8"))
-
-sound_controller_initialized = False
-solenoid_driver_initialized = False
-drop_target_reset_sound_timer = None
-DROP_TARGET_RESET_SOUND_DELAY = 1.0
-HYPERSPACE_DECREASE_TIMER = 20  # Delay to decrease the hyperspace bonus
-cur_hyperspace_trigger_timer = 0
-ball_drained_timer = None
-extra_ball = False
-BALL_DRAIN_DELAY = 2.5
-ir_lights = [False, False, False]
-DEFAULT_HYPERSPACE_ARROW_ANIMATION = [False, False, False, False, False, False, True]
-hyperspace_arrow_animation = DEFAULT_HYPERSPACE_ARROW_ANIMATION
-hyperspace_arrow_time = None
-HYPERSPACE_ARROW_DELAY = 0.125
+    tx_queue.send(str)
+
+DROP_TARGET_RESET_SOUND_DELAY = 1000  # ms
+HYPERSPACE_DECREASE_TIMER = 20000  # Delay (ms) to decrease the hyperspace bonus
+BALL_DRAIN_DELAY = 2500  # ms
+HYPERSPACE_ARROW_DELAY = 125  # ms
 HYP_JACKPOT = 4
 HYP_EXTRA_BALL = 3
+# Score screen animations
+HYPERSPACE_STREAK_COLORS = 8  # Colors rotated through the streak band on a hyperspace launch
+HYPERSPACE_CYCLE_STEPS = 30
+HYPERSPACE_CYCLE_PERIOD = 60  # ms; each step redraws only the streak band
+BURST_PERIOD = 60  # ms
+RANK_CHEVRON_PERIOD = 150  # ms
+
+received_command = Command()
+
+
+def flash_status_text(str):
+    """Show a status message for MESSAGE_DELAY, then go back to the message it interrupted."""
+    next_message_to_set = state.current_status_text
+    if state.message_timer is not None:
+        next_message_to_set = state.next_message
+    set_status_text(str)
+    state.next_message = next_message_to_set
+    state.message_timer = ticks_add(ticks_ms(), MESSAGE_DELAY)
+
+
+def mission_targets(key):
+    """Return True if there's an active mission and hits of the key command count toward it."""
+    return state.mission_status == MISSION_STATUS_ACTIVE and MISSION_TARGETS[state.cur_mission] == key
+
+
+def handle_hyperspace(command, reader):
+    """HYP - Hyperspace launch."""
+    print(f"Hyperspace launched {state.cur_hyperspace_value + 1}")
+    hyperspace_cycle.start(HYPERSPACE_CYCLE_STEPS, HYPERSPACE_CYCLE_PERIOD, ticks_ms())
+    increase_score((state.cur_hyperspace_value + 1) * 200)
+    if state.mission_status != MISSION_STATUS_SELECTED:
+        if not mission_targets(CMD_HYP) or state.mission_hits_left != 1:
+            play_sound(HYPERSPACE_SOUND_LIST[state.cur_hyperspace_value])
+            # Blink ship lights
+            blink_light(LIGHT_SPACESHIP_LASERS, NUM_HYP_BLINKS[state.cur_hyperspace_value], 125, False)
+    state.cur_hyperspace_trigger_timer = ticks_ms()
+    if state.mission_status == MISSION_STATUS_SELECTED:
+        set_status_text('Mission Accepted')
+        state.mission_just_accepted = True
+        state.mission_status = MISSION_STATUS_ACTIVE
+        # Turn off hyperspace arrow animation
+        lamp_shows.stop(HYPERSPACE_ARROW_SHOW)
+        state.mission_hits_left = MISSION_HIT_COUNTS[state.cur_mission] + state.cur_rank
+        send_uart(sound_tx, 'ACC')
+        # Blink ship lights
+        blink_light(LIGHT_SPACESHIP_LASERS, 10, 125, False)
+        # Start blinking relevant mission light(s)
+        blink_light(LIGHT_MISSION_ARROW[state.cur_mission], sys.maxsize, 250, False)
+        # Update message after a delay
+        state.message_timer = ticks_add(ticks_ms(), MESSAGE_DELAY)
+        state.next_message = MISSION_STATUS_TEXT_PLURAL[state.cur_mission].format(state.mission_hits_left)
+        # Award extra ball if available
+        if state.cur_hyperspace_value == HYP_EXTRA_BALL:
+            state.extra_ball = True
+            # Turn on extra ball light
+            blink_light([LIGHT_EXTRA_BALL], 10, 125, True)
+    elif state.cur_hyperspace_value == HYP_JACKPOT:
+        burst_sprite.play(BURST_PERIOD, ticks_ms(), 3)
+        if not mission_targets(CMD_HYP):
+            flash_status_text('Jackpot Awarded')
+        increase_score(1500)
+    elif state.cur_hyperspace_value == HYP_EXTRA_BALL:
+        if not mission_targets(CMD_HYP):
+            flash_status_text('Extra Ball Awarded')
+        state.extra_ball = True
+        # Turn on extra ball light
+        blink_light([LIGHT_EXTRA_BALL], 10, 125, True)
+    elif not mission_targets(CMD_HYP):
+        flash_status_text('Hyperspace Bonus')
+    if state.cur_hyperspace_value + 1 < len(HYPERSPACE_SOUND_LIST):
+        # Cancel animations and turn on lights less than this one
+        cancel_anim(LIGHT_HYPERSPACE_BAR, False)
+        for i in range(len(LIGHT_HYPERSPACE_BAR)):
+            arr = LIGHT_HYPERSPACE_BAR[i]
+            if i < state.cur_hyperspace_value:
+                set_light(arr, True)
+            elif i > state.cur_hyperspace_value:
+                set_light(arr, False)
+        # Blink new hyperspace light and keep on
+        blink_light([LIGHT_HYPERSPACE_BAR[state.cur_hyperspace_value]], 10, 125, True)
+    else:
+        # Blink all hyperspace lights then turn off
+        cancel_anim(LIGHT_HYPERSPACE_BAR, False)
+        blink_light(LIGHT_HYPERSPACE_BAR, 10, 125, False)
+    state.cur_hyperspace_value = (state.cur_hyperspace_value + 1) % len(HYPERSPACE_SOUND_LIST)
+
+
+def handle_drain(command, reader):
+    """DRN - Ball drained."""
+    print("Ball drained!")
+    if state.game_mode != MODE_BALL_DRAIN:
+        state.game_mode = MODE_BALL_DRAIN
+        if not state.extra_ball and not state.redeploy_ball:
+            set_status_text(f"Crash Bonus {state.crash_bonus * state.score_multiplier}")
+            increase_score(state.crash_bonus)
+            state.cur_mission = None
+            state.mission_status = MISSION_STATUS_NONE
+            # Turn off hyperspace arrow animation
+            lamp_shows.stop(HYPERSPACE_ARROW_SHOW)
+            # Turn off any animations
+            blinks.clear()
+            fades.clear()
+            # Turn off mission lights
+            lamps.set_group(LAMPS_MISSION_SELECT, False)
+            # Turn off mission arrow lights
+            lamps.set_group(LAMPS_MISSION_ARROW, False)
+            # Turn off hyperspace lights
+            lamps.set_group(LAMPS_HYPERSPACE_BAR, False)
+            # Make sure re-entry lights are set correctly
+            for i in range(len(state.ir_lights)):
+                set_light(LIGHT_RE_ENTRY[i], state.ir_lights[i])
+            # Relay to sound board
+            send_uart(sound_tx, 'DRN')
+        elif state.redeploy_ball: # Stop redeploy blink animation if currently blinking
+            state.redeploy_timer = ticks_add(ticks_ms(), REDEPLOY_DELAY) # Don't allow redeploy blink after drain
+            cancel_anim([LIGHT_RE_DEPLOY], False)
+            set_light(LIGHT_RE_DEPLOY, True)
+        if state.extra_ball or state.redeploy_ball:
+            play_sound(LAUNCHED_NO_MISSION_SOUND)
+    # Wait for a bit before reloading
+    state.ball_drained_timer = ticks_ms()
+
+
+def handle_drop_target_reset(command, reader):
+    """DTR - Drop targets reset."""
+    print("Drop target reset!")
+    # Delay before playing sound
+    state.drop_target_reset_sound_timer = ticks_add(ticks_ms(), DROP_TARGET_RESET_SOUND_DELAY)
+    increase_score(1000)
+    state.crash_bonus += 1000
+    state.score_multiplier = min(state.score_multiplier + 1, 5)
+    flash_status_text(f"Score Multiplier {state.score_multiplier}x")
+    # Blink new multiplier light
+    blink_light([LIGHT_DT_MULTIPLIER[state.score_multiplier - 2]], 10, 110, True)
+
+
+def handle_mission_button(command, reader):
+    """BTN <n> - Mission select button n pressed."""
+    button_num = command.int_arg(0)
+    if state.mission_status == MISSION_STATUS_NONE or state.mission_status == MISSION_STATUS_SELECTED:
+        set_status_text(f"Launch to Perform {MISSION_NAMES[button_num]}")
+        state.cur_mission = button_num
+        state.mission_status = MISSION_STATUS_SELECTED
+        # Turn on hyperspace arrow animation if not on already
+        if not HYPERSPACE_ARROW_SHOW.playing:
+            lamp_shows.start(HYPERSPACE_ARROW_SHOW, ticks_ms())
+    increase_score(50)
+    state.crash_bonus += 25
+    # Blink new mission light
+    cancel_anim(LIGHT_MISSION_SELECT)
+    blink_light([LIGHT_MISSION_SELECT[button_num]], 10, 125, True)
+    # Turn off other mission lights
+    for i in range(len(LIGHT_MISSION_SELECT)):
+        if i != button_num:
+            set_light(LIGHT_MISSION_SELECT[i], False)
+
+
+def handle_initialized(command, reader):
+    """INI <board> [BIN] - A board finished starting up."""
+    if command.arg_equals(0, b'solenoidDriver'):
+        print("Solenoid driver initialized")
+        state.solenoid_driver_initialized = True
+    elif command.arg_equals(0, b'soundController'):
+        print("Sound controller initialized")
+        state.sound_controller_initialized = True
+    if USE_BINARY_FRAMES and command.arg_equals(1, b'BIN'):
+        print("Offering binary frames")
+        link_upgrade(reader).offer(BINARY_BAUDRATE, ticks_ms())
+    if state.solenoid_driver_initialized and state.sound_controller_initialized:
+        print("All boards initialized")
+        # Stop animation
+        for aw_device in range(len(aw_devices)):
+            for pin in range(len(pins)):
+                set_light([aw_device, pin], False)
+        # Turn on relevant lamps
+        for i in range(len(LIGHT_DROP_TARGET)):
+            set_light(LIGHT_DROP_TARGET[i], True)
+        # Reload the ball
+        send_uart(solenoid_tx, "RLD")
+        state.game_mode = MODE_BALL_LAUNCH
+        state.crash_bonus = DEFAULT_CRASH_BONUS
+        set_status_text(WAITING_BALL_LAUNCH_TEXT)
+        # Turn on ball deploy light
+        set_light(LIGHT_BALL_DEPLOY, True)
+        set_light(LIGHT_RE_DEPLOY, True)
+
+
+def handle_calibrated(command, reader):
+    """CAL - Pop bumpers calibrated."""
+    print("Pop bumpers calibrated")
+
+
+def handle_re_entry(command, reader):
+    """IR <n> - Re-entry IR sensor n triggered."""
+    print("IR sensor triggered")
+    ir_light = command.int_arg(0)
+    increase_score(ir_scores[ir_light])
+    if state.game_mode != MODE_BALL_LAUNCH:
+        state.crash_bonus += 100
+    else:
+        state.redeploy_timer = ticks_add(ticks_ms(), REDEPLOY_DELAY)
+        state.cur_hyperspace_trigger_timer = ticks_ms()
+        # Anim mission select buttons
+        blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1000, False)
+    state.game_mode = MODE_PLAYING
+    set_status_text(WAITING_MISSION_SELECT_TEXT)
+    # Turn off ball deploy light
+    set_light(LIGHT_BALL_DEPLOY, False)
+    # Turn on new IR light
+    set_light(LIGHT_RE_ENTRY[ir_light], True)
+    ir_lights = state.ir_lights
+    prev_ir_light_val = ir_lights[ir_light]
+    ir_lights[ir_light] = True
+    # Bonus if all three re-entry lights are lit
+    if not prev_ir_light_val and all(ir_lights):
+        play_sound(BONUS_AWARDED_SOUND)
+        increase_score(1000)
+        state.crash_bonus += 200
+        # Set bonus awarded text
+        flash_status_text("Bonus Awarded")
+        # Blink off all re-entry lights
+        for i in range(len(LIGHT_RE_ENTRY)):
+            ir_lights[i] = False
+        def reset_ir_lights():
+            for j in range(len(LIGHT_RE_ENTRY)):
+                set_light(LIGHT_RE_ENTRY[j], state.ir_lights[j])
+        blink_light(LIGHT_RE_ENTRY, 20, 125, False, on_complete=reset_ir_lights)
+
+
+def handle_drop_target(command, reader):
+    """DT <n> - Drop target n knocked down."""
+    print("Drop target triggered")
+    dt_pin = command.int_arg(0)
+    set_light(LIGHT_DROP_TARGET[dt_pin], False)
+    increase_score(1000)
+    play_sound(SECRET_MISSION_SELECTED_SOUND)
+
+
+def handle_pop_bumper(command, reader):
+    """PB <n> - Pop bumper n hit."""
+    print("Pop Bumper Triggered")
+    increase_score(200)
+
+
+def handle_slingshot(command, reader):
+    """SLG <L/R> - Slingshot hit."""
+    print("Slingshot Triggered")
+    increase_score(100)
+
+
+def handle_left_flipper_up(command, reader):
+    """FLU - Left flipper up."""
+    print("Left flipper Up")
+    set_light(LIGHT_LEFT_FLIPPER, True)
+    # Cycle re-entry lights left
+    ir_lights = state.ir_lights
+    state.ir_lights = ir_lights = ir_lights[1:] + [ir_lights[0]]
+    for i in range(len(LIGHT_RE_ENTRY)):
+        set_light(LIGHT_RE_ENTRY[i], ir_lights[i])
 
-def readline(uart_bus):
-    """Read a line from the UART bus and print it to console."""
-    global NUM_HYP_BLINKS
-    global HYPERSPACE_SOUND_LIST
-    global cur_hyperspace_value
-    global uart_sound
-    global solenoid_driver_initialized
-    global sound_controller_initialized
-    global drop_target_reset_sound_timer
-    global cur_hyperspace_trigger_timer
-    global ball_drained_timer
-    global ir_scores
-    global pins
-    global aw_devices
-    global game_mode
-    global score_multiplier
-    global cur_mission
-    global mission_hits_left
-    global mission_status
-    global crash_bonus
-    global num_missions_completed
-    global cur_rank
-    global message_timer
-    global next_message
-    global light_blink_anims
-    global extra_ball
-    global redeploy_ball
-    global redeploy_timer
-    global ir_lights
-    global hyperspace_arrow_animation
-    global hyperspace_arrow_time
-    data = uart_bus.readline()
-    mission_accepted_this_frame = False
-    if data is not None:
-        # convert bytearray to string
-        data_string = ''.join([chr(b) for b in data])
-        # Parse command
-        command_list = data_string.split()
-        if len(command_list) > 0:
-            command = command_list[0]
-            if command == 'HYP':
-                # Hyperspace
-                print(f"Hyperspace launched {cur_hyperspace_value + 1}")
-                increase_score((cur_hyperspace_value + 1) * 200)
-                if mission_status != MISSION_STATUS_SELECTED:
-                    if mission_status != MISSION_STATUS_ACTIVE or command != MISSION_TARGETS[cur_mission] or mission_hits_left != 1:
-                        play_sound(HYPERSPACE_SOUND_LIST[cur_hyperspace_value])
-                        # Blink ship lights
-                        blink_light(LIGHT_SPACESHIP_LASERS, NUM_HYP_BLINKS[cur_hyperspace_value], 0.125, False)
-                cur_hyperspace_trigger_timer = time.monotonic()
-                if mission_status == MISSION_STATUS_SELECTED:
-                    set_status_text('Mission Accepted')
-                    mission_accepted_this_frame = True
-                    mission_status = MISSION_STATUS_ACTIVE
-                    # Turn off hyperspace arrow animation
-                    hyperspace_arrow_time = None
-                    for arr in LIGHT_HYPERSPACE_ARROW:
-                        set_light(arr, False)
-                    mission_hits_left = MISSION_HIT_COUNTS[cur_mission] + cur_rank
-                    send_uart(uart_sound, 'ACC')
-                    # Blink ship lights
-                    blink_light(LIGHT_SPACESHIP_LASERS, 10, 0.125, False)
-                    # Start blinking relevant mission light(s)
-                    blink_light(LIGHT_MISSION_ARROW[cur_mission], sys.maxsize, 0.25, False)
-                    # Update message after a delay
-                    message_timer = MESSAGE_DELAY + time.monotonic()
-                    next_message = MISSION_STATUS_TEXT_PLURAL[cur_mission].format(mission_hits_left)
-                    # Award extra ball if available
-                    if cur_hyperspace_value == HYP_EXTRA_BALL:
-                        extra_ball = True
-                        # Turn on extra ball light
-                        blink_light([LIGHT_EXTRA_BALL], 10, 0.125, True)
-                elif cur_hyperspace_value == HYP_JACKPOT:
-                    if mission_status != MISSION_STATUS_ACTIVE or command != MISSION_TARGETS[cur_mission]:
-                        next_message_to_set = current_status_text
-                        if message_timer:
-                            next_message_to_set = next_message
-                        set_status_text('Jackpot Awarded')
-                        next_message = next_message_to_set
-                        message_timer = MESSAGE_DELAY + time.monotonic()
-                    increase_score(1500)
-                elif cur_hyperspace_value == HYP_EXTRA_BALL:
-                    if mission_status != MISSION_STATUS_ACTIVE or command != MISSION_TARGETS[cur_mission]:
-                        next_message_to_set = current_status_text
-                        if message_timer:
-                            next_message_to_set = next_message
-                        set_status_text('Extra Ball Awarded')
-                        next_message = next_message_to_set
-                        message_timer = MESSAGE_DELAY + time.monotonic()
-                    extra_ball = True
-                    # Turn on extra ball light
-                    blink_light([LIGHT_EXTRA_BALL], 10, 0.125, True)
-                elif mission_status != MISSION_STATUS_ACTIVE or command != MISSION_TARGETS[cur_mission]:
-                    next_message_to_set = current_status_text
-                    if message_timer:
-                        next_message_to_set = next_message
-                    set_status_text('Hyperspace Bonus')
-                    next_message = next_message_to_set
-                    message_timer = MESSAGE_DELAY + time.monotonic()
-                if cur_hyperspace_value + 1 < len(HYPERSPACE_SOUND_LIST):
-                    # Cancel animations and turn on lights less than this one
-                    cancel_anim(LIGHT_HYPERSPACE_BAR, False)
-                    for i in range(len(LIGHT_HYPERSPACE_BAR)):
-                        arr = LIGHT_HYPERSPACE_BAR[i]
-                        if i < cur_hyperspace_value:
-                            set_light(arr, True)
-                        elif i > cur_hyperspace_value:
-                            set_light(arr, False)
-                    # Blink new hyperspace light and keep on
-                    blink_light([LIGHT_HYPERSPACE_BAR[cur_hyperspace_value]], 10, 0.125, True)
-                else:
-                    # Blink all hyperspace lights then turn off
-                    cancel_anim(LIGHT_HYPERSPACE_BAR, False)
-                    blink_light(LIGHT_HYPERSPACE_BAR, 10, 0.125, False)
-                cur_hyperspace_value = (cur_hyperspace_value + 1) % len(HYPERSPACE_SOUND_LIST)
-            elif command == 'DRN':
-                # Ball drained
-                print("Ball drained!")
-                if game_mode != MODE_BALL_DRAIN:
-                    game_mode = MODE_BALL_DRAIN
-                    if not extra_ball and not redeploy_ball:
-                        set_status_text(f"Crash Bonus {crash_bonus * score_multiplier}")
-                        increase_score(crash_bonus)
-                        cur_mission = None
-                        mission_status = MISSION_STATUS_NONE
-                        # Turn off hyperspace arrow animation
-                        hyperspace_arrow_time = None
-                        for arr in LIGHT_HYPERSPACE_ARROW:
-                            set_light(arr, False)
-                        # Turn off any animations
-                        light_blink_anims = []
-                        # Turn off mission lights
-                        for arr in LIGHT_MISSION_SELECT:
-                            set_light(arr, False)
-                        # Turn off mission arrow lights
-                        for arr in LIGHT_MISSION_ARROW:
-                            for arr2 in arr:
-                                set_light(arr2, False)
-                        # Turn off hyperspace lights
-                        for arr in LIGHT_HYPERSPACE_BAR:
-                            set_light(arr, False)
-                        # Make sure re-entry lights are set correctly
-                        for i in range(len(ir_lights)):
-                            set_light(LIGHT_RE_ENTRY[i], ir_lights[i])
-                        # Relay to sound board
-                        send_uart(uart_sound, command)
-                    elif redeploy_ball: # Stop redeploy blink animation if currently blinking
-                        redeploy_timer = time.monotonic() + REDEPLOY_DELAY # Don't allow redeploy blink after drain
-                        cancel_anim([LIGHT_RE_DEPLOY], False)
-                        set_light(LIGHT_RE_DEPLOY, True)
-                    if extra_ball or redeploy_ball:
-                        play_sound(LAUNCHED_NO_MISSION_SOUND)
-                # Wait for a bit before reloading
-                ball_drained_timer = time.monotonic()
-            elif command == 'DTR':
-                # Drop target reset
-                print("Drop target reset!")
-                # Delay before playing sound
-                drop_target_reset_sound_timer = time.monotonic() + DROP_TARGET_RESET_SOUND_DELAY
-                increase_score(1000)
-                crash_bonus += 1000
-                score_multiplier = min(score_multiplier + 1, 5)
-                next_message_to_set = current_status_text
-                if message_timer:
-                    next_message_to_set = next_message
-                set_status_text(f"Score Multiplier {score_multiplier}x")
-                message_timer = MESSAGE_DELAY + time.monotonic()
-                # Blink new multiplier light
-                blink_light([LIGHT_DT_MULTIPLIER[score_multiplier - 2]], 10, 0.11, True)
-                next_message = next_message_to_set
-            elif command == 'BTN':
-                button_num = int(command_list[1])
-                if mission_status == MISSION_STATUS_NONE or mission_status == MISSION_STATUS_SELECTED:
-                    set_status_text(f"Launch to Perform {MISSION_NAMES[button_num]}")
-                    cur_mission = button_num
-                    mission_status = MISSION_STATUS_SELECTED
-                    # Turn on hyperspace arrow animation if not on already
-                    if not hyperspace_arrow_time:
-                        hyperspace_arrow_animation = DEFAULT_HYPERSPACE_ARROW_ANIMATION
-                        hyperspace_arrow_time = time.monotonic()
-                increase_score(50)
-                crash_bonus += 25
-                # Blink new mission light
-                cancel_anim(LIGHT_MISSION_SELECT)
-                blink_light([LIGHT_MISSION_SELECT[button_num]], 10, 0.125, True)
-                # Turn off other mission lights
-                for i in range(len(LIGHT_MISSION_SELECT)):
-                    if i != button_num:
-                        set_light(LIGHT_MISSION_SELECT[i], False)
-            elif command == 'INI':
-                board_initialized = command_list[1]
-                if board_initialized == 'solenoidDriver':
-                    print("Solenoid driver initialized")
-                    solenoid_driver_initialized = True
-                elif board_initialized == 'soundController':
-                    print("Sound controller initialized")
-                    sound_controller_initialized = True
-                if solenoid_driver_initialized and sound_controller_initialized:
-                    print("All boards initialized")
-                    # Stop animation
-                    for aw_device in range(len(aw_devices)):
-                        for pin in range(len(pins)):
-                            set_light([aw_device, pin], False)
-                    # Turn on relevant lamps
-                    for i in range(len(LIGHT_DROP_TARGET)):
-                        set_light(LIGHT_DROP_TARGET[i], True)
-                    # Reload the ball
-                    send_uart(uart_solenoid, "RLD")
-                    game_mode = MODE_BALL_LAUNCH
-                    crash_bonus = DEFAULT_CRASH_BONUS
-                    set_status_text(WAITING_BALL_LAUNCH_TEXT)
-                    # Turn on ball deploy light
-                    set_light(LIGHT_BALL_DEPLOY, True)
-                    set_light(LIGHT_RE_DEPLOY, True)
-            elif command == 'IR':
-                print("IR sensor triggered")
-                ir_light = int(command_list[1])
-                increase_score(ir_scores[ir_light])
-                if game_mode != MODE_BALL_LAUNCH:
-                    crash_bonus += 100
-                else:
-                    redeploy_timer = time.monotonic() + REDEPLOY_DELAY
-                    cur_hyperspace_trigger_timer = time.monotonic()
-                    # Anim mission select buttons
-                    blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1.0, False)
-                game_mode = MODE_PLAYING
-                set_status_text(WAITING_MISSION_SELECT_TEXT)
-                # Turn off ball deploy light
-                set_light(LIGHT_BALL_DEPLOY, False)
-                # Turn on new IR light
-                set_light(LIGHT_RE_ENTRY[ir_light], True)
-                prev_ir_light_val = ir_lights[ir_light]
-                ir_lights[ir_light] = True
-                # Bonus if all three re-entry lights are lit
-                if not prev_ir_light_val and all(ir_lights):
-                    play_sound(BONUS_AWARDED_SOUND)
-                    increase_score(1000)
-                    crash_bonus += 200
-                    # Set bonus awarded text
-                    next_message_to_set = current_status_text
-                    if message_timer:
-                        next_message_to_set = next_message
-                    set_status_text("Bonus Awarded")
-                    message_timer = MESSAGE_DELAY + time.monotonic()
-                    next_message = next_message_to_set
-                    # Blink off all re-entry lights
-                    for i in range(len(LIGHT_RE_ENTRY)):
-                        ir_lights[i] = False
-                    def reset_ir_lights():
-                        global ir_lights
-                        for j in range(len(LIGHT_RE_ENTRY)):
-                            set_light(LIGHT_RE_ENTRY[j], ir_lights[j])
-                    blink_light(LIGHT_RE_ENTRY, 20, 0.125, False, on_complete=reset_ir_lights)
-            elif command == 'DT':
-                print("Drop target triggered")
-                dt_pin = int(command_list[1])
-                set_light(LIGHT_DROP_TARGET[dt_pin], False)
-                increase_score(1000)
-                play_sound(SECRET_MISSION_SELECTED_SOUND)
-            elif command == 'PB':
-                print("Pop Bumper Triggered")
-                increase_score(200)
-            elif command == 'SLG':
-                print("Slingshot Triggered")
-                increase_score(100)
-            elif command == 'FLU':
-                print("Left flipper Up")
-                set_light(LIGHT_LEFT_FLIPPER, True)
-                # Cycle re-entry lights left
-                ir_lights = ir_lights[1:] + [ir_lights[0]]
-                for i in range(len(LIGHT_RE_ENTRY)):
-                    set_light(LIGHT_RE_ENTRY[i], ir_lights[i])
-            elif command == 'FLD':
-                print("Left flipper Down")
-                set_light(LIGHT_LEFT_FLIPPER, False)
-            elif command == 'FRU':
-                print("Right flipper Up")
-                set_light(LIGHT_RIGHT_FLIPPER, True)
-                # Cycle re-entry lights right
-                ir_lights = [ir_lights[-1]] + ir_lights[:-1]
-                for i in range(len(LIGHT_RE_ENTRY)):
-                    set_light(LIGHT_RE_ENTRY[i], ir_lights[i])
-            elif command == 'FRD':
-                print("Right flipper Down")
-                set_light(LIGHT_RIGHT_FLIPPER, False)
-            else:
-                print(data_string, end="")
-            
-            # Test for mission update
-            if mission_status == MISSION_STATUS_ACTIVE and command == MISSION_TARGETS[cur_mission] and not mission_accepted_this_frame:
-                mission_hits_left -= 1
-                if mission_hits_left == 0:
-                    # Turn off mission arrow lights
-                    for light in LIGHT_MISSION_ARROW:
-                        cancel_anim(light)
-                        for arr in light:
-                            set_light(arr, False)
-                    mission_status = MISSION_STATUS_NONE
-                    increase_score(MISSION_REWARDS[cur_mission] * cur_rank)
-                    num_missions_completed += 1
-                    cur_mission = None
-                    cancel_anim(LIGHT_MISSION_SELECT)
-                    for light in LIGHT_MISSION_SELECT:
-                        set_light(light, False)
-                    if num_missions_completed == MISSIONS_PER_RANK:
-                        crash_bonus += 1000 * cur_rank
-                        num_missions_completed = 0
-                        cur_rank += 1
-                        cur_rank = min(cur_rank, len(RANK_NAMES) - 1)
-                        set_status_text(f"Promotion to {RANK_NAMES[cur_rank]}")
-                        next_message = WAITING_MISSION_SELECT_TEXT
-                        # Anim mission select buttons
-                        blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1.0, False)
-                        message_timer = MESSAGE_DELAY_LONGER + time.monotonic()
-                        send_uart(uart_sound, f'RNK {cur_rank}')
-                        if command == 'HYP':
-                            # Blink ship lights
-                            blink_light(LIGHT_SPACESHIP_LASERS, 14, 0.125, False)
-                    else:
-                        set_status_text("Mission Completed")
-                        next_message = WAITING_MISSION_SELECT_TEXT
-                        # Anim mission select buttons
-                        blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1.0, False)
-                        message_timer = MESSAGE_DELAY_LONGER + time.monotonic()
-                        crash_bonus += 550 * cur_rank
-                        send_uart(uart_sound, f'MSN {num_missions_completed}')
-                        if command == 'HYP':
-                            # Blink ship lights
-                            blink_light(LIGHT_SPACESHIP_LASERS, 16, 0.125, False)
-                elif mission_hits_left == 1:
-                    set_status_text(MISSION_STATUS_TEXT_SINGULAR[cur_mission])
-                else:
-                    set_status_text(MISSION_STATUS_TEXT_PLURAL[cur_mission].format(mission_hits_left))
+
+def handle_left_flipper_down(command, reader):
+    """FLD - Left flipper down."""
+    print("Left flipper Down")
+    set_light(LIGHT_LEFT_FLIPPER, False)
+
+
+def handle_right_flipper_up(command, reader):
+    """FRU - Right flipper up."""
+    print("Right flipper Up")
+    set_light(LIGHT_RIGHT_FLIPPER, True)
+    # Cycle re-entry lights right
+    ir_lights = state.ir_lights
+    state.ir_lights = ir_lights = [ir_lights[-1]] + ir_lights[:-1]
+    for i in range(len(LIGHT_RE_ENTRY)):
+        set_light(LIGHT_RE_ENTRY[i], ir_lights[i])
+
+
+def handle_right_flipper_down(command, reader):
+    """FRD - Right flipper down."""
+    print("Right flipper Down")
+    set_light(LIGHT_RIGHT_FLIPPER, False)
+
+
+def handle_stats_line(command, reader):
+    """STR <text> - A line of another board's profiling stats."""
+    board_name = "soundController" if reader is sound_reader else "solenoidDriver"
+    print(f"{board_name} {command.text()}", end="")
+
+
+def update_mission(command):
+    """Count a hit toward the active mission. Runs after each command in MISSION_TARGETS."""
+    # The launch that accepts a hyperspace mission doesn't also count toward it
+    if state.mission_just_accepted or not mission_targets(command.key):
+        return
+    state.mission_hits_left -= 1
+    if state.mission_hits_left == 0:
+        # Turn off mission arrow lights
+        for light in LIGHT_MISSION_ARROW:
+            cancel_anim(light)
+        lamps.set_group(LAMPS_MISSION_ARROW, False)
+        state.mission_status = MISSION_STATUS_NONE
+        increase_score(MISSION_REWARDS[state.cur_mission] * state.cur_rank)
+        state.num_missions_completed += 1
+        state.cur_mission = None
+        cancel_anim(LIGHT_MISSION_SELECT)
+        lamps.set_group(LAMPS_MISSION_SELECT, False)
+        if state.num_missions_completed == MISSIONS_PER_RANK:
+            state.crash_bonus += 1000 * state.cur_rank
+            state.num_missions_completed = 0
+            state.cur_rank += 1
+            state.cur_rank = min(state.cur_rank, len(RANK_NAMES) - 1)
+            set_status_text(f"Promotion to {RANK_NAMES[state.cur_rank]}")
+            state.next_message = WAITING_MISSION_SELECT_TEXT
+            # Anim mission select buttons
+            blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1000, False)
+            state.message_timer = ticks_add(ticks_ms(), MESSAGE_DELAY_LONGER)
+            send_uart(sound_tx, f'RNK {state.cur_rank}')
+            rank_sprite.play(RANK_CHEVRON_PERIOD, ticks_ms(), 2)
+            if command.key == CMD_HYP:
+                # Blink ship lights
+                blink_light(LIGHT_SPACESHIP_LASERS, 14, 125, False)
+        else:
+            set_status_text("Mission Completed")
+            state.next_message = WAITING_MISSION_SELECT_TEXT
+            # Anim mission select buttons
+            blink_light(LIGHT_MISSION_SELECT, sys.maxsize, 1000, False)
+            state.message_timer = ticks_add(ticks_ms(), MESSAGE_DELAY_LONGER)
+            state.crash_bonus += 550 * state.cur_rank
+            send_uart(sound_tx, f'MSN {state.num_missions_completed}')
+            burst_sprite.play(BURST_PERIOD, ticks_ms())
+            if command.key == CMD_HYP:
+                # Blink ship lights
+                blink_light(LIGHT_SPACESHIP_LASERS, 16, 125, False)
+    elif state.mission_hits_left == 1:
+        set_status_text(MISSION_STATUS_TEXT_SINGULAR[state.cur_mission])
+    else:
+        set_status_text(MISSION_STATUS_TEXT_PLURAL[state.cur_mission].format(state.mission_hits_left))
+
+
+def handle_binary_accepted(command, reader):
+    """BOK <baud> - A board accepted switching its link to binary frames."""
+    print(f"Binary frames accepted at {command.int_arg(0)} baud")
+    link_upgrade(reader).confirmed(command, ticks_ms())
+
+
+commands = CommandTable({
+    b"HYP": handle_hyperspace,
+    b"DRN": handle_drain,
+    b"DTR": handle_drop_target_reset,
+    b"BTN": handle_mission_button,
+    b"INI": handle_initialized,
+    b"BOK": handle_binary_accepted,
+    b"CAL": handle_calibrated,
+    b"IR": handle_re_entry,
+    b"DT": handle_drop_target,
+    b"PB": handle_pop_bumper,
+    b"SLG": handle_slingshot,
+    b"FLU": handle_left_flipper_up,
+    b"FLD": handle_left_flipper_down,
+    b"FRU": handle_right_flipper_up,
+    b"FRD": handle_right_flipper_down,
+    b"STR": handle_stats_line,
+})
+# Run after the handler, only for the commands that need them
+command_post_hooks = {}
+for key in MISSION_TARGETS:
+    command_post_hooks[key] = update_mission
+
+
+def readline(reader):
+    """Run the next complete line from a UART's LineReader. Returns False once there are none left."""
+    length = reader.readline()
+    if length and received_command.parse(reader.line, length):
+        if commands.dispatch(received_command, reader):
+            hook = command_post_hooks.get(received_command.key)
+            if hook is not None:
+                hook(received_command)
+        else:
+            print(received_command.text(), end="")
+        state.mission_just_accepted = False
+    return length > 0
 
 def rand_ship_time():
     """Return a random time for the servo to update next."""
-    return time.monotonic() + random.uniform(10, 30)
+    return ticks_add(ticks_ms(), random.randint(10000, 30000))
 
 
 def rand_ship_angle(cur_angle):
@@ -688,6 +736,20 @@ def rand_ship_angle(cur_angle):
     return random.randint(min_angle, max_angle)
 
 
+# Start the UARTs before the display, so what the other boards send while
+# the screen comes up waits in the receive buffers
+# UART bus for sound controller
+uart_sound = init_uart(board.GP0, board.GP1)
+# UART bus for solenoid controller
+uart_solenoid = init_uart(board.GP4, board.GP5)
+sound_reader = LineReader(uart_sound)
+solenoid_reader = LineReader(uart_solenoid)
+# Drain and game over sounds go out ahead of queued sound effects
+sound_tx = TxQueue(uart_sound, critical=(CMD_DRN, CMD_GOV))
+solenoid_tx = TxQueue(uart_solenoid)
+sound_upgrade = LinkUpgrade(sound_reader, sound_tx)
+solenoid_upgrade = LinkUpgrade(solenoid_reader, solenoid_tx)
+
 # Setup I2C for the I/O expander
 i2c = busio.I2C(scl=board.GP21, sda=board.GP20)
 # First one has neither jumper bridged
@@ -697,6 +759,12 @@ print("Found AW9523 1")
 aw2 = adafruit_aw9523.AW9523(i2c, address=0x59)
 print("Found AW9523 2")
 aw_devices = [aw1, aw2]
+lamps = LampFramebuffer(aw_devices)
+lamp_shows = LampSequencer(lamps)
+blinks = BlinkEngine(lamps)
+fades = FadeEngine(lamps)
+# One arrow at a time, bottom to top, then dark for four steps
+HYPERSPACE_ARROW_SHOW = chase(LAMPS_HYPERSPACE_ARROW, HYPERSPACE_ARROW_DELAY, gap=4)
 
 # Set all pins to outputs and LED (const current) mode
 aw1.LED_modes = 0xFFFF
@@ -716,63 +784,84 @@ display_bus = displayio.FourWire(spi, command=tft_dc, chip_select=tft_cs, reset=
 # display = ST7789(display_bus, width=240, height=320,rotation=180, backlight_pin=tft_backlight)
 # If using bigger display:
 display = adafruit_ili9341.ILI9341(display_bus, width=240, height=320, rotation=270, backlight_pin=tft_backlight, backlight_on_high=True, brightness=1.0)
+# Refreshed from the main loop when something changes, rather than whenever displayio decides to
+DISPLAY_MAX_FPS = 30
+display_refresh = RefreshScheduler(display, DISPLAY_MAX_FPS)
 
-# Load score background
-bitmap, palette = adafruit_imageload.load(
-    "/images/score_display_vert.bmp",
-    bitmap=displayio.Bitmap,
-    palette=displayio.Palette,
-)
+# Show the score background straight from flash. OnDiskBitmap reads pixels as
+# they are drawn, so the background takes no RAM for pixels and shows up
+# without decoding the file first. A new background must be an uncompressed
+# 8-bit indexed BMP too, with the transparent color at index 0.
+background = displayio.OnDiskBitmap("/images/score_display_vert.bmp")
+palette = background.pixel_shader
 # make the color at 0 index transparent.
 palette.make_transparent(0)
 
 # Make the display context
-bitmap = displayio.TileGrid(bitmap, pixel_shader=palette, x=0, y=0)
+bitmap = displayio.TileGrid(background, pixel_shader=palette, x=0, y=0)
 group = displayio.Group()
 group.append(bitmap)
 display.show(group)
+display.refresh()
+boot_first_frame_ms = ticks_diff(ticks_ms(), boot_start)
 
-# Draw the score label
-text_group = displayio.Group(scale=3, x=210, y=193)
-text = "0"
-text_area_score = label.Label(terminalio.FONT, text=text, color=0x727ACA, label_direction="RTL")
-text_group.append(text_area_score)  # Subgroup for text scaling
+# Draw the score
+SCORE_DIGITS = 8  # Scores past 99,999,999 stay at 99,999,999
+text_group = displayio.Group(scale=3, x=210, y=193)  # x is where the score ends, it grows to the left
+score_display = DigitDisplay(terminalio.FONT, 0x727ACA, SCORE_DIGITS)
+text_group.append(score_display.tile_grid)  # Subgroup for text scaling
 group.append(text_group)
+score_tiles = score_display.tile_grid
+SCORE_REGION = screen_region(text_group, score_tiles.x, score_tiles.y, score_display.width, score_display.height)
 
 # Draw the ball label
+# The labels are built by draw_text() on the first pass of the main loop
 text_group_ball = displayio.Group(scale=2, x=187, y=150)
-text = "1"
-text_area_ball = label.Label(terminalio.FONT, text=text, color=0x727ACA)
-text_group_ball.append(text_area_ball)  # Subgroup for text scaling
+text_area_ball = None
+set_ball_text("1")
 group.append(text_group_ball)
 
 # Draw the recommendation text
+STATUS_MESSAGE_CACHE_BYTES = 8192  # RAM for rendered status messages
+status_messages = MessageCache(terminalio.FONT, 0x727ACA, STATUS_MESSAGE_CACHE_BYTES)
 text_group_recommendation = displayio.Group(scale=2, x=31, y=232)
-text = "Starting Up..."
-text_area_recommendation = label.Label(terminalio.FONT, text=text, color=0x727ACA, line_spacing=0.9)
-text_group_recommendation.append(text_area_recommendation)  # Subgroup for text scaling
+set_status_text("Starting Up...")
 group.append(text_group_recommendation)
 
+# Animations drawn over the score screen. A small band of streaks has its own
+# palette cycled in place, and sprites are small sheets stepped by tile index.
+screen_fx = AnimationLayer(display_refresh)
+# Streaks rushing across the screen, for hyperspace launches
+hyperspace_palette = gradient_palette(0x101850, 0xC0D0FF, HYPERSPACE_STREAK_COLORS)
+hyperspace_group = displayio.Group(scale=2, x=24, y=96)
+hyperspace_group.append(displayio.TileGrid(streak_sheet(96, 16, HYPERSPACE_STREAK_COLORS), pixel_shader=hyperspace_palette))
+hyperspace_group.hidden = True
+HYPERSPACE_REGION = screen_region(hyperspace_group, 0, 0, 96, 16)
+hyperspace_cycle = screen_fx.add(
+    PaletteCycle(hyperspace_palette, 1, HYPERSPACE_STREAK_COLORS, hyperspace_group), HYPERSPACE_REGION
+)
+group.append(hyperspace_group)
+# Ring bursting out from the middle, for jackpots and completed missions
+BURST_FRAMES = ((1,), (2,), (3,), (4,), (5,), (6,))
+burst_sprite = Sprite(burst_sheet(16, len(BURST_FRAMES)), sprite_palette(0xFFE070), 16, 16, BURST_FRAMES, scale=2, x=150, y=140)
+screen_fx.add(burst_sprite, burst_sprite.region)
+group.append(burst_sprite.group)
+# Three chevrons lighting up in turn, for rank promotions
+RANK_CHEVRON_FRAMES = ((1, 0, 0), (1, 1, 0), (1, 1, 1), (0, 0, 0), (1, 1, 1), (0, 0, 0))
+rank_sprite = Sprite(chevron_sheet(8), sprite_palette(0x727ACA), 8, 8, RANK_CHEVRON_FRAMES, width=3, scale=2, x=100, y=148)
+screen_fx.add(rank_sprite, rank_sprite.region)
+group.append(rank_sprite.group)
+
 # New game button
-new_game_button = DigitalInOut(board.GP7)
-new_game_button.direction = Direction.INPUT
-new_game_button.pull = Pull.UP
-new_game_button_debouncer = Debouncer(new_game_button)
+new_game_button = Switches([board.GP7], value_when_pressed=False)
 
 # Ship servo
 servo_pwm = pwmio.PWMOut(board.GP16, frequency=50)
 ship_servo = servo.Servo(servo_pwm, min_pulse=500, max_pulse=2500)
 cur_ship_angle = ship_servo.angle = 90
 rand_servo_time = rand_ship_time()
-servo_shutoff_time = time.monotonic() + SERVO_TIMEOUT
+servo_shutoff_time = ticks_add(ticks_ms(), SERVO_TIMEOUT)
 
-# UART bus for sound controller
-uart_sound = init_uart(board.GP0, board.GP1)
-# UART bus for solenoid controller
-uart_solenoid = init_uart(board.GP4, board.GP5)
-
-score = 0
-ball = 1
 n = 0
 ir_scores = [100, 500, 200]  # Score values for each IR sensor
 NUM_PINS = len(pins)
@@ -792,78 +881,133 @@ NUM_HYP_BLINKS = [
     10,
     18
 ]
-cur_hyperspace_value = 0
-gameover_anim_timer = time.monotonic()
-GAMEOVER_ANIM_LED_BLINK_TIME = 0.75
+gameover_anim_timer = ticks_ms()
+GAMEOVER_ANIM_LED_BLINK_TIME = 750  # ms
 NUM_BALLS = 3
+# Main loop profiling. Type STA (or STA 1 / STA 0 to turn profiling on or off)
+# at the USB serial console to print the stats of all three boards.
+PROFILE_LOOP = False  # Set to start with profiling on, rather than waiting for STA 1
+PROFILE_UART = 0
+PROFILE_BLINK_ANIMS = 1
+PROFILE_GAME_OVER_ANIM = 2
+PROFILE_SERVO = 3
+PROFILE_GAME = 4
+PROFILE_NEW_GAME_BUTTON = 5
+PROFILE_MESSAGES = 6
+PROFILE_LAMPS = 7
+PROFILE_SCREEN_FX = 8
+PROFILE_DISPLAY = 9
+profiler = Profiler(
+    ("uart", "blink_anims", "game_over_anim", "servo", "game", "new_game_button", "messages", "lamps", "screen_fx", "display"),
+    PROFILE_LOOP,
+)
+console_buf = bytearray(32)
+console_length = 0
+console_command = Command()
+
+def read_console():
+    """Run any STA command typed at the USB serial console, and pass it on to the other boards."""
+    global console_length
+    while supervisor.runtime.serial_bytes_available:
+        b = ord(sys.stdin.read(1))
+        if b != 10 and b != 13:
+            if console_length < len(console_buf):
+                console_buf[console_length] = b
+                console_length += 1
+            continue
+        if console_command.parse(console_buf, console_length) and console_command.key == CMD_STA:
+            if console_command.argc > 0:
+                profiler.enabled = console_command.int_arg(0) != 0
+                profiler.reset()
+            for line in profiler.report() + [display_refresh.report(), screen_fx.report(), boot_report()]:
+                print("displayController STR " + line)
+            send_uart(sound_tx, console_command.text())
+            send_uart(solenoid_tx, console_command.text())
+        console_length = 0
+
+def boot_report():
+    """Return the boot timings as a line of text."""
+    return f"boot first_frame={boot_first_frame_ms}ms main_loop={boot_main_loop_ms}ms"
+
+boot_main_loop_ms = ticks_diff(ticks_ms(), boot_start)
+print(boot_report())
+
 while True:
+    profiler.start_loop()
 
     # Read any data waiting on the UART lines
-    while uart_sound.in_waiting > 0:
-        readline(uart_sound)
-    while uart_solenoid.in_waiting > 0:
-        readline(uart_solenoid)
+    while readline(sound_reader):
+        pass
+    while readline(solenoid_reader):
+        pass
+    read_console()
+    sound_tx.service(ticks_ms())
+    solenoid_tx.service(ticks_ms())
+    sound_upgrade.update(ticks_ms())
+    solenoid_upgrade.update(ticks_ms())
+    profiler.lap(PROFILE_UART)
 
     # Update blinking light animations
     update_blink_anims()
+    profiler.lap(PROFILE_BLINK_ANIMS)
 
     # Blink LEDs randomly during gameover
-    if game_mode == MODE_GAME_OVER:
-        if time.monotonic() > gameover_anim_timer + GAMEOVER_ANIM_LED_BLINK_TIME:
-            gameover_anim_timer = time.monotonic()
-            for aw_device in aw_devices:
+    if state.game_mode == MODE_GAME_OVER:
+        if ticks_diff(ticks_ms(), gameover_anim_timer) > GAMEOVER_ANIM_LED_BLINK_TIME:
+            gameover_anim_timer = ticks_ms()
+            for aw_device in range(len(aw_devices)):
                 for pin in range(len(pins)):
-                    aw_device.set_constant_current(pin, 255 if random.random() > 0.5 else 0)
+                    lamps.set(aw_device, pin, 255 if random.random() > 0.5 else 0)
+    profiler.lap(PROFILE_GAME_OVER_ANIM)
 
     # Update ship servo
-    cur_time = time.monotonic()
-    if cur_time > rand_servo_time:
+    cur_time = ticks_ms()
+    if ticks_expired(rand_servo_time, cur_time):
         print("Move ship servo")
         rand_servo_time = rand_ship_time()
         cur_ship_angle = rand_ship_angle(cur_ship_angle)
         ship_servo.angle = cur_ship_angle
-    elif cur_time > servo_shutoff_time:
+    elif ticks_expired(servo_shutoff_time, cur_time):
         # Turn off ship servo motor if we're not using it
         print("Turn off ship servo")
         ship_servo.angle = None
-        servo_shutoff_time = rand_servo_time + SERVO_TIMEOUT
+        servo_shutoff_time = ticks_add(rand_servo_time, SERVO_TIMEOUT)
+    profiler.lap(PROFILE_SERVO)
 
-    if drop_target_reset_sound_timer and cur_time > drop_target_reset_sound_timer:
-        drop_target_reset_sound_timer = None
+    if ticks_expired(state.drop_target_reset_sound_timer, cur_time):
+        state.drop_target_reset_sound_timer = None
         play_sound(HIGH_SCORE_SOUND)
         # Blink all 3 drop target lights
-        blink_light(LIGHT_DROP_TARGET, 20, 0.125, True)
+        blink_light(LIGHT_DROP_TARGET, 20, 125, True)
 
     # Decrease cur_hyperspace_value after a delay & turn off lights
-    if game_mode == MODE_PLAYING and cur_time > cur_hyperspace_trigger_timer + HYPERSPACE_DECREASE_TIMER:
-        if cur_hyperspace_value > 0:
-            cur_hyperspace_trigger_timer = cur_time # Force this to not trigger again for another cycle
+    if state.game_mode == MODE_PLAYING and ticks_diff(cur_time, state.cur_hyperspace_trigger_timer) > HYPERSPACE_DECREASE_TIMER:
+        if state.cur_hyperspace_value > 0:
+            state.cur_hyperspace_trigger_timer = cur_time # Force this to not trigger again for another cycle
 
             # Decrease hyperspace value callback
             def hyperspace_decrease_callback():
-                global cur_hyperspace_value
-                global cur_hyperspace_trigger_timer
-                cur_hyperspace_value -= 1
-                if cur_hyperspace_value < 0:
-                    cur_hyperspace_value = 0
-                cur_hyperspace_trigger_timer = cur_time
+                state.cur_hyperspace_value -= 1
+                if state.cur_hyperspace_value < 0:
+                    state.cur_hyperspace_value = 0
+                state.cur_hyperspace_trigger_timer = cur_time
 
             # Blink hyperspace bar
-            blink_light([LIGHT_HYPERSPACE_BAR[cur_hyperspace_value - 1]], 30, 0.125, False, on_complete=hyperspace_decrease_callback)
+            blink_light([LIGHT_HYPERSPACE_BAR[state.cur_hyperspace_value - 1]], 30, 125, False, on_complete=hyperspace_decrease_callback)
 
     # Reload the ball if we should
-    if ball_drained_timer and cur_time > ball_drained_timer + BALL_DRAIN_DELAY:
-        ball_drained_timer = None
-        redeploy_timer = None
-        if extra_ball or redeploy_ball:
-            send_uart(uart_solenoid, "RLD")
-            if extra_ball:
+    if state.ball_drained_timer is not None and ticks_diff(cur_time, state.ball_drained_timer) > BALL_DRAIN_DELAY:
+        state.ball_drained_timer = None
+        state.redeploy_timer = None
+        if state.extra_ball or state.redeploy_ball:
+            send_uart(solenoid_tx, "RLD")
+            if state.extra_ball:
                 set_status_text("Extra Ball")
             else:
                 set_status_text("Re-Deploy")
-            message_timer = cur_time + MESSAGE_DELAY_LONGER
-            next_message = WAITING_BALL_LAUNCH_TEXT
-            game_mode = MODE_BALL_LAUNCH
+            state.message_timer = ticks_add(cur_time, MESSAGE_DELAY_LONGER)
+            state.next_message = WAITING_BALL_LAUNCH_TEXT
+            state.game_mode = MODE_BALL_LAUNCH
             # Turn on ball deploy light
             set_light(LIGHT_BALL_DEPLOY, True)
             cancel_anim([LIGHT_EXTRA_BALL])
@@ -871,104 +1015,121 @@ while True:
             cancel_anim([LIGHT_RE_DEPLOY], False)
             set_light(LIGHT_RE_DEPLOY, True)
         else:
-            cur_hyperspace_value = 0
-            ball += 1
-            if ball > NUM_BALLS:
-                game_mode = MODE_GAME_OVER
+            state.cur_hyperspace_value = 0
+            state.ball += 1
+            if state.ball > NUM_BALLS:
+                state.game_mode = MODE_GAME_OVER
                 set_status_text("Game Over")
-                message_timer = cur_time + MESSAGE_DELAY_LONGER
-                next_message = "Press New Game Button"
-                send_uart(uart_sound, "GOV")
-                send_uart(uart_solenoid, "GOV")
+                state.message_timer = ticks_add(cur_time, MESSAGE_DELAY_LONGER)
+                state.next_message = "Press New Game Button"
+                send_uart(sound_tx, "GOV")
+                send_uart(solenoid_tx, "GOV")
             else:
-                text_area_ball.text = str(ball)
-                send_uart(uart_solenoid, "RLD")
-                game_mode = MODE_BALL_LAUNCH
-                crash_bonus = DEFAULT_CRASH_BONUS
+                set_ball_text(str(state.ball))
+                send_uart(solenoid_tx, "RLD")
+                state.game_mode = MODE_BALL_LAUNCH
+                state.crash_bonus = DEFAULT_CRASH_BONUS
                 set_status_text(WAITING_BALL_LAUNCH_TEXT)
-                mission_status = MISSION_STATUS_NONE
-                cur_mission = None
+                state.mission_status = MISSION_STATUS_NONE
+                state.cur_mission = None
                 # Turn on ball deploy light
                 set_light(LIGHT_BALL_DEPLOY, True)
                 set_light(LIGHT_RE_DEPLOY, True)
                 # Turn off mission select lights
                 cancel_anim(LIGHT_MISSION_SELECT)
-                for light in LIGHT_MISSION_SELECT:
-                    set_light(light, False)
+                lamps.set_group(LAMPS_MISSION_SELECT, False)
                 # Turn off hyperspace lights
                 cancel_anim(LIGHT_HYPERSPACE_BAR)
-                for light in LIGHT_HYPERSPACE_BAR:
-                    set_light(light, False)
+                lamps.set_group(LAMPS_HYPERSPACE_BAR, False)
                 # Turn off mission arrow lights
                 for light in LIGHT_MISSION_ARROW:
                     cancel_anim(light)
-                    for arr in light:
-                        set_light(arr, False)
-        extra_ball = False
-        redeploy_ball = True
+                lamps.set_group(LAMPS_MISSION_ARROW, False)
+        state.extra_ball = False
+        state.redeploy_ball = True
+    profiler.lap(PROFILE_GAME)
 
     # Start new game and such
-    new_game_button_debouncer.update()
-    if new_game_button_debouncer.fell:
-        set_light(LIGHT_NEW_GAME_BUTTON, True)
-        if game_mode == MODE_GAME_OVER:
-            # Start a new game
-            print("Start new game")
-            game_mode = MODE_BALL_LAUNCH
-            crash_bonus = DEFAULT_CRASH_BONUS
-            # Turn off all lights
-            for aw_device in range(len(aw_devices)):
-                for pin in range(len(pins)):
-                    set_light([aw_device, pin], False)
-            # Turn on ball deploy light
-            set_light(LIGHT_BALL_DEPLOY, True)
-            cancel_anim([LIGHT_RE_DEPLOY], False)
-            set_light(LIGHT_RE_DEPLOY, True)
-            # Clear ir_lights array
-            for i in range(len(ir_lights)):
-                ir_lights[i] = False
-            score = 0
-            ball = 1
-            text_area_score.text = str(score)
-            text_area_ball.text = str(ball)
-            set_status_text(WAITING_BALL_LAUNCH_TEXT)
-            cur_hyperspace_value = 0
-            score_multiplier = 1
-            mission_status = MISSION_STATUS_NONE
-            cur_mission = None
-            num_missions_completed = 0
-            # Turn on drop target lights
-            for i in range(len(LIGHT_DROP_TARGET)):
-                set_light(LIGHT_DROP_TARGET[i], True)
-            send_uart(uart_solenoid, "RST")
-            send_uart(uart_sound, "RST")
-        elif game_mode == MODE_PLAYING or game_mode == MODE_BALL_LAUNCH:
-            print("New game button pressed; manual reload")
-        send_uart(uart_solenoid, "RLD")
-    elif new_game_button_debouncer.rose:
-        print("New game button released")
-        set_light(LIGHT_NEW_GAME_BUTTON, False)
+    event = new_game_button.next_event()
+    while event is not None:
+        if event.pressed:
+            set_light(LIGHT_NEW_GAME_BUTTON, True)
+            if state.game_mode == MODE_GAME_OVER:
+                # Start a new game
+                print("Start new game")
+                state.game_mode = MODE_BALL_LAUNCH
+                state.crash_bonus = DEFAULT_CRASH_BONUS
+                # Turn off all lights
+                for aw_device in range(len(aw_devices)):
+                    for pin in range(len(pins)):
+                        set_light([aw_device, pin], False)
+                # Turn on ball deploy light
+                set_light(LIGHT_BALL_DEPLOY, True)
+                cancel_anim([LIGHT_RE_DEPLOY], False)
+                set_light(LIGHT_RE_DEPLOY, True)
+                # Clear ir_lights array
+                for i in range(len(state.ir_lights)):
+                    state.ir_lights[i] = False
+                state.score = 0
+                state.ball = 1
+                score_display.value = state.score
+                set_ball_text(str(state.ball))
+                set_status_text(WAITING_BALL_LAUNCH_TEXT)
+                state.cur_hyperspace_value = 0
+                state.score_multiplier = 1
+                state.mission_status = MISSION_STATUS_NONE
+                state.cur_mission = None
+                state.num_missions_completed = 0
+                # Turn on drop target lights
+                for i in range(len(LIGHT_DROP_TARGET)):
+                    set_light(LIGHT_DROP_TARGET[i], True)
+                send_uart(solenoid_tx, "RST")
+                send_uart(sound_tx, "RST")
+            elif state.game_mode == MODE_PLAYING or state.game_mode == MODE_BALL_LAUNCH:
+                print("New game button pressed; manual reload")
+            send_uart(solenoid_tx, "RLD")
+        else:
+            print("New game button released")
+            set_light(LIGHT_NEW_GAME_BUTTON, False)
+        event = new_game_button.next_event()
+    profiler.lap(PROFILE_NEW_GAME_BUTTON)
+
+    # Draw any score changes made this pass
+    if score_display.update():
+        display_refresh.mark(SCORE_REGION)
 
     # Update message area
-    if message_timer and next_message and cur_time > message_timer:
-        set_status_text(next_message)
-        message_timer = None
-        next_message = None
+    if state.next_message and ticks_expired(state.message_timer, cur_time):
+        set_status_text(state.next_message)
+        state.message_timer = None
+        state.next_message = None
     
-    if redeploy_timer and cur_time > redeploy_timer:
-        redeploy_timer = None
+    if ticks_expired(state.redeploy_timer, cur_time):
+        state.redeploy_timer = None
 
         # Callback that turns off redeploy global
         def redeploy_callback():
-            global redeploy_ball
-            redeploy_ball = False
+            state.redeploy_ball = False
             # play_sound(CENTER_POST_GONE_SOUND)
 
-        blink_light([LIGHT_RE_DEPLOY], 26, 0.125, False, on_complete=redeploy_callback)
+        blink_light([LIGHT_RE_DEPLOY], 26, 125, False, on_complete=redeploy_callback)
+
+    # Step lamp shows such as the hyperspace arrow chase
+    lamp_shows.update(cur_time)
+
+    # Draw the ball number and status text set this pass
+    draw_text()
+    profiler.lap(PROFILE_MESSAGES)
+
+    # Send this pass's lamp changes to the expanders
+    lamps.flush()
+    profiler.lap(PROFILE_LAMPS)
+
+    # Step score screen animations
+    screen_fx.update(cur_time)
+    profiler.lap(PROFILE_SCREEN_FX)
 
-    if hyperspace_arrow_time and cur_time > hyperspace_arrow_time + HYPERSPACE_ARROW_DELAY:
-        hyperspace_arrow_time = cur_time
-        # Cycle through hyperspace arrow animation
-        hyperspace_arrow_animation = [hyperspace_arrow_animation[-1]] + hyperspace_arrow_animation[:-1]
-        for i in range(len(LIGHT_HYPERSPACE_ARROW)):
-            set_light(LIGHT_HYPERSPACE_ARROW[i], hyperspace_arrow_animation[i])
+    # Push this pass's screen changes out, at most DISPLAY_MAX_FPS times a second
+    if display_refresh.update(ticks_ms()):
+        screen_fx.refreshed()
+    profiler.lap(PROFILE_DISPLAY)
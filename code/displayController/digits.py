@@ -0,0 +1,67 @@
+"""Numbers drawn as a row of font glyph tiles.
+
+A Label lays out and redraws its whole bitmap whenever its text changes.
+DigitDisplay instead shows each digit as one tile of a TileGrid over the
+font's own glyph sheet, so changing the number only changes the tile
+indexes of the digits that differ.
+"""
+
+import displayio
+
+
+class DigitDisplay:
+    """A right-aligned number shown as a TileGrid of font glyphs.
+
+    Setting value only records the number. update(), called once per loop,
+    then redraws the digits that changed, so several changes in one pass
+    reach the display once. The tile grid ends at its group's origin, like
+    a right-to-left Label, and is vertically centered on it.
+    """
+
+    def __init__(self, font, color, num_digits, value=0):
+        width, height = font.get_bounding_box()[:2]
+        self._digit_tiles = [font.get_glyph(ord(c)).tile_index for c in "0123456789"]
+        self._blank_tile = font.get_glyph(ord(" ")).tile_index
+        palette = displayio.Palette(2)
+        palette[0] = 0x000000
+        palette[1] = color
+        palette.make_transparent(0)
+        self.tile_grid = displayio.TileGrid(
+            font.bitmap, pixel_shader=palette, width=num_digits, height=1,
+            tile_width=width, tile_height=height, default_tile=self._blank_tile,
+            x=-(num_digits * width), y=-(height // 2),
+        )
+        self.num_digits = num_digits
+        self.width = num_digits * width  # Pixels, before the group's scale
+        self.height = height
+        self._max_value = 10 ** num_digits - 1
+        self._shown = [self._blank_tile] * num_digits
+        self._digits = bytearray(num_digits)
+        self._shown_value = None
+        self.value = value
+
+    def update(self):
+        """Redraw the digits that differ from what's on screen. Returns True if any did."""
+        value = self.value
+        if value == self._shown_value:
+            return False
+        self._shown_value = value
+        value = min(max(value, 0), self._max_value)
+        # Split into digits, least significant first
+        count = 0
+        while True:
+            self._digits[count] = value % 10
+            count += 1
+            value //= 10
+            if value == 0:
+                break
+        changed = False
+        blank_cols = self.num_digits - count
+        for col in range(self.num_digits):
+            # The ones digit goes in the last column, and unused columns on the left stay blank
+            tile = self._digit_tiles[self._digits[self.num_digits - 1 - col]] if col >= blank_cols else self._blank_tile
+            if self._shown[col] != tile:
+                self._shown[col] = tile
+                self.tile_grid[col, 0] = tile
+                changed = True
+        return changed
@@ -0,0 +1,79 @@
+"""Game state for the display controller.
+
+Everything that changes over a game lives on one GameState object rather
+than in module globals, so command handlers can read and change it
+without declaring globals. __slots__ fixes the set of fields, so a typo
+in a field name fails loudly (on CPython) rather than quietly making a
+new one.
+"""
+
+# Overall modes for the game
+MODE_STARTUP = 0
+MODE_BALL_LAUNCH = 1
+MODE_PLAYING = 2
+MODE_BALL_DRAIN = 3
+MODE_GAME_OVER = 4
+
+# Modes for mission progression
+MISSION_STATUS_NONE = 0
+MISSION_STATUS_SELECTED = 1
+MISSION_STATUS_ACTIVE = 2
+
+DEFAULT_CRASH_BONUS = 1000
+
+
+class GameState:
+    """The state of the game in progress, and of the boards it's played on."""
+
+    __slots__ = (
+        "game_mode",
+        "score",
+        "ball",
+        "score_multiplier",
+        "crash_bonus",
+        "extra_ball",
+        "redeploy_ball",
+        "redeploy_timer",
+        "ball_drained_timer",
+        "mission_status",
+        "cur_mission",
+        "mission_hits_left",
+        "mission_just_accepted",
+        "num_missions_completed",
+        "cur_rank",
+        "cur_hyperspace_value",
+        "cur_hyperspace_trigger_timer",
+        "drop_target_reset_sound_timer",
+        "ir_lights",
+        "message_timer",
+        "next_message",
+        "current_status_text",
+        "sound_controller_initialized",
+        "solenoid_driver_initialized",
+    )
+
+    def __init__(self, now, status_text):
+        self.game_mode = MODE_STARTUP
+        self.score = 0
+        self.ball = 1
+        self.score_multiplier = 1
+        self.crash_bonus = DEFAULT_CRASH_BONUS
+        self.extra_ball = False
+        self.redeploy_ball = True
+        self.redeploy_timer = None
+        self.ball_drained_timer = None
+        self.mission_status = MISSION_STATUS_NONE
+        self.cur_mission = None
+        self.mission_hits_left = 0
+        self.mission_just_accepted = False  # Set by the HYP that accepts a mission, so it doesn't also count toward it
+        self.num_missions_completed = 0
+        self.cur_rank = 0
+        self.cur_hyperspace_value = 0
+        self.cur_hyperspace_trigger_timer = now
+        self.drop_target_reset_sound_timer = None
+        self.ir_lights = [False, False, False]
+        self.message_timer = None
+        self.next_message = ''
+        self.current_status_text = status_text
+        self.sound_controller_initialized = False
+        self.solenoid_driver_initialized = False
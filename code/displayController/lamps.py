@@ -0,0 +1,481 @@
+"""Lamp framebuffer for the AW9523 I/O expanders.
+
+Setting a lamp only changes a shadow copy of the expanders' LED current
+registers and marks it dirty. flush() then writes each expander's dirty
+registers in a single I2C transaction, relying on the AW9523
+auto-incrementing the register address, instead of one transaction per
+lamp.
+
+Groups of lamps are compiled once into a LampGroup, a bitmask of pins per
+device, so a whole group can be switched with a few integer operations.
+LampSequencer plays LampShows, lists of precomputed group frames such as
+chases, on a group. BlinkEngine blinks lamps a set number of times.
+FadeEngine fades and pulses lamps through the expanders' 256 current
+levels.
+
+Each lamp is animated by at most one of these engines. An engine claims
+the lamps it starts on, and the framebuffer tells the engine that had a
+lamp before to release it, so a fade never fights a blink or a show.
+Switching a group with set_group() or write_group() releases its lamps
+from every engine.
+"""
+
+from ticks import ticks_add, ticks_diff
+
+NUM_PINS = 16
+DIM_REG_BASE = 0x20  # DIM registers run 0x20-0x2F, but not in pin order
+
+# Perceived brightness to LED current, so fades look even to the eye
+GAMMA = bytes([round(255 * (i / 255) ** 2.2) for i in range(256)])
+
+FADE_NONE = 0
+FADE_ONCE = 1
+FADE_PULSE = 2
+FIXED_ONE = 256  # Fade positions are brightness * FIXED_ONE
+
+
+def dim_register(pin):
+    """Return the offset from DIM_REG_BASE of the LED current register for a pin."""
+    if pin < 8:
+        return pin + 4    # P0_0-P0_7 are 0x24-0x2B
+    if pin < 12:
+        return pin - 8    # P1_0-P1_3 are 0x20-0x23
+    return pin            # P1_4-P1_7 are 0x2C-0x2F
+
+
+class LampFramebuffer:
+    """Shadow of the LED current of every pin on a list of AW9523s."""
+
+    def __init__(self, devices):
+        self.devices = devices
+        # Levels are stored in register order, NUM_PINS per device
+        self.levels = bytearray(NUM_PINS * len(devices))
+        self._dirty = [0] * len(devices)  # Bit n set if register DIM_REG_BASE + n needs writing
+        self._on = [0] * len(devices)  # Bit n set if pin n is lit
+        self._users = [None] * (NUM_PINS * len(devices))  # Engine animating each pin, in pin order
+        self._out = bytearray(NUM_PINS + 1)
+        self.writes = 0
+        self.bytes_written = 0
+
+    def set(self, device, pin, level):
+        """Set a pin's LED current (0-255). It's written out by the next flush()."""
+        reg = dim_register(pin)
+        i = device * NUM_PINS + reg
+        if self.levels[i] != level:
+            self.levels[i] = level
+            self._dirty[device] |= 1 << reg
+            if level:
+                self._on[device] |= 1 << pin
+            else:
+                self._on[device] &= ~(1 << pin)
+
+    def get(self, device, pin):
+        """Return the LED current a pin has been set to."""
+        return self.levels[device * NUM_PINS + dim_register(pin)]
+
+    def claim(self, device, pin, user=None):
+        """Hand a pin to user, an engine, or to no engine. The engine that had it is told to release(device, pin)."""
+        i = device * NUM_PINS + pin
+        previous = self._users[i]
+        if previous is not user:
+            self._users[i] = user
+            if previous is not None:
+                previous.release(device, pin)
+
+    def unclaim(self, device, pin, user):
+        """Give back a pin that user has finished animating."""
+        i = device * NUM_PINS + pin
+        if self._users[i] is user:
+            self._users[i] = None
+
+    def write_group(self, group, bits, level=255, user=None):
+        """Light the lamps in group whose pin bits are set in bits (one mask per device), and turn off the rest."""
+        for device, pin in group.lights:
+            self.claim(device, pin, user)
+        for device in range(len(group.masks)):
+            mask = group.masks[device]
+            if not mask:
+                continue
+            changed = (self._on[device] ^ bits[device]) & mask
+            pin = 0
+            while changed:
+                if changed & 1:
+                    self.set(device, pin, level if bits[device] & (1 << pin) else 0)
+                changed >>= 1
+                pin += 1
+
+    def set_group(self, group, state, level=255, user=None):
+        """Turn every lamp in group on or off."""
+        self.write_group(group, group.masks if state else group.none, level, user)
+
+    def fill(self, level):
+        """Set every pin on every device to the same LED current."""
+        for device in range(len(self.devices)):
+            for pin in range(NUM_PINS):
+                self.set(device, pin, level)
+
+    def flush(self):
+        """Write every changed register, one I2C transaction per device that has changes."""
+        out = self._out
+        for device in range(len(self.devices)):
+            dirty = self._dirty[device]
+            if not dirty:
+                continue
+            first = 0
+            while not dirty & (1 << first):
+                first += 1
+            last = NUM_PINS - 1
+            while not dirty & (1 << last):
+                last -= 1
+            # Rewriting the clean registers between the first and last dirty one
+            # is cheaper than starting another transaction
+            out[0] = DIM_REG_BASE + first
+            base = device * NUM_PINS
+            length = last - first + 1
+            for j in range(length):
+                out[j + 1] = self.levels[base + first + j]
+            with self.devices[device].i2c_device as i2c:
+                i2c.write(out, end=length + 1)
+            self._dirty[device] = 0
+            self.writes += 1
+            self.bytes_written += length + 1
+
+
+def _flatten(lights, out):
+    if lights and isinstance(lights[0], int):
+        out.append(lights)
+    else:
+        for light in lights:
+            _flatten(light, out)
+    return out
+
+
+class LampGroup:
+    """A set of lamps, compiled to a bitmask of pins per device.
+
+    lights is a [device, pin] pair, or a list of them, nested as deeply as
+    the LIGHT_ constants are.
+    """
+
+    def __init__(self, lights, num_devices=2):
+        self.lights = _flatten(lights, [])
+        masks = [0] * num_devices
+        for device, pin in self.lights:
+            masks[device] |= 1 << pin
+        self.masks = tuple(masks)
+        self.none = (0,) * num_devices
+
+    def frame(self, indexes):
+        """Return the per-device masks that light just the lamps at the given indexes into lights."""
+        masks = list(self.none)
+        for i in indexes:
+            device, pin = self.lights[i]
+            masks[device] |= 1 << pin
+        return tuple(masks)
+
+
+class LampShow:
+    """Frames of a group, shown one after another every period ms."""
+
+    def __init__(self, group, frames, period, loop=True):
+        self.group = group
+        self.frames = frames
+        self.period = period
+        self.loop = loop
+        self.index = -1
+        self.next_time = None
+
+    @property
+    def playing(self):
+        """True while the show is running on a LampSequencer."""
+        return self.next_time is not None
+
+
+def chase(group, period, gap=0, reverse=False):
+    """A show that lights one lamp at a time, in order, then gap dark frames."""
+    count = len(group.lights)
+    order = range(count - 1, -1, -1) if reverse else range(count)
+    frames = [group.frame([i]) for i in order] + [group.none] * gap
+    return LampShow(group, frames, period)
+
+
+def alternate(group, period):
+    """A show that swaps between the even and the odd lamps."""
+    count = len(group.lights)
+    return LampShow(group, [group.frame(range(0, count, 2)), group.frame(range(1, count, 2))], period)
+
+
+def sweep(group, period, gap=0):
+    """A show that lights the lamps one more at a time until all are lit, then goes dark for gap frames."""
+    count = len(group.lights)
+    frames = [group.frame(range(i + 1)) for i in range(count)] + [group.none] * (gap + 1)
+    return LampShow(group, frames, period)
+
+
+class LampSequencer:
+    """Plays LampShows on a LampFramebuffer."""
+
+    def __init__(self, lamps):
+        self.lamps = lamps
+        self._shows = []
+
+    def start(self, show, now):
+        """Start a show from its first frame, which is shown period ms after now."""
+        for device, pin in show.group.lights:
+            self.lamps.claim(device, pin, self)
+        if not show.playing:
+            self._shows.append(show)
+        show.index = -1
+        show.next_time = ticks_add(now, show.period)
+
+    def _end(self, show):
+        self._shows.remove(show)
+        show.next_time = None
+        for device, pin in show.group.lights:
+            self.lamps.unclaim(device, pin, self)
+
+    def stop(self, show, state=False):
+        """Stop a show, and turn its lamps on or off."""
+        if show.playing:
+            self._end(show)
+        self.lamps.set_group(show.group, state)
+
+    def release(self, device, pin):
+        """Stop any show on a lamp another engine has claimed, leaving its lamps as they are."""
+        for i in range(len(self._shows) - 1, -1, -1):
+            show = self._shows[i]
+            if show.group.masks[device] & (1 << pin):
+                self._end(show)
+
+    def update(self, now):
+        """Step every show that is due to its next frame."""
+        for i in reversed(range(len(self._shows))):
+            show = self._shows[i]
+            if ticks_diff(now, show.next_time) < 0:
+                continue
+            show.index += 1
+            if show.index == len(show.frames):
+                if not show.loop:
+                    self._end(show)
+                    continue
+                show.index = 0
+            self.lamps.write_group(show.group, show.frames[show.index], 255, self)
+            show.next_time = ticks_add(now, show.period)
+
+
+class BlinkEngine:
+    """Blinks sets of lamps, each a set number of times, on a LampFramebuffer.
+
+    Running blinks live in a fixed pool of slots, and every lamp records
+    the slot blinking it. Cancelling by lamp or group therefore never
+    searches the running blinks. Starting a blink cancels any others on its
+    lamps, so each lamp belongs to at most one blink.
+    """
+
+    def __init__(self, lamps):
+        self.lamps = lamps
+        max_blinks = len(lamps.devices) * NUM_PINS  # Enough for one per lamp
+        self._owner = bytearray(max_blinks)  # Slot + 1 of the blink on each lamp, or 0
+        self._lights = [None] * max_blinks  # Lamp indexes (device * NUM_PINS + pin), or None if free
+        self._remaining = [0] * max_blinks
+        self._period = [0] * max_blinks
+        self._deadline = [0] * max_blinks
+        self._final_state = [False] * max_blinks
+        self._on_complete = [None] * max_blinks
+        self._active = []
+
+    @staticmethod
+    def _indexes(lights):
+        if isinstance(lights, LampGroup):
+            lights = lights.lights
+        return tuple(device * NUM_PINS + pin for device, pin in _flatten(lights, []))
+
+    def start(self, lights, num_blinks, period, final_state, now, on_complete=None):
+        """Toggle each of lights every period ms, num_blinks times, then set them all to final_state and call on_complete.
+
+        Returns False, without starting the blink, if every slot is in use.
+        """
+        self.cancel(lights)
+        if None not in self._lights:
+            return False
+        indexes = self._indexes(lights)
+        slot = self._lights.index(None)
+        for i in indexes:
+            self.lamps.claim(i // NUM_PINS, i % NUM_PINS, self)
+        self._lights[slot] = indexes
+        self._remaining[slot] = num_blinks
+        self._period[slot] = period
+        self._deadline[slot] = ticks_add(now, period)
+        self._final_state[slot] = final_state
+        self._on_complete[slot] = on_complete
+        for i in indexes:
+            self._owner[i] = slot + 1
+        self._active.append(slot)
+        return True
+
+    def _free(self, slot):
+        """Free a slot, returning its on_complete callback."""
+        for i in self._lights[slot]:
+            self._owner[i] = 0
+            self.lamps.unclaim(i // NUM_PINS, i % NUM_PINS, self)
+        self._lights[slot] = None
+        self._active.remove(slot)
+        on_complete = self._on_complete[slot]
+        self._on_complete[slot] = None
+        return on_complete
+
+    def cancel(self, lights, call_callback=True):
+        """Stop any blinks on lights (or a LampGroup), leaving the lamps as they are."""
+        if isinstance(lights, LampGroup):
+            lights = lights.lights
+        for device, pin in _flatten(lights, []):
+            slot = self._owner[device * NUM_PINS + pin] - 1
+            if slot >= 0:
+                on_complete = self._free(slot)
+                if call_callback and on_complete is not None:
+                    on_complete()
+
+    def release(self, device, pin):
+        """Stop the blink on a lamp another engine has claimed, without calling its callback."""
+        slot = self._owner[device * NUM_PINS + pin] - 1
+        if slot >= 0:
+            self._free(slot)
+
+    def clear(self):
+        """Stop every blink without calling any callbacks."""
+        while self._active:
+            self._free(self._active[-1])
+
+    def update(self, now):
+        """Toggle every blink that's due, and finish the ones with no blinks left."""
+        lamps = self.lamps
+        active = self._active
+        i = len(active)
+        while i > 0:
+            i -= 1
+            if i >= len(active):
+                continue  # A callback finished more than one blink
+            slot = active[i]
+            if self._remaining[slot] == 0:
+                level = 255 if self._final_state[slot] else 0
+                for light in self._lights[slot]:
+                    lamps.set(light // NUM_PINS, light % NUM_PINS, level)
+                # Free the slot first, as the callback may start a new blink on these lamps
+                on_complete = self._free(slot)
+                if on_complete is not None:
+                    on_complete()
+            elif ticks_diff(now, self._deadline[slot]) > 0:
+                self._remaining[slot] -= 1
+                self._deadline[slot] = ticks_add(now, self._period[slot])
+                for light in self._lights[slot]:
+                    device = light // NUM_PINS
+                    pin = light % NUM_PINS
+                    lamps.set(device, pin, 0 if lamps.get(device, pin) else 255)
+
+
+class FadeEngine:
+    """Fades and pulses lamps on a LampFramebuffer.
+
+    Each lamp's brightness is kept as an integer with 8 fractional bits,
+    and moves by a fixed step per ms, so update() is just an add and a
+    GAMMA lookup per fading lamp.
+    """
+
+    def __init__(self, lamps):
+        self.lamps = lamps
+        count = len(lamps.devices) * NUM_PINS
+        self._mode = bytearray(count)
+        self._pos = [0] * count
+        self._step = [0] * count  # Per ms
+        self._low = [0] * count   # Fade target, or bottom of a pulse
+        self._high = [0] * count  # Top of a pulse
+        self._active = []
+        self._last_update = None
+
+    def _start(self, device, pin, mode, step, low, high):
+        self.lamps.claim(device, pin, self)
+        light = device * NUM_PINS + pin
+        level = self.lamps.get(device, pin)
+        if GAMMA[self._pos[light] // FIXED_ONE] != level:
+            # Not where a fade left it, so start from its raw level
+            self._pos[light] = level * FIXED_ONE
+        if not self._mode[light]:
+            self._active.append(light)
+        self._mode[light] = mode
+        self._step[light] = step
+        self._low[light] = low
+        self._high[light] = high
+        return light
+
+    def fade_to(self, device, pin, level, duration):
+        """Fade a lamp from where it is now to brightness level (0-255) over duration ms."""
+        target = level * FIXED_ONE
+        light = self._start(device, pin, FADE_ONCE, 0, target, target)
+        self._step[light] = (target - self._pos[light]) // max(duration, 1)
+
+    def pulse(self, lights, period, low=0, high=255):
+        """Breathe lights (or a LampGroup) between brightness low and high, once every period ms."""
+        if isinstance(lights, LampGroup):
+            lights = lights.lights
+        step = max((high - low) * FIXED_ONE * 2 // max(period, 1), 1)
+        for device, pin in _flatten(lights, []):
+            self._start(device, pin, FADE_PULSE, step, low * FIXED_ONE, high * FIXED_ONE)
+
+    def stop_lamp(self, device, pin):
+        """Stop any fade on a lamp, leaving it at its current level."""
+        light = device * NUM_PINS + pin
+        if self._mode[light]:
+            self._mode[light] = FADE_NONE
+            self._active.remove(light)
+            self.lamps.unclaim(device, pin, self)
+
+    def release(self, device, pin):
+        """Stop the fade on a lamp another engine has claimed."""
+        self.stop_lamp(device, pin)
+
+    def stop(self, lights):
+        """Stop any fades on lights (or a LampGroup)."""
+        if isinstance(lights, LampGroup):
+            lights = lights.lights
+        for device, pin in _flatten(lights, []):
+            self.stop_lamp(device, pin)
+
+    def clear(self):
+        """Stop every fade."""
+        for light in self._active:
+            self._mode[light] = FADE_NONE
+            self.lamps.unclaim(light // NUM_PINS, light % NUM_PINS, self)
+        self._active.clear()
+
+    def update(self, now):
+        """Move every fading lamp along by the time since the last update."""
+        elapsed = 0 if self._last_update is None else ticks_diff(now, self._last_update)
+        self._last_update = now
+        if elapsed <= 0:
+            return
+        lamps = self.lamps
+        active = self._active
+        for i in range(len(active) - 1, -1, -1):
+            light = active[i]
+            step = self._step[light]
+            pos = self._pos[light] + step * elapsed
+            if self._mode[light] == FADE_ONCE:
+                target = self._low[light]
+                if (step >= 0 and pos >= target) or (step <= 0 and pos <= target):
+                    pos = target
+                    self._mode[light] = FADE_NONE
+                    active.pop(i)
+                    lamps.unclaim(light // NUM_PINS, light % NUM_PINS, self)
+            else:
+                # Bounce off the ends of the pulse. A lamp that started outside
+                # them just moves in until it's between them.
+                low = self._low[light]
+                high = self._high[light]
+                if pos > high and step > 0:
+                    pos = max(2 * high - pos, low)
+                    self._step[light] = -step
+                elif pos < low and step < 0:
+                    pos = min(2 * low - pos, high)
+                    self._step[light] = -step
+            self._pos[light] = pos
+            lamps.set(light // NUM_PINS, light % NUM_PINS, GAMMA[pos // FIXED_ONE])
@@ -0,0 +1,132 @@
+"""Binary frames for the inter-board protocol.
+
+A frame carries the same commands as a text line in fewer bytes, with a
+check that it arrived intact:
+
+    SYNC  length  seq  opcode  args...  crc
+
+Text lines are 7-bit ASCII, so SYNC (0xA5) never appears in one, and frames
+and lines can share a link. length counts the opcode and argument bytes.
+Each argument is an unsigned varint (7 bits per byte, low bits first, high
+bit set on every byte but the last). crc is CRC-8 (polynomial 0x07) over
+everything between SYNC and itself. seq counts the frames sent on a link,
+so the receiver can tell when one went missing.
+
+Only commands listed in OPCODES whose arguments are all non-negative
+integers can be framed. Anything else is still sent as a text line.
+"""
+
+from protocol import command_key, MAX_ARGS
+
+SYNC = 0xA5
+HEADER_LEN = 3      # SYNC, length, seq
+MAX_VARINT_LEN = 4  # Enough for any argument below 2**28
+MAX_FRAME_LEN = HEADER_LEN + 1 + MAX_ARGS * MAX_VARINT_LEN + 1
+
+# A command's opcode is its index here, so only ever append to this
+OPCODES = (
+    b"ACC", b"BTN", b"CAL", b"DRN", b"DT", b"DTR", b"FLD", b"FLU", b"FRD", b"FRU", b"GOV",
+    b"HYP", b"IR", b"MSN", b"MUS", b"PB", b"PNT", b"RLD", b"RNK", b"RST", b"SLG", b"SND",
+)
+_OPCODE_BY_KEY = {}
+for _opcode, _name in enumerate(OPCODES):
+    _OPCODE_BY_KEY[command_key(_name)] = _opcode
+
+
+def _make_crc8_table():
+    table = bytearray(256)
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table[i] = crc
+    return bytes(table)
+
+
+_CRC8_TABLE = _make_crc8_table()
+
+
+def crc8(buf, start, end):
+    """Return the CRC-8 of buf[start:end]."""
+    crc = 0
+    for i in range(start, end):
+        crc = _CRC8_TABLE[crc ^ buf[i]]
+    return crc
+
+
+def encode_frame(command, seq, out):
+    """Encode a parsed Command as a frame in out. Returns its length, or 0 if it can't be framed."""
+    opcode = _OPCODE_BY_KEY.get(command.key)
+    if opcode is None:
+        return 0
+    pos = HEADER_LEN
+    out[pos] = opcode
+    pos += 1
+    for i in range(command.argc):
+        value = command.int_arg(i, -1)
+        if value < 0 or value >= 1 << (7 * MAX_VARINT_LEN):
+            return 0
+        while value >= 0x80:
+            out[pos] = (value & 0x7F) | 0x80
+            value >>= 7
+            pos += 1
+        out[pos] = value
+        pos += 1
+    out[0] = SYNC
+    out[1] = pos - HEADER_LEN
+    out[2] = seq & 0xFF
+    out[pos] = crc8(out, 1, pos)
+    return pos + 1
+
+
+def frame_length(length_byte):
+    """Return the total length of a frame from its length byte, or 0 if it's too long to be one."""
+    total = HEADER_LEN + length_byte + 1
+    return total if total <= MAX_FRAME_LEN and length_byte > 0 else 0
+
+
+def _write_int(out, pos, value):
+    end = pos + 1
+    rest = value // 10
+    while rest:
+        end += 1
+        rest //= 10
+    i = end
+    while True:
+        i -= 1
+        out[i] = 48 + value % 10  # '0'
+        value //= 10
+        if i == pos:
+            return end
+
+
+def decode_frame(frame, out):
+    """Decode a complete frame into out as a text line. Returns the line's length, or 0 if the frame is corrupt."""
+    end = HEADER_LEN + frame[1]
+    if crc8(frame, 1, end) != frame[end]:
+        return 0
+    opcode = frame[HEADER_LEN]
+    if opcode >= len(OPCODES):
+        return 0
+    pos = 0
+    for b in OPCODES[opcode]:
+        out[pos] = b
+        pos += 1
+    i = HEADER_LEN + 1
+    while i < end:
+        value = 0
+        shift = 0
+        while True:
+            b = frame[i]
+            i += 1
+            value |= (b & 0x7F) << shift
+            shift += 7
+            if b < 0x80:
+                break
+            if i >= end:
+                return 0
+        out[pos] = 32  # ' '
+        pos = _write_int(out, pos + 1, value)
+    out[pos] = 13  # '\r'
+    out[pos + 1] = 10  # '\n'
+    return pos + 2
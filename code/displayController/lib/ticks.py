@@ -0,0 +1,43 @@
+"""Millisecond tick time base.
+
+time.monotonic() is a float that loses resolution the longer the board has
+been up, so timers use integer milliseconds from supervisor.ticks_ms()
+instead. Tick values wrap every 2**29 ms, so always compare them with the
+helpers here rather than with < or - directly. Two ticks can be compared
+correctly as long as they are less than about 74 hours apart.
+"""
+
+try:
+    from supervisor import ticks_ms
+except ImportError:
+    # Not running on CircuitPython
+    import time
+
+    def ticks_ms():
+        """Return the current tick count in milliseconds."""
+        return (time.monotonic_ns() // 1_000_000) & TICKS_MAX
+
+TICKS_PERIOD = 1 << 29
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+
+def ticks_add(ticks, delta):
+    """Add a millisecond delta (which may be negative) to a tick value."""
+    return (ticks + delta) % TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    """Return the signed number of milliseconds from ticks2 to ticks1."""
+    diff = (ticks1 - ticks2) & TICKS_MAX
+    return ((diff + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+
+def ticks_less(ticks1, ticks2):
+    """Return True if ticks1 is before ticks2."""
+    return ticks_diff(ticks1, ticks2) < 0
+
+
+def ticks_expired(deadline, now):
+    """Return True if a deadline is set (not None) and now is past it."""
+    return deadline is not None and ticks_diff(now, deadline) > 0
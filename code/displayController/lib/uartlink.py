@@ -0,0 +1,374 @@
+"""Non-blocking UART line handling.
+
+uart.readline() waits up to the UART timeout when only part of a line has
+arrived, which stalls the whole main loop. LineReader copies only the
+bytes that are already waiting into a fixed ring buffer, and hands back
+complete lines, so receiving never blocks.
+
+Writing can block too: uart.write() returns only once everything fits in
+the UART's small hardware FIFO. TxQueue holds outgoing lines and writes
+only as many as the link can carry since the last write, most important
+first.
+"""
+
+from frames import SYNC, HEADER_LEN, MAX_FRAME_LEN, crc8, decode_frame, encode_frame, frame_length
+from protocol import Command, command_key
+from ticks import ticks_ms, ticks_add, ticks_diff, ticks_expired
+
+NEWLINE = 10
+
+PRIORITY_CRITICAL = 0  # Gameplay events the other board must act on right away
+PRIORITY_NORMAL = 1
+PRIORITY_COSMETIC = 2  # Light toggles that can wait, or be dropped
+NUM_PRIORITIES = 3
+
+UART_FIFO_SIZE = 32  # bytes the RP2040 UART buffers in hardware
+
+UPGRADE_NONE = 0
+UPGRADE_OFFERED = 1    # Sent BIN, waiting for BOK
+UPGRADE_CONFIRMED = 2  # Got BOK, switching once the FIFO is empty
+UPGRADE_ACCEPTED = 3   # Sent BOK, switching once it has left the FIFO
+UPGRADE_SWITCHED = 4   # Switched, waiting for BOK at the new baud rate
+UPGRADE_DONE = 5
+UPGRADE_TIMEOUT = 500  # ms to wait for the other board's half of a switch
+
+
+class LineReader:
+    """Assembles complete lines from a UART into a reusable buffer.
+
+    Call readline() until it returns 0. Each nonzero return is the length
+    of a line (including its line ending) that has been copied into line.
+    If the ring fills up without a line ending, its contents are dropped,
+    overflows is incremented, and the rest of that line is dropped too.
+
+    Once frames is set, binary frames (see frames.py) are accepted too, and
+    handed back decoded into the same text form as a line. Corrupt frames
+    are counted in frame_errors and skipped, and seq_gaps counts frames
+    that went missing.
+    """
+
+    def __init__(self, uart, size=128):
+        self.uart = uart
+        self._ring = bytearray(size)
+        self._view = memoryview(self._ring)
+        self._size = size
+        self._head = 0     # Where the next received byte goes
+        self._tail = 0     # Start of the oldest unread line
+        self._count = 0    # Bytes in the ring
+        self._scanned = 0  # Bytes from the tail already checked for a line ending
+        self._discarding = False
+        self._frame = bytearray(MAX_FRAME_LEN)
+        self._next_seq = None
+        self.line = bytearray(size)
+        self.frames = False
+        self.overflows = 0
+        self.frame_errors = 0
+        self.seq_gaps = 0
+
+    def poll(self):
+        """Move whatever bytes have already arrived into the ring, without waiting for more."""
+        waiting = self.uart.in_waiting
+        while waiting > 0 and self._count < self._size:
+            # Only read into the contiguous free space after the head
+            n = min(waiting, self._size - self._count, self._size - self._head)
+            got = self.uart.readinto(self._view[self._head:self._head + n])
+            if not got:
+                break
+            self._head += got
+            if self._head == self._size:
+                self._head = 0
+            self._count += got
+            waiting -= got
+
+    def _copy(self, n, out):
+        """Copy the n bytes at the tail of the ring into out, leaving them in the ring."""
+        ring = self._ring
+        j = self._tail
+        for k in range(n):
+            out[k] = ring[j]
+            j += 1
+            if j == self._size:
+                j = 0
+
+    def _skip(self, n):
+        """Drop the n bytes at the tail of the ring."""
+        self._tail += n
+        if self._tail >= self._size:
+            self._tail -= self._size
+        self._count -= n
+        self._scanned = 0
+
+    def _read_frame(self):
+        """Decode the frame at the tail into line. Returns its length, 0 if it was corrupt, or None if it's incomplete."""
+        if self._count < HEADER_LEN:
+            return None
+        i = self._tail + 1
+        if i >= self._size:
+            i -= self._size
+        n = frame_length(self._ring[i])
+        if n and self._count < n:
+            return None
+        length = 0
+        if n:
+            self._copy(n, self._frame)
+            length = decode_frame(self._frame, self.line)
+        if not length:
+            # Drop just the sync byte, in case a real frame starts inside this one
+            self.frame_errors += 1
+            self._skip(1)
+            return 0
+        self._skip(n)
+        seq = self._frame[2]
+        if self._next_seq is not None and seq != self._next_seq:
+            self.seq_gaps += (seq - self._next_seq) & 0xFF
+        self._next_seq = (seq + 1) & 0xFF
+        return length
+
+    def readline(self):
+        """Copy the next complete line into line and return its length, or return 0 if there isn't one yet."""
+        ring = self._ring
+        size = self._size
+        while True:
+            self.poll()
+            while self._scanned < self._count:
+                i = self._tail + self._scanned
+                if i >= size:
+                    i -= size
+                if self.frames and ring[i] == SYNC:
+                    # Text before a frame that never got a line ending is noise
+                    self._skip(self._scanned)
+                    self._discarding = False
+                    length = self._read_frame()
+                    if length is None:
+                        break  # Wait for the rest of the frame
+                    if length:
+                        return length
+                    continue
+                self._scanned += 1
+                if ring[i] != NEWLINE:
+                    continue
+                length = self._scanned
+                self._copy(length, self.line)
+                self._skip(length)
+                if self._discarding:
+                    # The start of this line was dropped in an overflow
+                    self._discarding = False
+                    continue
+                return length
+            if self._count < size:
+                if self.uart.in_waiting == 0:
+                    return 0
+                # Lines were taken out while more bytes were waiting to come in
+                continue
+            # The ring is full and still has no line ending, so drop it and keep reading
+            if not self._discarding:
+                self.overflows += 1
+                self._discarding = True
+            self._tail = self._head
+            self._count = 0
+            self._scanned = 0
+
+
+class TxQueue:
+    """Outgoing lines for one UART, sent most important first.
+
+    critical and cosmetic are collections of command keys (see protocol).
+    Anything else is sent at PRIORITY_NORMAL.
+
+    Call service() every pass of the main loop. It only writes what the
+    link has had time to send since the last write, so the hardware FIFO
+    always has room and uart.write() never waits.
+
+    Once frames is set, messages that can be framed are encoded as binary
+    frames (see frames.py) when they're queued, and the rest still go out
+    as text lines. A frame's sequence number and CRC are filled in as it's
+    written, so the numbers stay in order however the queue reorders
+    messages.
+
+    hold() keeps back everything queued after it until release(), so the
+    link can be quiet while its baud rate changes (see LinkUpgrade).
+    """
+
+    def __init__(self, uart, baudrate=9600, critical=(), cosmetic=(), fifo_size=UART_FIFO_SIZE):
+        self.uart = uart
+        self._queues = [[] for _ in range(NUM_PRIORITIES)]
+        self._priorities = {}
+        for key in critical:
+            self._priorities[key] = PRIORITY_CRITICAL
+        for key in cosmetic:
+            self._priorities[key] = PRIORITY_COSMETIC
+        self._draining = []  # Lines queued before hold(), still to go out
+        self.held = False
+        self.baudrate = baudrate
+        self._bytes_per_ms = baudrate / 10000  # 10 bits per byte on the wire
+        self._fifo_size = fifo_size
+        self._budget = fifo_size
+        self._last_service = ticks_ms()
+        self._command = Command()
+        self._frame = bytearray(MAX_FRAME_LEN)
+        self._seq = 0
+        self.frames = False
+
+    def send(self, message):
+        """Queue a line (without its line ending) and write whatever can go out now."""
+        data = f"{message}\r\n".encode()
+        end = data.find(b" ")
+        key = command_key(data, 0, end if end >= 0 else len(data) - 2)
+        if self.frames and self._command.parse(data):
+            length = encode_frame(self._command, 0, self._frame)
+            if length:
+                data = self._frame[:length]
+        self._queues[self._priorities.get(key, PRIORITY_NORMAL)].append(data)
+        self.service(ticks_ms())
+
+    def service(self, now):
+        """Write queued lines while the link has room for them."""
+        elapsed = ticks_diff(now, self._last_service)
+        if elapsed > 0:  # now can be older than a send() made since it was read
+            self._budget = min(self._fifo_size, self._budget + elapsed * self._bytes_per_ms)
+            self._last_service = now
+        if not self._write(self._draining) or self.held:
+            return
+        for queue in self._queues:
+            if not self._write(queue):
+                return
+
+    def _write(self, queue):
+        """Write lines from the front of a queue while they fit. Returns False if one had to wait."""
+        while queue:
+            data = queue[0]
+            # A line longer than the FIFO waits until the link is idle
+            if len(data) > self._budget and self._budget < self._fifo_size:
+                return False
+            queue.pop(0)
+            if data[0] == SYNC:
+                # Number the frame as it goes out
+                end = len(data) - 1
+                data[2] = self._seq
+                data[end] = crc8(data, 1, end)
+                self._seq = (self._seq + 1) & 0xFF
+            self.uart.write(data)
+            self._budget -= len(data)
+        return True
+
+    def send_ahead(self, message):
+        """Queue a text line to go out ahead of everything held back, even while the queue is held."""
+        self._draining.append(f"{message}\r\n".encode())
+        self.service(ticks_ms())
+
+    def hold(self):
+        """Hold back everything queued from now on until release(). Lines already queued still go out."""
+        for queue in self._queues:
+            self._draining.extend(queue)
+            queue.clear()
+        self.held = True
+
+    def release(self):
+        """Start sending the lines held back since hold()."""
+        self.held = False
+
+    @property
+    def idle(self):
+        """True once every line that can go out has, and has had time to leave the FIFO."""
+        if self._draining or (not self.held and len(self)):
+            return False
+        return self._budget >= self._fifo_size
+
+    def set_baudrate(self, baudrate):
+        """Switch the link to baudrate.
+
+        Anything still in the FIFO would go out at the new rate, so only
+        switch while the queue is idle and held.
+        """
+        self.uart.baudrate = baudrate
+        self.baudrate = baudrate
+        self._bytes_per_ms = baudrate / 10000
+
+    def __len__(self):
+        return len(self._draining) + sum(len(queue) for queue in self._queues)
+
+
+class LinkUpgrade:
+    """Moves a link from text lines over to binary frames, at a new baud rate if asked, without losing bytes.
+
+    One board calls offer(), which sends BIN <baud> and holds back what it
+    sends after that. The other board passes the BIN to accept(), which
+    answers BOK <baud>, holds back what it sends after that, and switches
+    baud rate once the BOK has left its FIFO. When the BOK arrives, the
+    first board switches too, sends BOK back at the new rate and starts
+    sending frames. The other board starts sending frames when that BOK
+    arrives. Neither board sends anything between its switch and the
+    other's, so nothing goes out at the wrong rate.
+
+    Both boards pass BOK commands to confirmed(), and call update() every
+    pass of the main loop, after servicing the TxQueue. The other board
+    can be busy for a while before it answers, so the first board asks
+    again every timeout ms rather than giving up on a switch the other
+    board may already be making. A board that has switched and gets no BOK
+    within timeout ms starts sending frames anyway.
+    """
+
+    def __init__(self, reader, tx, timeout=UPGRADE_TIMEOUT):
+        self.reader = reader
+        self.tx = tx
+        self.timeout = timeout
+        self.state = UPGRADE_NONE
+        self._baudrate = tx.baudrate
+        self._deadline = None
+
+    def offer(self, baudrate, now):
+        """Ask the board at the other end to switch to binary frames at baudrate."""
+        if self.state != UPGRADE_NONE:
+            return
+        self.reader.frames = True  # Text still gets through
+        self.tx.hold()
+        self.tx.send_ahead(f"BIN {baudrate}")
+        self._baudrate = baudrate
+        self.state = UPGRADE_OFFERED
+        self._deadline = ticks_add(now, self.timeout)
+
+    def accept(self, command, now):
+        """Switch to binary frames as a BIN command from the other board asks."""
+        if self.state != UPGRADE_NONE:
+            return  # Asked again before our BOK arrived
+        self._baudrate = command.int_arg(0) or self.tx.baudrate
+        self.reader.frames = True
+        self.tx.hold()
+        self.tx.send_ahead(f"BOK {self._baudrate}")
+        self.state = UPGRADE_ACCEPTED
+
+    def confirmed(self, command, now):
+        """Handle a BOK command from the other board."""
+        if self.state == UPGRADE_OFFERED:
+            self.state = UPGRADE_CONFIRMED
+        elif self.state == UPGRADE_SWITCHED:
+            self._finish()
+
+    def update(self, now):
+        """Switch baud rate once the queue has gone quiet, and chase answers that are overdue."""
+        state = self.state
+        if state == UPGRADE_CONFIRMED or state == UPGRADE_ACCEPTED:
+            if not self.tx.idle:
+                return
+            if self._baudrate != self.tx.baudrate:
+                self.tx.set_baudrate(self._baudrate)
+            if state == UPGRADE_CONFIRMED:
+                self.tx.send_ahead(f"BOK {self._baudrate}")
+                self._finish()
+            else:
+                self.state = UPGRADE_SWITCHED
+                self._deadline = ticks_add(now, self.timeout)
+        elif ticks_expired(self._deadline, now):
+            if state == UPGRADE_OFFERED:
+                print("No answer to BIN yet, asking again")
+                self.tx.send_ahead(f"BIN {self._baudrate}")
+                self._deadline = ticks_add(now, self.timeout)
+            elif state == UPGRADE_SWITCHED:
+                print("No BOK at the new baud rate, switching to binary frames anyway")
+                self._finish()
+
+    def _finish(self):
+        self.state = UPGRADE_DONE
+        self._deadline = None
+        self.tx.frames = True
+        self.tx.release()
@@ -0,0 +1,68 @@
+"""Cached status messages.
+
+The same few dozen status messages come up again and again in a game.
+MessageCache word wraps each one once and keeps its rendered bitmap label,
+so showing a message that's been shown recently is just swapping which
+label is in the display group. The least recently used labels are dropped
+once their bitmaps take up more than a RAM budget.
+"""
+
+from adafruit_display_text import bitmap_label
+
+LABEL_OVERHEAD = 128  # Rough bytes for a label's objects, on top of its bitmap
+
+
+def wrap_text(text, width=14):
+    """Word wrap text into lines of at most width characters (one word per line if it's longer)."""
+    final_str = ""
+    cur_len = 0
+    for s in text.split(" "):
+        if s == "":
+            continue
+        s_len = len(s)
+        if cur_len + s_len > width:
+            final_str += "\n" + s
+            cur_len = s_len + 1
+        else:
+            final_str += " " + s if cur_len > 0 else s
+            cur_len += s_len + 1
+    return final_str
+
+
+class MessageCache:
+    """Wrapped, rendered labels for recently shown messages, kept under a RAM budget."""
+
+    def __init__(self, font, color, budget, width=14, line_spacing=0.9):
+        self.font = font
+        self.color = color
+        self.budget = budget
+        self.width = width
+        self.line_spacing = line_spacing
+        self._entries = {}  # Message -> (wrapped text, label, bytes)
+        self._order = []    # Messages, least recently used first
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text):
+        """Return (wrapped text, label) for a message, rendering it if it isn't cached."""
+        entry = self._entries.get(text)
+        if entry is not None:
+            self.hits += 1
+            if self._order[-1] != text:
+                self._order.remove(text)
+                self._order.append(text)
+            return entry[0], entry[1]
+        self.misses += 1
+        wrapped = wrap_text(text, self.width)
+        label = bitmap_label.Label(self.font, text=wrapped, color=self.color, line_spacing=self.line_spacing)
+        bitmap = label.bitmap
+        size = LABEL_OVERHEAD + (bitmap.width * bitmap.height + 7) // 8 if bitmap is not None else LABEL_OVERHEAD
+        # Make room, though never by dropping the message being added
+        while self._order and self._bytes + size > self.budget:
+            oldest = self._order.pop(0)
+            self._bytes -= self._entries.pop(oldest)[2]
+        self._entries[text] = (wrapped, label, size)
+        self._order.append(text)
+        self._bytes += size
+        return wrapped, label
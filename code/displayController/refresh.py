@@ -0,0 +1,72 @@
+"""Display refresh scheduling.
+
+With auto_refresh on, displayio refreshes whenever it likes, which can
+land in the middle of UART or lamp work. RefreshScheduler turns it off.
+Widgets mark the screen region they changed, and update() refreshes the
+display once they have, no more often than max_fps.
+
+The marked regions only decide whether to refresh. displayio has no way
+to refresh part of a display, so refresh() always redraws whatever
+displayio itself found changed. last_area is the size of the bounding box
+of the regions marked for the last refresh, which is how much of the
+screen the widgets said they changed.
+"""
+
+from ticks import ticks_ms, ticks_diff
+
+
+class RefreshScheduler:
+    """Refreshes a display at a capped rate, only when something on it changed."""
+
+    def __init__(self, display, max_fps=30):
+        self.display = display
+        display.auto_refresh = False
+        self._interval = 1000 // max_fps
+        self._last_refresh = None
+        self._dirty = None  # [x1, y1, x2, y2] covering every region marked since the last refresh
+        self.refreshes = 0
+        self.refresh_ms = 0      # Total time spent refreshing
+        self.max_refresh_ms = 0
+        self.last_refresh_ms = 0
+        self.last_area = 0       # Pixels covered by the regions marked for the last refresh
+
+    def mark(self, region):
+        """Note that the (x1, y1, x2, y2) region of the screen has changed."""
+        dirty = self._dirty
+        if dirty is None:
+            self._dirty = list(region)
+            return
+        if region[0] < dirty[0]:
+            dirty[0] = region[0]
+        if region[1] < dirty[1]:
+            dirty[1] = region[1]
+        if region[2] > dirty[2]:
+            dirty[2] = region[2]
+        if region[3] > dirty[3]:
+            dirty[3] = region[3]
+
+    def update(self, now):
+        """Refresh the display if anything changed and the last refresh was at least 1/max_fps ago."""
+        if self._dirty is None:
+            return False
+        if self._last_refresh is not None and ticks_diff(now, self._last_refresh) < self._interval:
+            return False
+        dirty = self._dirty
+        self.last_area = (dirty[2] - dirty[0]) * (dirty[3] - dirty[1])
+        self._dirty = None
+        self._last_refresh = now
+        start = ticks_ms()
+        # We do our own frame pacing, so don't let refresh() wait for its target frame rate
+        self.display.refresh(target_frames_per_second=None)
+        elapsed = ticks_diff(ticks_ms(), start)
+        self.last_refresh_ms = elapsed
+        self.refreshes += 1
+        self.refresh_ms += elapsed
+        if elapsed > self.max_refresh_ms:
+            self.max_refresh_ms = elapsed
+        return True
+
+    def report(self):
+        """Return the refresh stats as a line of text."""
+        avg = self.refresh_ms // self.refreshes if self.refreshes else 0
+        return f"display refreshes={self.refreshes} avg={avg}ms max={self.max_refresh_ms}ms last_area={self.last_area}px"
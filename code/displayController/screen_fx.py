@@ -0,0 +1,246 @@
+"""Score screen animations.
+
+Nothing here draws pixels from Python. PaletteCycle rotates a run of
+entries in a bitmap's palette, so every pixel in those colors shifts at
+once. Sprite steps a TileGrid over a small sprite sheet by changing its
+tile indexes. Each step is a few palette or tile writes, and displayio
+redraws the pixels they affect on the next refresh.
+
+A palette change redraws every pixel of every bitmap using that palette,
+so cycle the palette of a small bitmap of its own, never the background's.
+The background is read from flash, and redrawing it all takes far longer
+than a frame. AnimationLayer steps the animations, marks their screen
+regions for the RefreshScheduler, and times the refreshes that carry
+animation frames.
+"""
+
+import displayio
+from ticks import ticks_add, ticks_diff
+
+
+class PaletteCycle:
+    """Rotates palette entries first to first + count - 1 one place per step, then puts them back.
+
+    If group is given, it's shown only while the colors are cycling.
+    """
+
+    def __init__(self, palette, first, count, group=None):
+        self.palette = palette
+        self.first = first
+        self.group = group
+        self._colors = [palette[first + i] for i in range(count)]
+        self._offset = 0
+        self._steps_left = 0
+        self._period = 0
+        self.next_time = None
+
+    @property
+    def playing(self):
+        return self.next_time is not None
+
+    def start(self, steps, period, now):
+        """Rotate the colors steps times, the first step right away and then every period ms."""
+        self._steps_left = steps
+        self._period = period
+        self.next_time = now
+        if self.group is not None:
+            self.group.hidden = False
+
+    def stop(self):
+        """Put the original colors back on the next update."""
+        if self.playing:
+            self._steps_left = 0
+            self.next_time = ticks_add(self.next_time, -self._period)
+
+    def update(self, now):
+        """Take a step if one is due. Returns True if the palette changed."""
+        if self.next_time is None or ticks_diff(now, self.next_time) < 0:
+            return False
+        if self._steps_left == 0:
+            self.next_time = None
+            if self.group is not None:
+                self.group.hidden = True
+            elif self._offset == 0:
+                return False
+            self._offset = 0
+        else:
+            self._steps_left -= 1
+            self._offset = (self._offset + 1) % len(self._colors)
+            self.next_time = ticks_add(now, self._period)
+        colors = self._colors
+        count = len(colors)
+        palette = self.palette
+        for i in range(count):
+            palette[self.first + i] = colors[(i + self._offset) % count]
+        return True
+
+
+class Sprite:
+    """A row of tiles from a sprite sheet, stepped through frames of tile indexes.
+
+    Tile 0 of the sheet should be blank. Each frame is a tuple with a tile
+    index for every tile in the row. The sprite is hidden when it isn't
+    playing. Add .group to the display group to show it.
+    """
+
+    def __init__(self, sheet, palette, tile_width, tile_height, frames, width=1, scale=1, x=0, y=0):
+        self.tile_grid = displayio.TileGrid(
+            sheet, pixel_shader=palette, width=width, height=1,
+            tile_width=tile_width, tile_height=tile_height, default_tile=0,
+        )
+        self.group = displayio.Group(scale=scale, x=x, y=y)
+        self.group.append(self.tile_grid)
+        self.group.hidden = True
+        self.region = (x, y, x + width * tile_width * scale, y + tile_height * scale)
+        self.frames = frames
+        self.index = -1
+        self._loops_left = 0
+        self._period = 0
+        self.next_time = None
+
+    @property
+    def playing(self):
+        return self.next_time is not None
+
+    def play(self, period, now, loops=1):
+        """Play the frames loops times, the first right away and then one every period ms."""
+        self.index = -1
+        self._loops_left = loops
+        self._period = period
+        self.next_time = now
+
+    def stop(self):
+        """Hide the sprite on the next update."""
+        if self.playing:
+            self.index = len(self.frames) - 1
+            self._loops_left = 1
+            self.next_time = ticks_add(self.next_time, -self._period)
+
+    def update(self, now):
+        """Show the next frame if it's due. Returns True if the sprite changed."""
+        if self.next_time is None or ticks_diff(now, self.next_time) < 0:
+            return False
+        self.index += 1
+        if self.index == len(self.frames):
+            self._loops_left -= 1
+            if self._loops_left <= 0:
+                self.next_time = None
+                self.group.hidden = True
+                return True
+            self.index = 0
+        tile_grid = self.tile_grid
+        frame = self.frames[self.index]
+        for col in range(len(frame)):
+            if tile_grid[col] != frame[col]:
+                tile_grid[col] = frame[col]
+        self.group.hidden = False
+        self.next_time = ticks_add(now, self._period)
+        return True
+
+
+class AnimationLayer:
+    """Steps PaletteCycles and Sprites and marks what they change on a RefreshScheduler."""
+
+    def __init__(self, refresh):
+        self.refresh = refresh
+        self._animations = []
+        self._regions = []
+        self._frame_pending = False
+        self.frames = 0
+        self.frame_refresh_ms = 0  # Total time spent on refreshes that showed animation frames
+        self.max_frame_refresh_ms = 0
+
+    def add(self, animation, region):
+        """Step animation on every update, marking region whenever it changes. Returns animation."""
+        self._animations.append(animation)
+        self._regions.append(region)
+        return animation
+
+    def update(self, now):
+        """Step every animation that is due."""
+        animations = self._animations
+        for i in range(len(animations)):
+            if animations[i].update(now):
+                self.refresh.mark(self._regions[i])
+                self._frame_pending = True
+
+    def refreshed(self):
+        """Note that the display was just refreshed, timing it if it showed an animation frame."""
+        if not self._frame_pending:
+            return
+        self._frame_pending = False
+        elapsed = self.refresh.last_refresh_ms
+        self.frames += 1
+        self.frame_refresh_ms += elapsed
+        if elapsed > self.max_frame_refresh_ms:
+            self.max_frame_refresh_ms = elapsed
+
+    def report(self):
+        """Return the animation frame refresh stats as a line of text."""
+        avg = self.frame_refresh_ms // self.frames if self.frames else 0
+        return f"animation frames={self.frames} avg={avg}ms max={self.max_frame_refresh_ms}ms"
+
+
+def sprite_palette(color):
+    """Return a two color palette for a sprite sheet: transparent, then color."""
+    palette = displayio.Palette(2)
+    palette[0] = 0x000000
+    palette[1] = color
+    palette.make_transparent(0)
+    return palette
+
+
+def gradient_palette(dark, bright, count):
+    """Return a palette of transparent, then count colors fading from dark to bright."""
+    palette = displayio.Palette(count + 1)
+    palette[0] = 0x000000
+    palette.make_transparent(0)
+    for i in range(count):
+        color = 0
+        for shift in (16, 8, 0):
+            low = (dark >> shift) & 0xFF
+            high = (bright >> shift) & 0xFF
+            color |= (low + (high - low) * i // max(count - 1, 1)) << shift
+        palette[i + 1] = color
+    return palette
+
+
+def streak_sheet(width, height, count, band=3):
+    """Return a width x height bitmap of slanted stripes band pixels wide in colors 1 to count, in order."""
+    sheet = displayio.Bitmap(width, height, count + 1)
+    for y in range(height):
+        for x in range(width):
+            sheet[x, y] = 1 + (x + y // 2) // band % count
+    return sheet
+
+
+def burst_sheet(size, frames):
+    """Return a sheet of a blank size x size tile then frames tiles of a ring growing from the middle."""
+    sheet = displayio.Bitmap(size * (frames + 1), size, 2)
+    center = (size - 1) / 2
+    for frame in range(1, frames + 1):
+        outer = center * frame / frames + 0.5
+        inner = outer - 1.5
+        outer *= outer
+        inner = inner * inner if inner > 0 else 0
+        left = frame * size
+        for y in range(size):
+            dy = y - center
+            for x in range(size):
+                dx = x - center
+                if inner <= dx * dx + dy * dy <= outer:
+                    sheet[left + x, y] = 1
+    return sheet
+
+
+def chevron_sheet(size):
+    """Return a sheet of a blank size x size tile then an upward pointing chevron."""
+    sheet = displayio.Bitmap(size * 2, size, 2)
+    half = size // 2
+    top = half // 2
+    for d in range(half):
+        # Two pixel thick arms, spreading down from the top middle
+        for y in (top + d, top + d + 1):
+            sheet[size + half - 1 - d, y] = 1
+            sheet[size + half + d, y] = 1
+    return sheet
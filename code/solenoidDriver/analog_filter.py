@@ -0,0 +1,34 @@
+import array
+
+
+class AnalogFilter:
+    """Moving-sum filter over several analog channels.
+
+    Each channel keeps a fixed-size ring of the last num_samples readings and a
+    running integer sum, so adding a sample is O(1) and never allocates.
+    Thresholds are compared against the sum rather than the average to avoid
+    float division; use sum_threshold() to convert an average threshold.
+    """
+
+    def __init__(self, num_channels, num_samples):
+        self.num_channels = num_channels
+        self.num_samples = num_samples
+        self._samples = array.array('H', [0]) * (num_channels * num_samples)
+        self._index = [0] * num_channels
+        self.sums = [0] * num_channels
+
+    def add(self, channel, val):
+        """Add a reading to a channel and return the channel's new sum."""
+        pos = channel * self.num_samples + self._index[channel]
+        total = self.sums[channel] + val - self._samples[pos]
+        self._samples[pos] = val
+        self.sums[channel] = total
+        index = self._index[channel] + 1
+        if index == self.num_samples:
+            index = 0
+        self._index[channel] = index
+        return total
+
+    def sum_threshold(self, avg_threshold):
+        """Convert a per-sample threshold to one comparable against a sum."""
+        return avg_threshold * self.num_samples
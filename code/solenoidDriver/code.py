@@ -6,6 +6,16 @@ from adafruit_motor import servo
 from analogio import AnalogIn
 from digitalio import DigitalInOut, Direction, Pull
 from adafruit_debouncer import Debouncer
+from analog_filter import AnalogFilter
+from pop_bumpers import PopBumperCalibration
+from ticks import ticks_ms
+from scheduler import Scheduler, Timer
+from profiler import Profiler
+from switches import Switches
+from protocol import (
+    Command, CommandTable, CMD_DRN, CMD_DTR, CMD_FLD, CMD_FRD, CMD_HYP,
+)
+from uartlink import LineReader, LinkUpgrade, TxQueue
 
 # Sensitivity jumper
 sensitivity_pin = DigitalInOut(board.GP15)
@@ -13,8 +23,9 @@ sensitivity_pin.direction = Direction.INPUT
 sensitivity_pin.pull = Pull.UP
 
 # Constants
-SLING_TRIGGER_TIME = 0.11
-POP_BUMPER_TRIGGER_TIME = 0.125
+# Times are in milliseconds unless they're passed to a Debouncer, which takes seconds
+SLING_TRIGGER_TIME = 110
+POP_BUMPER_TRIGGER_TIME = 125
 POP_BUMPER_DEBOUNCE_TIME = 0.125
 NUM_POP_BUMPER_SAMPLES = 20
 POP_BUMPER_SENSITIVITY = -35
@@ -25,73 +36,90 @@ if sensitivity_pin.value:
     POP_BUMPER_DEBOUNCE_COUNT = 20
 else:
     print("Sensitivity jumper is set to LOW, increasing sensitivity")
-POP_BUMPER_CALIBRATE_COUNT = 10000
+POP_BUMPER_CALIBRATE_SAMPLES = 3334  # Readings of each pop bumper to calibrate from, one per main loop pass
 POP_BUMPER_DEBOUNCE_DECREMENT = 10
-DROP_TARGET_WAIT_TIME = 1.0
+DROP_TARGET_WAIT_TIME = 1000
 DROP_TARGET_UP_ANGLE = 95
-DROP_TARGET_UP_TIME = 0.5
+DROP_TARGET_UP_TIME = 500
 DROP_TARGET_DOWN_ANGLE = 15
-DROP_TARGET_DOWN_TIME = 0.25
+DROP_TARGET_DOWN_TIME = 250
 
-DRAIN_DELAY_TIME = 2.5
-DRAIN_TRIGGER_TIME = 0.125
-HYPERSPACE_DELAY_TIME = 0.75
-HYPERSPACE_TRIGGER_TIME = 0.125
-DRAIN_SIGNAL_DEBOUNCE_TIME = 5.0
+DRAIN_DELAY_TIME = 2500
+DRAIN_TRIGGER_TIME = 125
+HYPERSPACE_DELAY_TIME = 750
+HYPERSPACE_TRIGGER_TIME = 125
+DRAIN_SIGNAL_DEBOUNCE_TIME = 5000
 PWM_MAX_DUTY_CYCLE = 65535
 PWM_FLIPPER_SUSTAIN = PWM_MAX_DUTY_CYCLE // 3
-FLIPPER_PWM_DELAY = 1.0
+FLIPPER_PWM_DELAY = 1000
 
 def send_uart(str):
-    global uart
+    global uart_tx
     print(f'UART send: {str}')
-    uart.write(bytearray(f"{str}\r\n", "utf-8"))
+    uart_tx.send(str)
 
-reload_solenoid_timer = None
 game_over = False
 
-def readline():
-    """Read a line from the UART bus and print it to console."""
-    global uart
-    global reload_solenoid
-    global reload_solenoid_timer
-    global drop_target_state
-    global drop_target_start_time
+def handle_reload(command):
+    """RLD - Fire the reload solenoid."""
+    fire_reload_solenoid(ticks_ms())
+
+def handle_reset(command):
+    """RST - Start a new game."""
+    global game_over
+    game_over = False
+    # Reset the drop targets
+    reset_drop_targets(ticks_ms())
+    # Recalibrate the pop bumpers
+    calibrate_pop_bumpers()
+    # Fire the reload solenoid
+    fire_reload_solenoid(ticks_ms())
+
+def handle_game_over(command):
+    """GOV - Game over."""
     global game_over
-    global solenoid_l
-    global solenoid_r
-    global sol_l_rose_time
-    global sol_r_rose_time
-    data = uart.readline()
-    if data is not None:
-        # convert bytearray to string
-        data_string = ''.join([chr(b) for b in data])
-        command_list = data_string.split()
-        if len(command_list) > 0:
-            command = command_list[0]
-            if command == 'RLD':
-                # Fire the reload solenoid
-                reload_solenoid.value = True
-                reload_solenoid_timer = time.monotonic()
-            elif command == 'RST':
-                game_over = False
-                # Reset the drop targets
-                drop_target_state = DROP_TARGET_STATE_WAIT
-                drop_target_start_time = time.monotonic()
-                # Recalibrate the pop bumpers
-                calibrate_pop_bumpers()
-                # Fire the reload solenoid
-                reload_solenoid.value = True
-                reload_solenoid_timer = time.monotonic()
-            elif command == 'GOV':
-                # Game over
-                game_over = True
-                solenoid_l.duty_cycle = 0
-                solenoid_r.duty_cycle = 0
-                sol_l_rose_time = None
-                sol_r_rose_time = None
-            else:
-                print(f'Unknown command: {command}')
+    game_over = True
+    solenoid_l.duty_cycle = 0
+    solenoid_r.duty_cycle = 0
+    scheduler.cancel(flipper_l_sustain_timer)
+    scheduler.cancel(flipper_r_sustain_timer)
+
+def handle_binary(command):
+    """BIN <baud> - Display controller offered to switch our link to binary frames."""
+    print("Switching UART to binary frames")
+    uart_upgrade.accept(command, ticks_ms())
+
+def handle_binary_accepted(command):
+    """BOK <baud> - Display controller switched our link to binary frames."""
+    uart_upgrade.confirmed(command, ticks_ms())
+
+def handle_stats(command):
+    """STA [1/0] - Send back main loop profiling stats, turning profiling on or off first if asked."""
+    if command.argc > 0:
+        profiler.enabled = command.int_arg(0) != 0
+        profiler.reset()
+    for line in profiler.report():
+        send_uart("STR " + line)
+
+commands = CommandTable({
+    b"RLD": handle_reload,
+    b"RST": handle_reset,
+    b"GOV": handle_game_over,
+    b"BIN": handle_binary,
+    b"BOK": handle_binary_accepted,
+    b"STA": handle_stats,
+})
+command = Command()
+
+def readline():
+    """Run every complete command line received on the UART bus so far."""
+    global uart_reader
+    length = uart_reader.readline()
+    while length:
+        if command.parse(uart_reader.line, length):
+            if not commands.dispatch(command):
+                print(f'Unknown command: {command.name()}')
+        length = uart_reader.readline()
 
 # Leave the LED on while the pico is running
 status_led = DigitalInOut(board.GP25)
@@ -105,41 +133,28 @@ pop_bumper_pin_3 = AnalogIn(board.GP28)
 
 pop_bumper_pins = [pop_bumper_pin_1, pop_bumper_pin_2, pop_bumper_pin_3]
 
-pop_bumper_vals = [
-    [0 for _ in range(NUM_POP_BUMPER_SAMPLES)],
-    [0 for _ in range(NUM_POP_BUMPER_SAMPLES)],
-    [0 for _ in range(NUM_POP_BUMPER_SAMPLES)],
-]
+pop_bumper_filter = AnalogFilter(len(pop_bumper_pins), NUM_POP_BUMPER_SAMPLES)
 
 pb_debounce_counter = [0 for _ in range(3)]
 
-max_pb_val = [0, 0, 0]
-avg_val = 0
+# Trigger thresholds, compared against the filter's running sums
+pop_bumper_calibration = PopBumperCalibration(pop_bumper_filter, POP_BUMPER_CALIBRATE_SAMPLES, POP_BUMPER_SENSITIVITY)
 
 # Calibrate pop bumpers
 def calibrate_pop_bumpers():
-    global pop_bumper_vals
-    global avg_val
-    global max_pb_val
+    """Start calibrating the pop bumpers. The current thresholds stay in use until it completes."""
     print("Calibrating pop bumper sensors...")
-    calibration_counter = POP_BUMPER_CALIBRATE_COUNT
-    status_led.value = False    # Turn off status LED while calibrating and setting up
-    while calibration_counter > 0:
-        for i in range(3):
-            val = pop_bumper_pins[i].value
-            pop_bumper_vals[i].append(val)
-            pop_bumper_vals[i].pop(0)
-            avg_val = sum(pop_bumper_vals[i]) / len(pop_bumper_vals[i])
-            calibration_counter -= 1
-            if avg_val > max_pb_val[i]:
-                max_pb_val[i] = avg_val
-    print("Pop bumper calibration complete.")
+    pop_bumper_calibration.start()
 
-    # Add a bit of margin above which the pop bumper will trigger
+def pop_bumpers_calibrated():
+    """Report the new thresholds once a calibration completes."""
+    print("Pop bumper calibration complete.")
     for i in range(3):
-        max_pb_val[i] = max_pb_val[i] + POP_BUMPER_SENSITIVITY
-        print("Pop bumper {} max value: {}".format(i, max_pb_val[i]))
+        print("Pop bumper {} max value: {}".format(i, pop_bumper_calibration.thresholds[i] // NUM_POP_BUMPER_SAMPLES))
+    status_led.value = True  # Only ever off until the first calibration, at boot
+    send_uart("CAL")  # Let the display controller know the pop bumpers are live
 
+status_led.value = False  # Off until the pop bumpers are first calibrated
 calibrate_pop_bumpers()
 
 # Init pop bumper output pins
@@ -156,7 +171,7 @@ pop_bumper_3_out.direction = Direction.OUTPUT
 pop_bumper_3_out.value = False
 
 pop_bumper_out_pins = [pop_bumper_1_out, pop_bumper_2_out, pop_bumper_3_out]
-pop_bumper_signals = [False, False, False]
+pop_bumper_signals = [True, True, True]
 pop_bumper_signals_debounced = [
     Debouncer(lambda : pop_bumper_signals[0], interval=POP_BUMPER_DEBOUNCE_TIME),
     Debouncer(lambda : pop_bumper_signals[1], interval=POP_BUMPER_DEBOUNCE_TIME),
@@ -164,14 +179,9 @@ pop_bumper_signals_debounced = [
 ]
 
 # Init L/R flipper buttons
-button_r = DigitalInOut(board.GP18)
-button_r.direction = Direction.INPUT
-button_r.pull = Pull.DOWN
-button_l = DigitalInOut(board.GP19)
-button_l.direction = Direction.INPUT
-button_l.pull = Pull.DOWN
-button_l_debouncer = Debouncer(button_l)
-button_r_debouncer = Debouncer(button_r)
+FLIPPER_L = 0
+FLIPPER_R = 1
+flipper_buttons = Switches([board.GP19, board.GP18], value_when_pressed=True)
 
 # Init L/R flipper solenoids
 solenoid_l = pwmio.PWMOut(board.GP17)
@@ -195,21 +205,9 @@ sling_solenoid_r = DigitalInOut(board.GP3)
 sling_solenoid_r.direction = Direction.OUTPUT
 sling_solenoid_r.value = False
 
-# Init drop target switch pins
-drop_target_switch_1 = DigitalInOut(board.GP5)
-drop_target_switch_1.direction = Direction.INPUT
-drop_target_switch_1.pull = Pull.UP
-drop_target_switch_2 = DigitalInOut(board.GP6)
-drop_target_switch_2.direction = Direction.INPUT
-drop_target_switch_2.pull = Pull.UP
-drop_target_switch_3 = DigitalInOut(board.GP7)
-drop_target_switch_3.direction = Direction.INPUT
-drop_target_switch_3.pull = Pull.UP
-drop_target_debouncers = [
-    Debouncer(drop_target_switch_1),
-    Debouncer(drop_target_switch_2),
-    Debouncer(drop_target_switch_3),
-]
+# Init drop target switches
+# The switches read low while a target is up, so a target getting knocked down is a release
+drop_target_switches = Switches([board.GP5, board.GP6, board.GP7], value_when_pressed=False)
 
 # Init IR sensors
 ir_drain = DigitalInOut(board.GP10)
@@ -230,7 +228,6 @@ hyperspace_solenoid.direction = Direction.OUTPUT
 hyperspace_solenoid.value = False
 
 # Drop target servo raise states
-drop_target_start_time = 0
 DROP_TARGET_STATE_NONE = 0
 DROP_TARGET_STATE_WAIT = 1
 DROP_TARGET_STATE_UP = 2
@@ -240,116 +237,217 @@ drop_target_state = DROP_TARGET_STATE_NONE
 drop_target_pwm = pwmio.PWMOut(board.GP4, frequency=50)
 drop_target_servo = servo.Servo(drop_target_pwm, min_pulse=500, max_pulse=2500)
 
-# Init variables
-sling_l_trigger_time = 0
-sling_r_trigger_time = 0
-pop_bumper_fire_time = [0 for _ in range(3)]
-sol_drain_trigger_time = 0
-drain_debounce_time = 0
-sol_hyperspace_trigger_time = 0
-sol_l_rose_time = None
-sol_r_rose_time = None
+# Solenoid and servo timers. Each pulse, servo step or PWM change is a timer callback,
+# so the main loop only does work for the ones that are due.
+scheduler = Scheduler()
+
+def sustain_flipper_l(now):
+    """PWM the solenoid after a certain period of time to make it last longer."""
+    solenoid_l.duty_cycle = PWM_FLIPPER_SUSTAIN
+
+def sustain_flipper_r(now):
+    """PWM the solenoid after a certain period of time to make it last longer."""
+    solenoid_r.duty_cycle = PWM_FLIPPER_SUSTAIN
+
+flipper_l_sustain_timer = Timer(sustain_flipper_l)
+flipper_r_sustain_timer = Timer(sustain_flipper_r)
+
+# Slingshots only launch again after a delay since they turned off, to avoid chatter
+sling_switches = [slingshot_switch_l, sling_switch_r]
+sling_solenoids = [sling_solenoid_l, sling_solenoid_r]
+SLING_NAMES = ["L", "R"]
+sling_ready = [True, True]
+
+def make_sling_timer(i):
+    """Create the timer that turns off slingshot i, which then re-arms it after another delay."""
+    def sling_off(now):
+        sling_solenoids[i].value = False
+        scheduler.start(rearm_timer, SLING_TRIGGER_TIME, now)
+
+    def sling_rearm(now):
+        sling_ready[i] = True
+
+    rearm_timer = Timer(sling_rearm)
+    return Timer(sling_off)
+
+sling_off_timers = [make_sling_timer(i) for i in range(len(sling_solenoids))]
+
+def make_pop_bumper_timer(i):
+    """Create the timer that releases pop bumper i once its sensor has settled."""
+    def pop_bumper_off(now):
+        pop_bumper_out_pins[i].value = False
+        pop_bumper_signals[i] = True
+
+    return Timer(pop_bumper_off)
+
+pop_bumper_off_timers = [make_pop_bumper_timer(i) for i in range(len(pop_bumper_out_pins))]
+
+def reload_off(now):
+    """Turn off the reload solenoid."""
+    reload_solenoid.value = False
+
+reload_timer = Timer(reload_off)
+
+def fire_reload_solenoid(now):
+    """Fire the reload solenoid for DRAIN_TRIGGER_TIME."""
+    reload_solenoid.value = True
+    scheduler.start(reload_timer, DRAIN_TRIGGER_TIME, now)
+
+# Only send one drain event per DRAIN_SIGNAL_DEBOUNCE_TIME
+drain_ready = True
+
+def drain_rearm(now):
+    """Allow the drain sensor to trigger again."""
+    global drain_ready
+    drain_ready = True
+
+drain_rearm_timer = Timer(drain_rearm)
+
+# Hyperspace fires HYPERSPACE_DELAY_TIME after the ball is detected, for HYPERSPACE_TRIGGER_TIME
+hyperspace_ready = True
+
+def fire_hyperspace(now):
+    """Fire the hyperspace solenoid."""
+    print("Firing hyperspace solenoid")
+    hyperspace_solenoid.value = True
+    scheduler.start(hyperspace_off_timer, HYPERSPACE_TRIGGER_TIME, now)
+
+def hyperspace_off(now):
+    """Turn off the hyperspace solenoid."""
+    hyperspace_solenoid.value = False
+    scheduler.start(hyperspace_rearm_timer, HYPERSPACE_TRIGGER_TIME * 2, now)
+
+def hyperspace_rearm(now):
+    """Allow the hyperspace sensor to trigger again."""
+    global hyperspace_ready
+    hyperspace_ready = True
+
+hyperspace_fire_timer = Timer(fire_hyperspace)
+hyperspace_off_timer = Timer(hyperspace_off)
+hyperspace_rearm_timer = Timer(hyperspace_rearm)
+
+def step_drop_targets(now):
+    """Move the drop target servo on to the next step of raising the targets."""
+    global drop_target_state
+    if drop_target_state == DROP_TARGET_STATE_WAIT:
+        drop_target_servo.angle = DROP_TARGET_UP_ANGLE
+        drop_target_state = DROP_TARGET_STATE_UP
+        scheduler.start(drop_target_timer, DROP_TARGET_UP_TIME, now)
+    elif drop_target_state == DROP_TARGET_STATE_UP:
+        drop_target_servo.angle = DROP_TARGET_DOWN_ANGLE
+        drop_target_state = DROP_TARGET_STATE_DOWN
+        scheduler.start(drop_target_timer, DROP_TARGET_DOWN_TIME, now)
+    elif drop_target_state == DROP_TARGET_STATE_DOWN:
+        drop_target_servo.angle = None
+        drop_target_state = DROP_TARGET_STATE_NONE
+
+drop_target_timer = Timer(step_drop_targets)
+
+def reset_drop_targets(now):
+    """Start raising the drop targets after DROP_TARGET_WAIT_TIME."""
+    global drop_target_state
+    drop_target_state = DROP_TARGET_STATE_WAIT
+    scheduler.start(drop_target_timer, DROP_TARGET_WAIT_TIME, now)
 
 # Init UART
-uart = busio.UART(board.GP8, board.GP9)
+uart = busio.UART(board.GP8, board.GP9, timeout=0)
+uart_reader = LineReader(uart)
+# Drains, hyperspace and drop target resets go out ahead of everything else. Flipper up also moves the
+# re-entry lane lights, so only flipper down, which just turns a light off, can wait.
+uart_tx = TxQueue(
+    uart,
+    critical=(CMD_DRN, CMD_HYP, CMD_DTR),
+    cosmetic=(CMD_FLD, CMD_FRD),
+)
+uart_upgrade = LinkUpgrade(uart_reader, uart_tx)
 
 # Reset drop targets
-drop_target_state = DROP_TARGET_STATE_WAIT
-drop_target_start_time = time.monotonic()
+reset_drop_targets(ticks_ms())
 
 time.sleep(2.0)
-send_uart("INI solenoidDriver")  # Let the display controller know we're ready
+send_uart("INI solenoidDriver BIN")  # Let the display controller know we're ready, and can use binary frames
+
+# Main loop profiling, reported by the STA command
+PROFILE_LOOP = False  # Set to start with profiling on, rather than waiting for STA 1
+PROFILE_SCHEDULER = 0
+PROFILE_FLIPPERS = 1
+PROFILE_SWITCHES = 2
+PROFILE_POP_BUMPERS = 3
+PROFILE_DROP_TARGETS = 4
+PROFILE_UART = 5
+profiler = Profiler(("scheduler", "flippers", "switches", "pop_bumpers", "drop_targets", "uart"), PROFILE_LOOP)
 
 # Main loop
-status_led.value = True   # Turn on status LED again now that we're running for real
 print("Starting main loop")
 while True:
-    cur_time = time.monotonic()
+    profiler.start_loop()
+    cur_time = ticks_ms()
 
-    # Update flippers
-    button_l_debouncer.update()
-    button_r_debouncer.update()
+    # Run any solenoid pulses, servo steps and PWM changes that are due
+    scheduler.run(cur_time)
+    profiler.lap(PROFILE_SCHEDULER)
 
-    if not game_over:
+    # Update flippers
+    event = flipper_buttons.next_event()
+    while event is not None:
         # No flipper control during gameover
-        if button_l_debouncer.rose:
-            sol_l_rose_time = cur_time
-            solenoid_l.duty_cycle = PWM_MAX_DUTY_CYCLE
-            send_uart("FLU")
-        elif button_l_debouncer.fell:
-            solenoid_l.duty_cycle = 0
-            sol_l_rose_time = None
-            send_uart("FLD")
-        elif sol_l_rose_time is not None and cur_time - sol_l_rose_time > FLIPPER_PWM_DELAY:
-            # PWM the solenoids after a certain period of time to make them last longer
-            solenoid_l.duty_cycle = PWM_FLIPPER_SUSTAIN
-            sol_l_rose_time = None
-
-        if button_r_debouncer.rose:
-            sol_r_rose_time = cur_time
-            solenoid_r.duty_cycle = PWM_MAX_DUTY_CYCLE
-            send_uart("FRU")
-        elif button_r_debouncer.fell:
-            solenoid_r.duty_cycle = 0
-            sol_r_rose_time = None
-            send_uart("FRD")
-        elif sol_r_rose_time is not None and cur_time - sol_r_rose_time > FLIPPER_PWM_DELAY:
-            solenoid_r.duty_cycle = PWM_FLIPPER_SUSTAIN
-            sol_r_rose_time = None
+        if not game_over:
+            # Time the sustain PWM from when the button was actually pressed
+            if event.key_number == FLIPPER_L:
+                if event.pressed:
+                    solenoid_l.duty_cycle = PWM_MAX_DUTY_CYCLE
+                    scheduler.start(flipper_l_sustain_timer, FLIPPER_PWM_DELAY, event.timestamp)
+                    send_uart("FLU")
+                else:
+                    solenoid_l.duty_cycle = 0
+                    scheduler.cancel(flipper_l_sustain_timer)
+                    send_uart("FLD")
+            elif event.key_number == FLIPPER_R:
+                if event.pressed:
+                    solenoid_r.duty_cycle = PWM_MAX_DUTY_CYCLE
+                    scheduler.start(flipper_r_sustain_timer, FLIPPER_PWM_DELAY, event.timestamp)
+                    send_uart("FRU")
+                else:
+                    solenoid_r.duty_cycle = 0
+                    scheduler.cancel(flipper_r_sustain_timer)
+                    send_uart("FRD")
+        event = flipper_buttons.next_event()
+    profiler.lap(PROFILE_FLIPPERS)
 
     # Update slingshots
-    # Slingshots only launch after a delay since last launch, to avoid chatter
-    if slingshot_switch_l.value and cur_time - sling_l_trigger_time > SLING_TRIGGER_TIME:
-        sling_l_trigger_time = cur_time + SLING_TRIGGER_TIME
-        sling_solenoid_l.value = True
-        send_uart("SLG L")
-    if sling_switch_r.value and cur_time > sling_r_trigger_time + SLING_TRIGGER_TIME:
-        sling_r_trigger_time = cur_time + SLING_TRIGGER_TIME
-        sling_solenoid_r.value = True
-        send_uart("SLG R")
-
-    # Turn off slingshots after a delay
-    if cur_time > sling_l_trigger_time:
-        sling_solenoid_l.value = False
-    if cur_time > sling_r_trigger_time:
-        sling_solenoid_r.value = False
-    
-    # Update drain solenoid
-    if not ir_drain.value and cur_time - drain_debounce_time > DRAIN_SIGNAL_DEBOUNCE_TIME:
+    for i in range(len(sling_switches)):
+        if sling_ready[i] and sling_switches[i].value:
+            sling_ready[i] = False
+            sling_solenoids[i].value = True
+            scheduler.start(sling_off_timers[i], SLING_TRIGGER_TIME, cur_time)
+            send_uart("SLG " + SLING_NAMES[i])
+
+    # Update drain sensor
+    if drain_ready and not ir_drain.value:
         # Only do this once per drain event, by waiting 5 secs after the last drain
         print("drain sensor")
-        drain_debounce_time = cur_time
+        drain_ready = False
+        scheduler.start(drain_rearm_timer, DRAIN_SIGNAL_DEBOUNCE_TIME, cur_time)
         send_uart("DRN")
-    if reload_solenoid_timer and cur_time - reload_solenoid_timer > DRAIN_TRIGGER_TIME:
-        reload_solenoid.value = False
-        reload_solenoid_timer = None
-    
-    # Update hyperspace solenoid
-    if not ir_hyperspace.value and sol_hyperspace_trigger_time + HYPERSPACE_TRIGGER_TIME * 3 < cur_time:
+
+    # Update hyperspace sensor
+    if hyperspace_ready and not ir_hyperspace.value:
         send_uart("HYP")
-        sol_hyperspace_trigger_time = cur_time + HYPERSPACE_DELAY_TIME
-    if cur_time > sol_hyperspace_trigger_time and cur_time < sol_hyperspace_trigger_time + HYPERSPACE_TRIGGER_TIME:
-        print("Firing hyperspace solenoid")
-        hyperspace_solenoid.value = True
-    else:
-        hyperspace_solenoid.value = False
+        hyperspace_ready = False
+        scheduler.start(hyperspace_fire_timer, HYPERSPACE_DELAY_TIME, cur_time)
+    profiler.lap(PROFILE_SWITCHES)
 
     # Update pop bumpers
+    thresholds = pop_bumper_calibration.thresholds
     for i in range(3):
-        val = pop_bumper_pins[i].value
-        pop_bumper_vals[i].append(val)
-        pop_bumper_vals[i].pop(0)
-        avg_val = sum(pop_bumper_vals[i]) / len(pop_bumper_vals[i])
-        if avg_val > max_pb_val[i]:
+        if pop_bumper_filter.add(i, pop_bumper_pins[i].value) > thresholds[i]:
             pb_debounce_counter[i] += 1
             if pb_debounce_counter[i] > POP_BUMPER_DEBOUNCE_COUNT:
                 pop_bumper_out_pins[i].value = True
                 pop_bumper_signals[i] = False
-                pop_bumper_fire_time[i] = cur_time
+                # Released POP_BUMPER_TRIGGER_TIME after the sensor last read above the threshold
+                scheduler.start(pop_bumper_off_timers[i], POP_BUMPER_TRIGGER_TIME, cur_time)
         else:
-            if POP_BUMPER_TRIGGER_TIME + pop_bumper_fire_time[i] < cur_time:
-                pop_bumper_out_pins[i].value = False
-                pop_bumper_signals[i] = True
             pb_debounce_counter[i] -= POP_BUMPER_DEBOUNCE_DECREMENT
             if pb_debounce_counter[i] < 0:
                 pb_debounce_counter[i] = 0
@@ -357,29 +455,25 @@ while True:
         if pop_bumper_signals_debounced[i].fell:
             print("Firing pop bumper #", i)
             send_uart("PB " + str(i+1))
+    # Calibration is fed this pass's readings, so the flippers never wait on it
+    if pop_bumper_calibration.update():
+        pop_bumpers_calibrated()
+    profiler.lap(PROFILE_POP_BUMPERS)
 
     # Update drop targets
-    for i in range(len(drop_target_debouncers)):
-        drop_target_debouncers[i].update()  # Update debouncers
-        if drop_target_debouncers[i].rose:
+    event = drop_target_switches.next_event()
+    while event is not None:
+        if event.released:
             print("Drop target down")
-            send_uart("DT " + str(i))
-    if drop_target_switch_1.value and drop_target_switch_2.value and drop_target_switch_3.value and drop_target_state == DROP_TARGET_STATE_NONE:
+            send_uart("DT " + str(event.key_number))
+        event = drop_target_switches.next_event()
+    if not any(drop_target_switches.pressed) and drop_target_state == DROP_TARGET_STATE_NONE:
         print("All switches down, raising servos")
         send_uart("DTR")
-        drop_target_state = DROP_TARGET_STATE_WAIT
-        drop_target_start_time = cur_time
-    elif drop_target_state == DROP_TARGET_STATE_WAIT and cur_time > drop_target_start_time + DROP_TARGET_WAIT_TIME:
-        drop_target_servo.angle = DROP_TARGET_UP_ANGLE
-        drop_target_state = DROP_TARGET_STATE_UP
-        drop_target_start_time = cur_time
-    elif drop_target_state == DROP_TARGET_STATE_UP and cur_time > drop_target_start_time + DROP_TARGET_UP_TIME:
-        drop_target_servo.angle = DROP_TARGET_DOWN_ANGLE
-        drop_target_state = DROP_TARGET_STATE_DOWN
-        drop_target_start_time = cur_time
-    elif drop_target_state == DROP_TARGET_STATE_DOWN and cur_time > drop_target_start_time + DROP_TARGET_DOWN_TIME:
-        drop_target_servo.angle = None
-        drop_target_state = DROP_TARGET_STATE_NONE
+        reset_drop_targets(cur_time)
+    profiler.lap(PROFILE_DROP_TARGETS)
     
-    while uart.in_waiting > 0:
-        readline()
+    readline()
+    uart_tx.service(cur_time)
+    uart_upgrade.update(cur_time)
+    profiler.lap(PROFILE_UART)
@@ -0,0 +1,180 @@
+"""Parsing for the text commands the boards send each other over UART.
+
+A line looks like `CMD arg arg\\r\\n`. Command.parse() tokenizes a received
+buffer in place. It records where each token starts and ends, and packs
+the command name into an integer key. Matching a command and reading its
+integer arguments therefore never creates strings or lists.
+"""
+
+MAX_COMMAND_LEN = 4  # Longer names don't fit in a small int key
+MAX_ARGS = 4
+NO_COMMAND = -1
+
+
+def command_key(name, start=0, end=None):
+    """Pack a command name of up to MAX_COMMAND_LEN ASCII bytes into an int.
+
+    Returns NO_COMMAND if the name is too long or isn't printable ASCII.
+    """
+    if end is None:
+        end = len(name)
+    if end - start > MAX_COMMAND_LEN:
+        return NO_COMMAND
+    key = 0
+    for i in range(start, end):
+        b = name[i]
+        if b <= 32 or b >= 127:
+            return NO_COMMAND
+        key = (key << 7) | b
+    return key
+
+
+# Every command used between the boards
+CMD_ACC = command_key(b"ACC")  # Mission accepted
+CMD_BIN = command_key(b"BIN")  # Switch this link to binary frames, at baud rate <n>
+CMD_BOK = command_key(b"BOK")  # Switch to binary frames at baud rate <n> accepted
+CMD_BTN = command_key(b"BTN")  # Mission select button <n> pressed
+CMD_CAL = command_key(b"CAL")  # Pop bumpers calibrated
+CMD_DRN = command_key(b"DRN")  # Ball drained
+CMD_DT = command_key(b"DT")    # Drop target <n> down
+CMD_DTR = command_key(b"DTR")  # Drop targets reset
+CMD_FLD = command_key(b"FLD")  # Left flipper down
+CMD_FLU = command_key(b"FLU")  # Left flipper up
+CMD_FRD = command_key(b"FRD")  # Right flipper down
+CMD_FRU = command_key(b"FRU")  # Right flipper up
+CMD_GOV = command_key(b"GOV")  # Game over
+CMD_HYP = command_key(b"HYP")  # Hyperspace launch
+CMD_INI = command_key(b"INI")  # Board <name> initialized
+CMD_IR = command_key(b"IR")    # Re-entry IR sensor <n> triggered
+CMD_MSN = command_key(b"MSN")  # Mission <n> completed
+CMD_MUS = command_key(b"MUS")  # Music <on/off>
+CMD_PB = command_key(b"PB")    # Pop bumper <n> hit
+CMD_PNT = command_key(b"PNT")  # Points scored
+CMD_RLD = command_key(b"RLD")  # Reload ball
+CMD_RNK = command_key(b"RNK")  # Rank changed to <n>
+CMD_RST = command_key(b"RST")  # New game
+CMD_SLG = command_key(b"SLG")  # Slingshot <L/R> hit
+CMD_SND = command_key(b"SND")  # Play sound <n>
+CMD_STA = command_key(b"STA")  # Send back profiling stats, after turning profiling on/off if given <1/0>
+CMD_STR = command_key(b"STR")  # A line of profiling stats
+
+
+class Command:
+    """A command line parsed in place from a receive buffer.
+
+    One Command is reused for every line, and it keeps referring to the
+    buffer it was parsed from. Read its arguments before that buffer is
+    refilled.
+    """
+
+    def __init__(self):
+        self.buf = b""
+        self.length = 0
+        self.key = NO_COMMAND
+        self.argc = 0
+        self._name_start = 0
+        self._name_end = 0
+        self._starts = [0] * MAX_ARGS
+        self._ends = [0] * MAX_ARGS
+
+    def parse(self, buf, length=None):
+        """Parse the first length bytes of buf. Returns False for a blank line."""
+        if length is None:
+            length = len(buf)
+        self.buf = buf
+        self.length = length
+        self.key = NO_COMMAND
+        tokens = 0
+        pos = 0
+        while True:
+            # Tokens are split on whitespace and control characters, like str.split()
+            while pos < length and buf[pos] <= 32:
+                pos += 1
+            if pos >= length:
+                break
+            start = pos
+            while pos < length and buf[pos] > 32:
+                pos += 1
+            if tokens == 0:
+                self._name_start = start
+                self._name_end = pos
+                self.key = command_key(buf, start, pos)
+            elif tokens <= MAX_ARGS:
+                self._starts[tokens - 1] = start
+                self._ends[tokens - 1] = pos
+            tokens += 1
+        self.argc = min(tokens - 1, MAX_ARGS) if tokens > 0 else 0
+        return tokens > 0
+
+    def int_arg(self, i, default=0):
+        """Return argument i as an int, or default if it's missing or not a number."""
+        if i >= self.argc:
+            return default
+        buf = self.buf
+        pos = self._starts[i]
+        end = self._ends[i]
+        negative = buf[pos] == 45  # '-'
+        if negative:
+            pos += 1
+            if pos == end:
+                return default
+        value = 0
+        while pos < end:
+            digit = buf[pos] - 48  # '0'
+            if digit < 0 or digit > 9:
+                return default
+            value = value * 10 + digit
+            pos += 1
+        return -value if negative else value
+
+    def arg_equals(self, i, text, ignore_case=False):
+        """Return True if argument i is exactly the bytes in text (which must be uppercase with ignore_case)."""
+        if i >= self.argc:
+            return False
+        start = self._starts[i]
+        if self._ends[i] - start != len(text):
+            return False
+        buf = self.buf
+        for j in range(len(text)):
+            b = buf[start + j]
+            if ignore_case and 97 <= b <= 122:  # Lowercase ASCII
+                b -= 32
+            if b != text[j]:
+                return False
+        return True
+
+    def arg_str(self, i):
+        """Return argument i as a str, or None if it's missing. Allocates, so keep it off hot paths."""
+        if i >= self.argc:
+            return None
+        return "".join([chr(b) for b in self.buf[self._starts[i]:self._ends[i]]])
+
+    def name(self):
+        """Return the command name as a str, for logging."""
+        return "".join([chr(b) for b in self.buf[self._name_start:self._name_end]])
+
+    def text(self):
+        """Return the whole line as a str, for logging."""
+        return "".join([chr(b) for b in self.buf[:self.length]])
+
+
+class CommandTable:
+    """Routes parsed commands to handler functions.
+
+    Build it from a dict of command names (bytes) to handlers. Each handler
+    is called with the Command, followed by any extra arguments passed to
+    dispatch().
+    """
+
+    def __init__(self, handlers):
+        self._handlers = {}
+        for name, handler in handlers.items():
+            self._handlers[command_key(name)] = handler
+
+    def dispatch(self, command, *args):
+        """Call the handler for a command. Returns False if there isn't one."""
+        handler = self._handlers.get(command.key)
+        if handler is None:
+            return False
+        handler(command, *args)
+        return True
@@ -0,0 +1,55 @@
+"""Pop bumper sensor calibration.
+
+Each pop bumper's trigger threshold is set a margin above the highest
+filtered reading seen while nothing is hitting it. Rather than reading
+the sensors in a loop of its own, which would hold up the flippers,
+calibration watches the sums the main loop's pop bumper check already
+takes, one reading per bumper per pass.
+"""
+
+SAMPLE_MAX = 65535  # AnalogIn.value's full scale
+
+
+class PopBumperCalibration:
+    """Works out trigger thresholds from the sums an AnalogFilter is fed.
+
+    Until the first calibration completes, every threshold is above any
+    sum the filter can reach, so the pop bumpers stay off. While a later
+    calibration runs, the previous thresholds stay in use.
+    """
+
+    def __init__(self, pop_bumper_filter, num_samples, margin):
+        self.filter = pop_bumper_filter
+        self.num_samples = num_samples  # Readings per bumper to calibrate from
+        self.margin = pop_bumper_filter.sum_threshold(margin)
+        uncalibrated = pop_bumper_filter.sum_threshold(SAMPLE_MAX)
+        self.thresholds = [uncalibrated] * pop_bumper_filter.num_channels
+        self._max = [0] * pop_bumper_filter.num_channels
+        self.remaining = 0
+
+    @property
+    def active(self):
+        """True while a calibration is running."""
+        return self.remaining > 0
+
+    def start(self):
+        """Start calibrating from the next readings."""
+        self.remaining = self.num_samples
+        for i in range(len(self._max)):
+            self._max[i] = 0
+
+    def update(self):
+        """Take in the filter's latest sums. Returns True when that completes the calibration."""
+        if self.remaining <= 0:
+            return False
+        sums = self.filter.sums
+        calibration_max = self._max
+        for i in range(len(calibration_max)):
+            if sums[i] > calibration_max[i]:
+                calibration_max[i] = sums[i]
+        self.remaining -= 1
+        if self.remaining:
+            return False
+        for i in range(len(calibration_max)):
+            self.thresholds[i] = calibration_max[i] + self.margin
+        return True
@@ -0,0 +1,56 @@
+from ticks import ticks_add, ticks_diff
+
+
+class Timer:
+    """A callback to run once a deadline passes.
+
+    The callback is passed the tick it actually ran at, so a follow-up timer
+    started from it (e.g. turning a coil back off) is measured from when the
+    output really changed.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.deadline = None
+
+    @property
+    def armed(self):
+        """True while the timer is waiting to fire."""
+        return self.deadline is not None
+
+
+class Scheduler:
+    """Runs timer callbacks once their deadlines pass.
+
+    Armed timers are kept sorted by deadline, so a tick with nothing due is a
+    single comparison no matter how many timers are armed.
+    """
+
+    def __init__(self):
+        self._armed = []
+
+    def start(self, timer, delay, now):
+        """Arm a timer to fire delay ms after now, replacing any earlier deadline."""
+        if timer.deadline is not None:
+            self._armed.remove(timer)
+        deadline = ticks_add(now, delay)
+        timer.deadline = deadline
+        # Insert after every timer due at or before the new deadline
+        i = len(self._armed)
+        while i > 0 and ticks_diff(self._armed[i - 1].deadline, deadline) > 0:
+            i -= 1
+        self._armed.insert(i, timer)
+
+    def cancel(self, timer):
+        """Disarm a timer without running its callback."""
+        if timer.deadline is not None:
+            self._armed.remove(timer)
+            timer.deadline = None
+
+    def run(self, now):
+        """Run the callback of every timer whose deadline has been reached."""
+        armed = self._armed
+        while armed and ticks_diff(now, armed[0].deadline) >= 0:
+            timer = armed.pop(0)
+            timer.deadline = None
+            timer.callback(now)
@@ -0,0 +1,59 @@
+"""Boot steps run side by side as cooperative tasks.
+
+Much of booting is waiting: for the audio FX board to come out of reset,
+for the SD card to answer. Run one after another, those waits add up.
+Each stage here is a generator that does a step of its work and yields
+whenever it would otherwise wait, and BootStages takes turns stepping
+every stage until all of them are done, so one stage's waits are spent
+on the others' work.
+
+A stage can't be interrupted in the middle of a step, so a step that
+blocks (mounting the SD card, say) still holds up the rest for as long
+as it takes.
+"""
+
+from ticks import ticks_ms, ticks_diff
+
+
+class BootStages:
+    """Runs named generator stages round robin and times each one."""
+
+    def __init__(self, start):
+        self.start = start      # ticks_ms() when booting started, which finish times are measured from
+        self._names = []
+        self._tasks = []
+        self.busy = []          # ms each stage spent running its steps
+        self.finished = []      # ms from start to when each stage was done, or None while it's running
+
+    def add(self, name, task):
+        """Add a stage, a generator that yields whenever it's waiting on something."""
+        self._names.append(name)
+        self._tasks.append(task)
+        self.busy.append(0)
+        self.finished.append(None)
+
+    def run(self, idle=None):
+        """Step every stage in turn until they're all done, calling idle() after each round."""
+        running = list(range(len(self._tasks)))
+        while running:
+            for i in list(running):
+                step_start = ticks_ms()
+                try:
+                    next(self._tasks[i])
+                    done = False
+                except StopIteration:
+                    done = True
+                now = ticks_ms()
+                self.busy[i] += ticks_diff(now, step_start)
+                if done:
+                    self.finished[i] = ticks_diff(now, self.start)
+                    print(f"Boot stage {self._names[i]} done at {self.finished[i]}ms, busy {self.busy[i]}ms")
+                    running.remove(i)
+            if idle is not None:
+                idle()
+
+    def report(self):
+        """Return each stage's finish and busy times as text."""
+        return " ".join(
+            [f"{self._names[i]}={self.finished[i]}ms/{self.busy[i]}ms" for i in range(len(self._names))]
+        )
@@ -3,12 +3,19 @@ import busio
 import digitalio
 import adafruit_sdcard
 import storage
-import audiomp3
 import audiopwmio
-import time
 import countio
 from audiocore import WaveFile
-from adafruit_debouncer import Debouncer
+from switches import Switches
+from protocol import Command, CommandTable
+from uartlink import LineReader, LinkUpgrade, TxQueue
+from profiler import Profiler
+from ticks import ticks_ms, ticks_add, ticks_diff, ticks_expired
+from fx_board import FXBoard, PRIORITY_CRITICAL, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+from sfx_mixer import SoundMixer, sound_files
+from sound_bank import SoundBank, SoundBankError
+from music import MusicLoop
+from boot_stages import BootStages
 import random
 import neopixel
 from adafruit_led_animation.animation.rainbowcomet import RainbowComet
@@ -22,7 +29,6 @@ from adafruit_led_animation import helper
 
 # Constants
 RE_ENTRY_SOUND = 18
-PLAY_STOP_TIMER_AMOUNT = 5
 SHOOT_SOUND = 31
 SHOOT_SOUND_2 = 32
 SHOOT_SOUND_3 = 38
@@ -33,6 +39,50 @@ GAME_OVER_SOUND = 28
 MISSION_COMPLETE_PROMOTION_SOUND = 35
 MISSION_ACCEPTED_SOUND = 16
 MISSION_COMPLETE_SOUND = 6
+BONUS_AWARDED_SOUND = 33
+HYPERSPACE_LAUNCH_SOUND = 24
+HYPERSPACE_JACKPOT_SOUND = 25
+HYPERSPACE_EXTRA_BALL_SOUND = 26
+HYPERSPACE_GRAVITY_WELL_SOUND = 27
+FLIPPER_SOUND = 3
+SLINGSHOT_SOUND = 7
+FLIPPER_SOUND_2 = 10
+CENTERPOST_BUMP_SOUND = 23
+FLIPPER_SOUND_3 = 39
+FLIPPER_SOUND_4 = 40
+# A sound can cut off a playing one of the same or a lower priority, but not a higher one.
+# Anything not listed is PRIORITY_LOW.
+SOUND_PRIORITIES = {
+    STARTUP_SOUND: PRIORITY_CRITICAL,
+    BALL_DRAINED_SOUND: PRIORITY_CRITICAL,
+    GAME_OVER_SOUND: PRIORITY_CRITICAL,
+    MISSION_COMPLETE_PROMOTION_SOUND: PRIORITY_CRITICAL,
+    MISSION_ACCEPTED_SOUND: PRIORITY_HIGH,
+    MISSION_COMPLETE_SOUND: PRIORITY_HIGH,
+    HYPERSPACE_JACKPOT_SOUND: PRIORITY_HIGH,
+    HYPERSPACE_EXTRA_BALL_SOUND: PRIORITY_HIGH,
+    HYPERSPACE_LAUNCH_SOUND: PRIORITY_NORMAL,
+    HYPERSPACE_GRAVITY_WELL_SOUND: PRIORITY_NORMAL,
+    BONUS_AWARDED_SOUND: PRIORITY_NORMAL,
+    RE_ENTRY_SOUND: PRIORITY_NORMAL,
+    SHOOT_SOUND: PRIORITY_NORMAL,
+    SHOOT_SOUND_2: PRIORITY_NORMAL,
+    SHOOT_SOUND_3: PRIORITY_NORMAL,
+}
+# Short sounds played over and over, loaded into RAM at startup so they start without touching the SD card
+SFX_PRELOAD = [
+    FLIPPER_SOUND, FLIPPER_SOUND_2, FLIPPER_SOUND_3, FLIPPER_SOUND_4,
+    SLINGSHOT_SOUND, CENTERPOST_BUMP_SOUND,
+]
+SFX_DIRECTORY = "/sd/sfx"  # SOUND<n + 1>.WAV files played on this board, 16-bit in the music's format
+MUSIC_FILE = "/sd/PINBALL.mp3"  # Sets the mixer's sample rate and channel count
+SFX_BANK = "/sd/SFX.BNK"  # Short effects packed by util/sound_bank, read without opening a file each
+
+FX_BOOT_TIMEOUT = 2000  # ms to wait for the audio FX board's startup messages after a reset
+
+boot_start = ticks_ms()
+boot_ini_ms = None
+boot_main_loop_ms = None
 
 # Init audio PWM out
 print("Initializing audio PWM out...")
@@ -53,13 +103,14 @@ ANIM_STATE_RANKUP_IN_PROGRESS = 6
 ANIM_STATE_MISSION_COMPLETE = 7
 ANIM_STATE_RANKUP_COMPLETE = 8
 anim_flash_time = 0
-MISSION_COMPLETE_FLASH_TIME = 2.0
+MISSION_COMPLETE_FLASH_TIME = 2000  # ms
 led_anim_state = ANIM_STATE_LAUNCHING
 
 # Next, init board perimeter neopixels to light up the board
 print("Initializing neopixel perimeter...")
 drained_time = 0
-DRAINED_SOUND_LEN = 2.5
+DRAINED_SOUND_LEN = 2500  # ms
+RING_UPDATE_DELAY = 125  # ms
 pixel_pin = board.GP1
 num_pixels = 39
 ORDER = neopixel.GRB
@@ -67,16 +118,12 @@ pixels_perimeter = neopixel.NeoPixel(
     # Tell it there's one more pixel than there actually is so the animations line up properly
     pixel_pin, num_pixels+1, brightness=0.25, auto_write=False, pixel_order=ORDER
 )
-pixels_perimeter.fill((0, 136, 255))  # Init neopixel color is a dark blue
-pixels_perimeter.show()
 
 # Initialize neopixel ring
 print("Initializing neopixel ring...")
 pixels_ring = neopixel.NeoPixel(
     board.GP2, 24+12+1, brightness=0.75, auto_write=False, pixel_order=ORDER
 )
-pixels_ring.fill((0, 136, 255))
-pixels_ring.show()
 
 # Create neopixel animations
 print("Setting up neopixel animations...")
@@ -106,9 +153,10 @@ ring_inner_blink_anim = Blink(pixels_ring, speed=0.125, color=INNER_RING_COLOR,
 ring_center_blink_anim = Blink(pixels_ring, speed=0.5, color=INNERMOST_CENTER_COLOR, num_pixels=1, pixel_start=CENTERMOST_PIXEL)
 
 # Setup globals
-playing = False
-playing_stop_timer = 0
 uart = None
+fx_reader = None
+sounds = None
+music = None
 num_complete_missions = 0
 cur_rank = 0
 
@@ -118,268 +166,344 @@ led = digitalio.DigitalInOut(board.GP25)
 led.direction = digitalio.Direction.OUTPUT
 led.value = True
 
-def readline(uart_bus):
-    """Read a line from the UART bus and print it to console."""
-    global playing
-    global playing_stop_timer
-    data = uart_bus.readline()
-    if data is not None:
-        # convert bytearray to string
-        data_string = ''.join([chr(b) for b in data])
-        if "done" in data_string and playing_stop_timer <= 0:
-            playing = False
-        print(data_string, end="")
-
-
-def readline_comm(uart_recv):
-    """Read a line from the UART bus and print it to console."""
-    global uart
-    global audio
-    global decoder
+def handle_sound(command):
+    """SND <sound_num> - Play specified sound."""
+    sound_num = command.int_arg(0)
+    print("Got sound to play: ", sound_num)
+    play_sound(sound_num)
+
+def handle_reset(command):
+    """RST - Reset and start new game."""
+    global led_anim_state
+    global drained_time
+    print("Got reset command")
+    play_sound(STARTUP_SOUND)
+    led_anim_state = ANIM_STATE_LAUNCHING
+    drained_time = 0
+    pixels_perimeter.fill((0, 0, 0))
+    pixels_perimeter.show()
+    pixels_ring.fill((15, 255, 120))
+    pixels_ring.show()
+
+def handle_music(command):
+    """MUS <on/off> - Turn music on/off."""
+    if command.arg_equals(0, b"ON", ignore_case=True):
+        print("Turning music on")
+        if music is not None:
+            music.start(ticks_ms())
+    elif command.arg_equals(0, b"OFF", ignore_case=True):
+        print("Turning music off")
+        if music is not None:
+            music.stop()
+    else:
+        print("Invalid MUS command")
+
+def handle_drain(command):
+    """DRN - Ball drained."""
     global led_anim_state
-    global ring_twinkle_anim
-    global perimeter_red_pulse_anim
-    global ring_red_pulse_anim
-    global pixels_perimeter
-    global pixels_ring
     global drained_time
+    play_sound(BALL_DRAINED_SOUND)
+    led_anim_state = ANIM_STATE_DRAINED
+    pixels_perimeter.fill((176, 13, 0))  # Drain neopixel color is a dark red
+    pixels_perimeter.show()
+    pixels_ring.fill((176, 13, 0))
+    pixels_ring.show()
+    # Delay and then reset animation
+    drained_time = ticks_ms()
+
+def handle_points(command):
+    """PNT - Points scored."""
+    global led_anim_state
+    # In case IR sensors don't trigger, cancel the launching animation as soon as anything else happens
+    if led_anim_state == ANIM_STATE_LAUNCHING:
+        # Cancel ball launching animation
+        led_anim_state = ANIM_STATE_PLAYING
+        pixels_perimeter.fill((255, 255, 255))
+        pixels_perimeter.show()
+        # Show center lights for current state
+        for i in range(24):
+            if i < num_complete_missions * 8:
+                pixels_ring[i] = OUTER_RING_COLOR
+            else:
+                pixels_ring[i] = (0, 0, 0)
+        for i in range(12):
+            if i < cur_rank + 1:
+                pixels_ring[i+24] = INNER_RING_COLOR
+            else:
+                pixels_ring[i+24] = (0, 0, 0)
+        pixels_ring[CENTERMOST_PIXEL] = (0, 0, 0)
+        pixels_ring.show()
+
+def handle_game_over(command):
+    """GOV - Game over."""
+    global led_anim_state
     global num_complete_missions
     global cur_rank
-    global ring_outer_spin_anim
-    global ring_inner_spin_anim
+    play_sound(GAME_OVER_SOUND)
+    led_anim_state = ANIM_STATE_GAME_OVER
+    pixels_perimeter.fill((0, 0, 0))
+    pixels_perimeter.show()
+    pixels_ring.fill((0, 0, 0))
+    pixels_ring.show()
+    ring_twinkle_anim.reset()
+    perimeter_red_pulse_anim.reset()
+    ring_red_pulse_anim.reset()
+    num_complete_missions = 0
+    cur_rank = 0
+    # Update spin anims length
+    ring_inner_spin_anim._size = 1
+    ring_inner_spin_anim._spacing = 11
+    ring_outer_spin_anim._size = 0
+    ring_outer_spin_anim._spacing = 24
+
+def handle_mission_accepted(command):
+    """ACC - Mission accepted."""
+    global led_anim_state
+    play_sound(MISSION_ACCEPTED_SOUND)
+    ring_outer_spin_anim.reset()
+    if num_complete_missions == 2:
+        led_anim_state = ANIM_STATE_RANKUP_IN_PROGRESS
+        ring_inner_spin_anim.reset()
+    else:
+        led_anim_state = ANIM_STATE_MISSION_IN_PROGRESS
+
+def handle_mission_complete(command):
+    """MSN <num_complete_missions> - Mission completed."""
+    global led_anim_state
+    global num_complete_missions
     global anim_flash_time
-    data = uart_recv.readline()
-    if data is not None:
-        # convert bytearray to string
-        data_string = ''.join([chr(b) for b in data])
-        command_list = data_string.split()
-        if len(command_list) > 0:
-            command = command_list[0]
-            if command == 'SND':
-                # SND <sound_num> - Play specified sound
-                sound_num = command_list[1]
-                print("Got sound to play: ", sound_num, end="")
-                play_sound(uart, int(sound_num))
-            elif command == 'RST':
-                # RST - Reset and start new game
-                print("Got reset command")
-                play_sound(uart, STARTUP_SOUND)
-                led_anim_state = ANIM_STATE_LAUNCHING
-                drained_time = 0
-                pixels_perimeter.fill((0, 0, 0))
-                pixels_perimeter.show()
-                pixels_ring.fill((15, 255, 120))
-                pixels_ring.show()
-            elif command == 'MUS':
-                # MUS <on/off> - Turn music on/off
-                on_off = command_list[1]
-                if on_off.upper() == 'ON':
-                    print("Turning music on")
-                    audio.play(decoder)
-                elif on_off.upper() == 'OFF':
-                    print("Turning music off")
-                    audio.stop()
-                else:
-                    print("Invalid MUS command")
-            elif command == 'DRN':
-                play_sound(uart, BALL_DRAINED_SOUND)
-                led_anim_state = ANIM_STATE_DRAINED
-                pixels_perimeter.fill((176, 13, 0))  # Drain neopixel color is a dark red
-                pixels_perimeter.show()
-                pixels_ring.fill((176, 13, 0))
-                pixels_ring.show()
-                # Delay and then reset animation
-                drained_time = time.monotonic()
-            elif command == 'PNT':
-                # In case IR sensors don't trigger, cancel the launching animation as soon as anything else happens
-                if led_anim_state == ANIM_STATE_LAUNCHING:
-                    # Cancel ball launching animation
-                    led_anim_state = ANIM_STATE_PLAYING
-                    pixels_perimeter.fill((255, 255, 255))
-                    pixels_perimeter.show()
-                    # Show center lights for current state
-                    for i in range(24):
-                        if i < num_complete_missions * 8:
-                            pixels_ring[i] = OUTER_RING_COLOR
-                        else:
-                            pixels_ring[i] = (0, 0, 0)
-                    for i in range(12):
-                        if i < cur_rank + 1:
-                            pixels_ring[i+24] = INNER_RING_COLOR
-                        else:
-                            pixels_ring[i+24] = (0, 0, 0)
-                    pixels_ring[CENTERMOST_PIXEL] = (0, 0, 0)
-                    pixels_ring.show()
-            elif command == 'GOV':
-                # Game over
-                play_sound(uart, GAME_OVER_SOUND)
-                led_anim_state = ANIM_STATE_GAME_OVER
-                pixels_perimeter.fill((0, 0, 0))
-                pixels_perimeter.show()
-                pixels_ring.fill((0, 0, 0))
-                pixels_ring.show()
-                ring_twinkle_anim.reset()
-                perimeter_red_pulse_anim.reset()
-                ring_red_pulse_anim.reset()
-                num_complete_missions = 0
-                cur_rank = 0
-                # Update spin anims length
-                ring_inner_spin_anim._size = 1
-                ring_inner_spin_anim._spacing = 11
-                ring_outer_spin_anim._size = 0
-                ring_outer_spin_anim._spacing = 24
-            elif command == 'ACC':
-                play_sound(uart, MISSION_ACCEPTED_SOUND)
-                ring_outer_spin_anim.reset()
-                if num_complete_missions == 2:
-                    led_anim_state = ANIM_STATE_RANKUP_IN_PROGRESS
-                    ring_inner_spin_anim.reset()
-                else:
-                    led_anim_state = ANIM_STATE_MISSION_IN_PROGRESS
-            elif command == 'MSN':
-                # Mission completed
-                play_sound(uart, MISSION_COMPLETE_SOUND)
-                led_anim_state = ANIM_STATE_MISSION_COMPLETE
-                for i in range(24):
-                    pixels_ring[i] = (0, 0, 0)
-                pixels_ring.show()
-                # Update anims length
-                num_complete_missions = int(command_list[1])
-                ring_outer_spin_anim._size = 8 * num_complete_missions
-                ring_outer_spin_anim._spacing = 24 - ring_outer_spin_anim._size
-                ring_outer_blink_anim._num_pixels = 8 * num_complete_missions
-                ring_outer_blink_anim.reset()
-                anim_flash_time = time.monotonic()
-            elif command == 'RNK':
-                # Rank changed
-                play_sound(uart, MISSION_COMPLETE_PROMOTION_SOUND)
-                led_anim_state = ANIM_STATE_RANKUP_COMPLETE
-                ring_inner_blink_anim.reset()
-                ring_outer_blink_anim.reset()
-                anim_flash_time = time.monotonic()
-                # Flashing anim for new rank
-                for i in range(24+12):
-                    pixels_ring[i] = (0, 0, 0)
-                pixels_ring.show()
-                cur_rank = int(command_list[1])
-                num_complete_missions = 0
-                ring_inner_blink_anim._num_pixels = cur_rank + 1
-                ring_inner_blink_anim.reset()
-                # Update spin anims length
-                ring_inner_spin_anim._size = cur_rank + 1
-                ring_inner_spin_anim._spacing = 12 - ring_inner_spin_anim._size
-                ring_outer_spin_anim._size = 0
-                ring_outer_spin_anim._spacing = 24
-            else:
-                print(f'Unknown command: {command}')
+    play_sound(MISSION_COMPLETE_SOUND)
+    led_anim_state = ANIM_STATE_MISSION_COMPLETE
+    for i in range(24):
+        pixels_ring[i] = (0, 0, 0)
+    pixels_ring.show()
+    # Update anims length
+    num_complete_missions = command.int_arg(0)
+    ring_outer_spin_anim._size = 8 * num_complete_missions
+    ring_outer_spin_anim._spacing = 24 - ring_outer_spin_anim._size
+    ring_outer_blink_anim._num_pixels = 8 * num_complete_missions
+    ring_outer_blink_anim.reset()
+    anim_flash_time = ticks_ms()
+
+def handle_rank(command):
+    """RNK <rank> - Rank changed."""
+    global led_anim_state
+    global num_complete_missions
+    global cur_rank
+    global anim_flash_time
+    play_sound(MISSION_COMPLETE_PROMOTION_SOUND)
+    led_anim_state = ANIM_STATE_RANKUP_COMPLETE
+    ring_inner_blink_anim.reset()
+    ring_outer_blink_anim.reset()
+    anim_flash_time = ticks_ms()
+    # Flashing anim for new rank
+    for i in range(24+12):
+        pixels_ring[i] = (0, 0, 0)
+    pixels_ring.show()
+    cur_rank = command.int_arg(0)
+    num_complete_missions = 0
+    ring_inner_blink_anim._num_pixels = cur_rank + 1
+    ring_inner_blink_anim.reset()
+    # Update spin anims length
+    ring_inner_spin_anim._size = cur_rank + 1
+    ring_inner_spin_anim._spacing = 12 - ring_inner_spin_anim._size
+    ring_outer_spin_anim._size = 0
+    ring_outer_spin_anim._spacing = 24
+
+def handle_binary(command):
+    """BIN <baud> - Display controller offered to switch our link to binary frames."""
+    print("Switching comm UART to binary frames")
+    comm_upgrade.accept(command, ticks_ms())
+
+def handle_binary_accepted(command):
+    """BOK <baud> - Display controller switched our link to binary frames."""
+    comm_upgrade.confirmed(command, ticks_ms())
+
+def handle_stats(command):
+    """STA [1/0] - Send back main loop profiling stats, turning profiling on or off first if asked."""
+    if command.argc > 0:
+        profiler.enabled = command.int_arg(0) != 0
+        profiler.reset()
+    lines = profiler.report() + [fx.report(), boot_report()]
+    if sounds is not None:
+        lines.append(sounds.report())
+        lines.append(music.report())
+    for line in lines:
+        send_uart("STR " + line)
+
+comm_commands = CommandTable({
+    b"SND": handle_sound,
+    b"RST": handle_reset,
+    b"MUS": handle_music,
+    b"DRN": handle_drain,
+    b"PNT": handle_points,
+    b"GOV": handle_game_over,
+    b"ACC": handle_mission_accepted,
+    b"MSN": handle_mission_complete,
+    b"RNK": handle_rank,
+    b"BIN": handle_binary,
+    b"BOK": handle_binary_accepted,
+    b"STA": handle_stats,
+})
+comm_command = Command()
+
+def readline_comm(reader):
+    """Run every complete command line received from the other pico so far."""
+    length = reader.readline()
+    while length:
+        if comm_command.parse(reader.line, length):
+            if not comm_commands.dispatch(comm_command):
+                print(f'Unknown command: {comm_command.name()}')
+        length = reader.readline()
 
 
 def init_uart():
     """Initialize the UART bus for the audio FX board."""
+    global fx_reader
     # Init UART serial for audio fx board
-    uart = busio.UART(board.GP16, board.GP17, baudrate=9600, timeout=0.5)
+    uart = busio.UART(board.GP16, board.GP17, baudrate=9600, timeout=0)
+    fx_reader = LineReader(uart)
+    return uart
+
+
+def reset_fx_board():
+    """Boot stage: reset the audio FX board and wait for its startup messages."""
     rst = digitalio.DigitalInOut(board.GP18)
     rst.direction = digitalio.Direction.OUTPUT
     rst.value = False
-    time.sleep(0.01)
+    deadline = ticks_add(ticks_ms(), 10)
+    while not ticks_expired(deadline, ticks_ms()):
+        yield
     rst.value = True
     rst.direction = digitalio.Direction.INPUT
-    time.sleep(1.0)  # wait for board to boot
 
-    # Print version info
-    readline(uart)  # eat newline
-    readline(uart)  # Adafruit FX Sound Board 11/6/14
-    time.sleep(0.25)
-    readline(uart)  # FAT type
-    readline(uart)  # File count
+    # Print version info, which ends with the FAT type and file count once the board has read its flash
+    deadline = ticks_add(ticks_ms(), FX_BOOT_TIMEOUT)
+    while True:
+        length = fx_reader.readline()
+        if length:
+            print(''.join([chr(b) for b in fx_reader.line[:length]]), end="")
+            if fx_reader.line[:3] == b"FAT":
+                break
+        elif ticks_expired(deadline, ticks_ms()):
+            print("No startup messages from the audio FX board")
+            break
+        else:
+            yield
 
     # DEBUG: List tracks
     # Leaving this in because the FX board swallows the first sound play command otherwise, it seems
     uart.write(b"L\r\n")
-    return uart
+
+
+def mount_sd():
+    """Boot stage: initialize and mount the SD card."""
+    spi = busio.SPI(board.GP10, MOSI=board.GP11, MISO=board.GP12)
+    cs = digitalio.DigitalInOut(board.GP13)
+    yield
+    sdcard = adafruit_sdcard.SDCard(spi, cs)
+    yield
+    storage.mount(storage.VfsFat(sdcard), "/sd")
+
+
+def light_leds():
+    """Boot stage: light the perimeter and ring neopixels."""
+    pixels_perimeter.fill((0, 136, 255))  # Init neopixel color is a dark blue
+    pixels_perimeter.show()
+    yield
+    pixels_ring.fill((0, 136, 255))
+    pixels_ring.show()
 
 
 def init_uart_comm():
     """Initialize the UART bus for communicating with the other pico."""
-    uart = busio.UART(board.GP8, board.GP9, baudrate=9600, timeout=0.5)
+    uart = busio.UART(board.GP8, board.GP9, baudrate=9600, timeout=0)
     return uart
 
-def kill_sound():
-    """Write a line to the UART bus."""
-    global playing
-    global playing_stop_timer
-    if playing:  # Sound still playing
-        # Kill current sound
-        uart.write(b"q\r\n")
-        playing_stop_timer = PLAY_STOP_TIMER_AMOUNT
-        time.sleep(0.1)
-    playing = False
-
-def play_sound(uart, sound_num):
-    """Write a line to the UART bus."""
+def play_sound(sound_num):
+    """Play a sound, cutting off a playing one if it doesn't have a higher priority.
+
+    Sounds in SFX_BANK or with a file in SFX_DIRECTORY are mixed on this board, and the rest play on the
+    audio FX board.
+    """
     print("playing sound: ", sound_num)
-    global playing
-    if playing:
-        kill_sound()
-    # Play sound
-    sound_str = f'#{sound_num}\r\n'
-    uart.write(sound_str.encode())
-    playing = True
-
-# Initialize and mount the SD card.
-print("Initializing SD card...")
-spi = busio.SPI(board.GP10, MOSI=board.GP11, MISO=board.GP12)
-cs = digitalio.DigitalInOut(board.GP13)
-sdcard = adafruit_sdcard.SDCard(spi, cs)
-vfs = storage.VfsFat(sdcard)
-storage.mount(vfs, "/sd")
-
-# Init the audio board
-print("Initializing audio board...")
-uart = init_uart()
+    priority = SOUND_PRIORITIES.get(sound_num, PRIORITY_LOW)
+    if sounds is not None and sounds.has(sound_num):
+        sounds.play(sound_num, priority)
+    else:
+        fx.play(sound_num, priority, ticks_ms())
+
+def boot_report():
+    """Return the boot timings as a line of text."""
+    return f"boot {boot.report()} ini={boot_ini_ms}ms main_loop={boot_main_loop_ms}ms"
 
 # UART for communicating with the other pico
 print("Initializing UART for other pico...")
 uart_comm = init_uart_comm()
+comm_reader = LineReader(uart_comm)
+comm_tx = TxQueue(uart_comm)
+comm_upgrade = LinkUpgrade(comm_reader, comm_tx)
+
+# The SD card, the audio board and the neopixels start up side by side, while the startup sound plays
+print("Initializing SD card, audio board and neopixels...")
+uart = init_uart()
+boot = BootStages(boot_start)
+# The audio board first, so it's already coming out of reset while the SD card is set up
+boot.add("fx", reset_fx_board())
+boot.add("sd", mount_sd())
+boot.add("leds", light_leds())
+# Only buffer what the other pico sends until the handlers have everything they use
+boot.run(comm_reader.poll)
+fx = FXBoard(uart, fx_reader)
 
 def send_uart(str):
-    """Send a message out on the comm UART bus."""
-    global uart_comm
+    """Queue a message to go out on the comm UART bus."""
+    global comm_tx
     print(f'UART send: {str}')
-    write_str = f"{str}\r\n"
-    uart_comm.write(bytearray(write_str, "utf-8"))
-
-# Init Wav decoder for music
-# decoder = WaveFile(open("/sd/PINBALL.WAV", "rb"), bytearray(1024))
-# Init MP3 decoder for music
-decoder = audiomp3.MP3Decoder(open("/sd/PINBALL.mp3", "rb"))
+    comm_tx.send(str)
 
 # Init switches for mission select buttons
-mission_select_1 = digitalio.DigitalInOut(board.GP21)
-mission_select_1.direction = digitalio.Direction.INPUT
-mission_select_1.pull = digitalio.Pull.UP
-mission_select_2 = digitalio.DigitalInOut(board.GP20)
-mission_select_2.direction = digitalio.Direction.INPUT
-mission_select_2.pull = digitalio.Pull.UP
-mission_select_3 = digitalio.DigitalInOut(board.GP19)
-mission_select_3.direction = digitalio.Direction.INPUT
-mission_select_3.pull = digitalio.Pull.UP
-
-debounced_mission_buttons = [
-    Debouncer(mission_select_1),
-    Debouncer(mission_select_2),
-    Debouncer(mission_select_3),
-]
+mission_buttons = Switches([board.GP21, board.GP20, board.GP19], value_when_pressed=False)
+
+# Main loop profiling, reported by the STA command
+PROFILE_LOOP = False  # Set to start with profiling on, rather than waiting for STA 1
+PROFILE_IR_SENSORS = 0
+PROFILE_RING = 1
+PROFILE_ANIMATIONS = 2
+PROFILE_UART = 3
+PROFILE_BUTTONS = 4
+PROFILE_SOUNDS = 5
+profiler = Profiler(("ir_sensors", "ring", "animations", "uart", "buttons", "sounds"), PROFILE_LOOP)
+
+# Sounds play on the audio FX board until the mixer takes over from the startup sound
+send_uart("INI soundController BIN")
+boot_ini_ms = ticks_diff(ticks_ms(), boot_start)
 
 print("Wait for startup sound done...")
 while audio.playing:
-    while uart.in_waiting > 0:
-        readline(uart)
-    while uart_comm.in_waiting > 0:
-        readline_comm(uart_comm)
+    fx.update(ticks_ms())
+    readline_comm(comm_reader)
+    comm_tx.service(ticks_ms())
+    comm_upgrade.update(ticks_ms())
 print("Startup sound done")
 wave.deinit()
-send_uart("INI soundController")
+# Music and the sounds in SFX_DIRECTORY play through a mixer from here on
+print("Loading sound effects...")
+try:
+    sfx_bank = SoundBank(SFX_BANK)
+except (OSError, SoundBankError) as e:
+    print(f"No sound bank: {e}")
+    sfx_bank = None
+# The mixer plays the music as it is, so effects have to match its format
+music = MusicLoop(MUSIC_FILE)
+print(f"Music is {music.sample_rate} Hz with {music.channel_count} channel(s)")
+sounds = SoundMixer(
+    audio, sound_files(SFX_DIRECTORY, music.sample_rate, music.channel_count), sfx_bank,
+    music.sample_rate, music.channel_count,
+)
+music.mixer = sounds
+sounds.preload(SFX_PRELOAD)
+print(sounds.report())
 # Clear out perimeter neopixels
 pixels_perimeter.fill((0, 0, 0))
 pixels_perimeter.show()
@@ -388,30 +512,35 @@ print("Setting up IR Sensors...")
 # GP3 = middle IR sensor
 # GP5 = right IR sensor
 ring_update_delay = None
+
 with countio.Counter(board.GP27, pull=digitalio.Pull.UP) as ir1, countio.Counter(board.GP3, pull=digitalio.Pull.UP) as ir2, countio.Counter(board.GP5, pull=digitalio.Pull.UP) as ir3:
     ir_sensors = [ir1, ir2, ir3]
+    boot_main_loop_ms = ticks_diff(ticks_ms(), boot_start)
+    print(boot_report())
     print("Start main loop...")
     while True:
-        audio.play(decoder) # Loop music forever
+        music.start(ticks_ms()) # Loop music forever
         while audio.playing:
-            cur_time = time.monotonic()
+            profiler.start_loop()
+            cur_time = ticks_ms()
 
             # Check IR sensors
             for i in range(len(ir_sensors)):
                 if ir_sensors[i].count > 0:
                     print(f'IR sensor {i} triggered')
-                    play_sound(uart, RE_ENTRY_SOUND)
+                    play_sound(RE_ENTRY_SOUND)
                     ir_sensors[i].count = 0
                     send_uart(f'IR {i}')
                     # Cancel ball launching animation
                     if led_anim_state == ANIM_STATE_LAUNCHING:
                         led_anim_state = ANIM_STATE_PLAYING
                         # On a delay
-                        ring_update_delay = cur_time + 0.125
+                        ring_update_delay = ticks_add(cur_time, RING_UPDATE_DELAY)
                         pixels_perimeter.fill((255, 255, 255))
                         pixels_perimeter.show()
+            profiler.lap(PROFILE_IR_SENSORS)
 
-            if ring_update_delay and cur_time > ring_update_delay:
+            if ticks_expired(ring_update_delay, cur_time):
                 ring_update_delay = None
                 # Update ring
                 pixels_ring.fill((0, 0, 0))
@@ -423,6 +552,7 @@ with countio.Counter(board.GP27, pull=digitalio.Pull.UP) as ir1, countio.Counter
                     if i < cur_rank + 1:
                         pixels_ring[i+24] = INNER_RING_COLOR
                 pixels_ring.show()
+            profiler.lap(PROFILE_RING)
 
             # Update pixel animations
             if led_anim_state == ANIM_STATE_GAME_OVER:
@@ -440,7 +570,7 @@ with countio.Counter(board.GP27, pull=digitalio.Pull.UP) as ir1, countio.Counter
                 ring_outer_spin_anim.animate(show=False)
                 ring_center_blink_anim.animate(show=False)
                 pixels_ring.show()
-            elif led_anim_state == ANIM_STATE_DRAINED and cur_time - drained_time > DRAINED_SOUND_LEN:
+            elif led_anim_state == ANIM_STATE_DRAINED and ticks_diff(cur_time, drained_time) > DRAINED_SOUND_LEN:
                 led_anim_state = ANIM_STATE_LAUNCHING
                 pixels_perimeter.fill((0, 0, 0))
                 pixels_perimeter.show()
@@ -450,7 +580,7 @@ with countio.Counter(board.GP27, pull=digitalio.Pull.UP) as ir1, countio.Counter
             elif led_anim_state == ANIM_STATE_MISSION_COMPLETE:
                 ring_outer_blink_anim.animate(show=False)
                 ring_center_blink_anim.animate(show=False)
-                if cur_time > anim_flash_time + MISSION_COMPLETE_FLASH_TIME:
+                if ticks_diff(cur_time, anim_flash_time) > MISSION_COMPLETE_FLASH_TIME:
                     # Light relevant LEDs for mission/rank completion progress
                     for i in range(0, num_complete_missions * 8):
                         pixels_ring[i] = OUTER_RING_COLOR
@@ -461,7 +591,7 @@ with countio.Counter(board.GP27, pull=digitalio.Pull.UP) as ir1, countio.Counter
                 ring_inner_blink_anim.animate(show=False)
                 ring_outer_sparkle_anim.animate(show=False)
                 ring_center_blink_anim.animate(show=False)
-                if cur_time > anim_flash_time + MISSION_COMPLETE_FLASH_TIME:
+                if ticks_diff(cur_time, anim_flash_time) > MISSION_COMPLETE_FLASH_TIME:
                     # Light relevant LEDs for mission/rank completion progress
                     for i in range(24):
                         pixels_ring[i] = (0, 0, 0)
@@ -470,20 +600,27 @@ with countio.Counter(board.GP27, pull=digitalio.Pull.UP) as ir1, countio.Counter
                     pixels_ring[CENTERMOST_PIXEL] = (0, 0, 0)
                     led_anim_state = ANIM_STATE_PLAYING
                 pixels_ring.show()
+            profiler.lap(PROFILE_ANIMATIONS)
 
-            # Print any data on the UART line from the audio fx board
-            while uart.in_waiting > 0:
-                readline(uart)
-
-            while uart_comm.in_waiting > 0:
-                readline_comm(uart_comm)
-
-            playing_stop_timer -= 1
+            # Handle the audio fx board's replies, and the commands from the other pico
+            fx.update(ticks_ms())
+            readline_comm(comm_reader)
+            comm_tx.service(ticks_ms())
+            comm_upgrade.update(ticks_ms())
+            profiler.lap(PROFILE_UART)
 
             # Check mission select buttons
-            for i in range(len(debounced_mission_buttons)):
-                debounced_mission_buttons[i].update()
-                if debounced_mission_buttons[i].fell:
+            event = mission_buttons.next_event()
+            while event is not None:
+                if event.pressed:
+                    i = event.key_number
                     print(f'Mission select button {i} pressed')
-                    play_sound(uart, random.choice(SHOOT_SOUNDS))
+                    play_sound(random.choice(SHOOT_SOUNDS))
                     send_uart(f"BTN {i}")  # Display controller handles the score update so we don't spam the UART bus
+                event = mission_buttons.next_event()
+            profiler.lap(PROFILE_BUTTONS)
+
+            # Free the mixer voices of finished sounds, duck the music under important ones and check it kept up
+            sounds.update()
+            music.update(ticks_ms())
+            profiler.lap(PROFILE_SOUNDS)
@@ -0,0 +1,149 @@
+"""Driver for the Adafruit Audio FX sound board, over its UART interface.
+
+The board plays track n when sent `#n`, and answers `play ...` once it
+has started, or `NoFile` if there's no such track. `q` stops the track,
+and the board says `done` whenever a track ends, stopped or not.
+
+FXBoard tracks the board with an explicit state machine (idle, starting,
+playing, stopping) driven by those replies, with timeouts in case one
+is lost. It never waits for the board. A sound asked for while another
+is playing is queued. The playing sound is stopped, and the queued one
+starts once the board says it's done. Every sound has a priority, and
+a sound can only cut off one of the same or a lower priority.
+"""
+
+from ticks import ticks_add, ticks_expired
+
+STATE_IDLE = 0
+STATE_STARTING = 1  # Sent #n, waiting for "play"
+STATE_PLAYING = 2   # Waiting for "done"
+STATE_STOPPING = 3  # Sent q, waiting for "done"
+STATE_NAMES = ("idle", "starting", "playing", "stopping")
+
+PRIORITY_LOW = 0       # Bumpers, slingshots and the like, cut off by anything
+PRIORITY_NORMAL = 1
+PRIORITY_HIGH = 2      # Mission sounds
+PRIORITY_CRITICAL = 3  # Drain, game over, rank up
+
+START_TIMEOUT = 250  # ms to wait for "play" before giving up on a sound
+STOP_TIMEOUT = 250   # ms to wait for "done" after q before assuming it stopped
+PLAY_TIMEOUT = 30000  # ms after which a sound the board never said was done is assumed finished
+
+
+def _starts_with(buf, length, prefix):
+    if length < len(prefix):
+        return False
+    for i in range(len(prefix)):
+        if buf[i] != prefix[i]:
+            return False
+    return True
+
+
+class FXBoard:
+    """Plays sounds on an Audio FX board, one at a time, by priority.
+
+    Call update() once per main loop pass. It reads the board's replies
+    from a LineReader and handles timeouts.
+    """
+
+    def __init__(self, uart, reader):
+        self.uart = uart
+        self.reader = reader
+        self.state = STATE_IDLE
+        self.sound = None
+        self.priority = PRIORITY_LOW
+        self._deadline = None
+        self._pending = None
+        self._pending_priority = PRIORITY_LOW
+        self.played = 0
+        self.preempted = 0  # Sounds cut off by a higher or equal priority one
+        self.dropped = 0    # Sounds never played, for a higher priority one
+        self.timeouts = 0
+
+    @property
+    def playing(self):
+        return self.state != STATE_IDLE
+
+    def play(self, sound, priority, now):
+        """Play a sound as soon as the board is free. Returns False if it was dropped for a higher priority one."""
+        if self._pending is not None:
+            if priority < self._pending_priority:
+                self.dropped += 1
+                return False
+            # Replaced before it got to play
+            self.dropped += 1
+        elif self.state != STATE_IDLE and self.state != STATE_STOPPING and priority < self.priority:
+            self.dropped += 1
+            return False
+        if self.state == STATE_IDLE:
+            self._start(sound, priority, now)
+            return True
+        self._pending = sound
+        self._pending_priority = priority
+        if self.state != STATE_STOPPING:
+            # The board takes commands in order, so a track that is still starting can be stopped too
+            self.preempted += 1
+            self._stop(now)
+        return True
+
+    def stop(self, now):
+        """Stop the playing sound, and forget any queued one."""
+        self._pending = None
+        if self.state == STATE_STARTING or self.state == STATE_PLAYING:
+            self._stop(now)
+
+    def update(self, now):
+        """Handle the replies the board has sent, and any reply that is overdue."""
+        reader = self.reader
+        length = reader.readline()
+        while length:
+            self._reply(reader.line, length, now)
+            length = reader.readline()
+        if ticks_expired(self._deadline, now):
+            self.timeouts += 1
+            self._finished(now)
+
+    def report(self):
+        """Return the board's state and counters as a line of text."""
+        return (
+            f"fx state={STATE_NAMES[self.state]} played={self.played} preempted={self.preempted} "
+            f"dropped={self.dropped} timeouts={self.timeouts}"
+        )
+
+    def _reply(self, line, length, now):
+        print("".join([chr(b) for b in line[:length]]), end="")
+        state = self.state
+        if _starts_with(line, length, b"play"):
+            if state == STATE_STARTING:
+                self.state = STATE_PLAYING
+                self._deadline = ticks_add(now, PLAY_TIMEOUT)
+        elif _starts_with(line, length, b"done"):
+            # A done while starting is from a track that already timed out, not this one
+            if state == STATE_PLAYING or state == STATE_STOPPING:
+                self._finished(now)
+        elif _starts_with(line, length, b"NoFile"):
+            if state == STATE_STARTING:
+                self._finished(now)
+
+    def _start(self, sound, priority, now):
+        self.uart.write(f"#{sound}\r\n".encode())
+        self.state = STATE_STARTING
+        self.sound = sound
+        self.priority = priority
+        self._deadline = ticks_add(now, START_TIMEOUT)
+        self.played += 1
+
+    def _stop(self, now):
+        self.uart.write(b"q\r\n")
+        self.state = STATE_STOPPING
+        self._deadline = ticks_add(now, STOP_TIMEOUT)
+
+    def _finished(self, now):
+        self.state = STATE_IDLE
+        self.sound = None
+        self.priority = PRIORITY_LOW
+        self._deadline = None
+        if self._pending is not None:
+            sound = self._pending
+            self._pending = None
+            self._start(sound, self._pending_priority, now)
@@ -0,0 +1,139 @@
+"""Main loop profiling.
+
+The main loop calls start_loop() at its top and lap(section) after each
+part of its work, so the time since the previous mark is charged to that
+section. Times come from ticks_ms(), which allocates nothing, so sections
+that take under a millisecond are counted as 0 ms. Each section keeps a
+count, min/avg/max and a histogram with one bucket per power of two
+milliseconds. The loop as a whole keeps its rate and worst case.
+
+While profiling is disabled, start_loop() and lap() return straight away
+without reading the clock. What that still costs per call is measured the
+first time a report is made, and reported with it.
+
+Report lines are sent to the display controller as STR lines, so none is
+longer than MAX_LINE.
+"""
+
+from ticks import ticks_ms, ticks_diff
+
+NUM_BUCKETS = 12  # Bucket k counts durations of 2**(k-1) to 2**k - 1 ms; the last also takes anything longer
+OVERHEAD_CALLS = 20000  # Calls of start_loop() and lap() each timed to measure the disabled cost
+MAX_LINE = 120  # Leaves room for "STR " and the line ending in the other board's 128 byte LineReader
+
+
+def _bucket(ms):
+    bucket = 0
+    while ms and bucket < NUM_BUCKETS - 1:
+        ms >>= 1
+        bucket += 1
+    return bucket
+
+
+class Profiler:
+    """Times named sections of a main loop."""
+
+    def __init__(self, names, enabled=False):
+        self.names = names
+        self.enabled = enabled
+        self.off_overhead_ns = None  # Per call of start_loop() or lap() while disabled, once measured
+        self.reset()
+
+    def reset(self):
+        """Clear all the stats collected so far."""
+        count = len(self.names)
+        self._counts = [0] * count
+        self._totals = [0] * count
+        self._mins = [0] * count
+        self._maxes = [0] * count
+        self._hists = [[0] * NUM_BUCKETS for _ in range(count)]
+        self._loops = 0
+        self._loop_total = 0
+        self._loop_max = 0
+        self._loop_start = None
+        self._last_mark = None
+
+    def start_loop(self):
+        """Mark the top of a main loop pass."""
+        if not self.enabled:
+            return
+        now = ticks_ms()
+        if self._loop_start is not None:
+            elapsed = ticks_diff(now, self._loop_start)
+            self._loops += 1
+            self._loop_total += elapsed
+            if elapsed > self._loop_max:
+                self._loop_max = elapsed
+        self._loop_start = now
+        self._last_mark = now
+
+    def lap(self, section):
+        """Charge the time since the last mark to section."""
+        if not self.enabled or self._last_mark is None:
+            return
+        now = ticks_ms()
+        elapsed = ticks_diff(now, self._last_mark)
+        self._last_mark = now
+        count = self._counts[section]
+        if count == 0 or elapsed < self._mins[section]:
+            self._mins[section] = elapsed
+        if elapsed > self._maxes[section]:
+            self._maxes[section] = elapsed
+        self._counts[section] = count + 1
+        self._totals[section] += elapsed
+        self._hists[section][_bucket(elapsed)] += 1
+
+    def measure_overhead(self, calls=OVERHEAD_CALLS):
+        """Time start_loop() and lap() while disabled, and return the average ns per call."""
+        enabled = self.enabled
+        self.enabled = False
+        start = ticks_ms()
+        for _ in range(calls):
+            self.start_loop()
+            self.lap(0)
+        elapsed = ticks_diff(ticks_ms(), start)
+        # Take off the cost of the loop itself
+        start = ticks_ms()
+        for _ in range(calls):
+            pass
+        elapsed -= ticks_diff(ticks_ms(), start)
+        self.enabled = enabled
+        self.off_overhead_ns = max(elapsed, 0) * 1000000 // (calls * 2)
+        return self.off_overhead_ns
+
+    def report(self):
+        """Return the stats as a list of text lines of at most MAX_LINE characters."""
+        if self.off_overhead_ns is None:
+            self.measure_overhead()
+        overhead = f"disabled_cost={self.off_overhead_ns}ns/call"
+        if self._loops == 0:
+            return [("no loops timed " if self.enabled else "profiling off ") + overhead]
+        lines = [
+            f"loop n={self._loops} hz={self._loops * 1000 // max(self._loop_total, 1)} "
+            f"avg={self._loop_total // self._loops}ms max={self._loop_max}ms {overhead}"
+        ]
+        for i in range(len(self.names)):
+            count = self._counts[i]
+            if count == 0:
+                continue
+            name = self.names[i]
+            lines.append(
+                f"{name} n={count} min={self._mins[i]}ms "
+                f"avg={self._totals[i] // count}ms max={self._maxes[i]}ms"
+            )
+            hist = self._hists[i]
+            last = NUM_BUCKETS - 1
+            while hist[last] == 0:
+                last -= 1
+            # Split a long histogram over lines, each saying which bucket it starts at
+            first = 0
+            line = f"{name} log2ms@0"
+            for k in range(last + 1):
+                count = str(hist[k])
+                if len(line) + 1 + len(count) > MAX_LINE:
+                    lines.append(line)
+                    first = k
+                    line = f"{name} log2ms@{first}"
+                line += ("/" if k > first else " ") + count
+            lines.append(line)
+        return [line[:MAX_LINE] for line in lines]
@@ -0,0 +1,132 @@
+"""Switch input events.
+
+On CircuitPython, switches are scanned in the background by keypad.Keys.
+It debounces them and queues timestamped press/release events, so the
+time at which a press is seen doesn't depend on how long the rest of the
+main loop takes. Where keypad isn't available (e.g. on the host),
+PolledKeys produces the same events by reading the pins whenever the
+queue is checked.
+"""
+
+try:
+    import keypad
+except ImportError:
+    keypad = None
+
+from ticks import ticks_ms, ticks_diff
+
+DEBOUNCE_INTERVAL = 0.01  # seconds, same as adafruit_debouncer's default
+
+
+class Event:
+    """Stand-in for keypad.Event."""
+
+    def __init__(self, key_number=0, pressed=True, timestamp=0):
+        self.key_number = key_number
+        self.pressed = pressed
+        self.timestamp = timestamp
+
+    @property
+    def released(self):
+        return not self.pressed
+
+
+class PolledKeys:
+    """Pure-Python stand-in for keypad.Keys.
+
+    Pins can be board pins, or anything with a value attribute (such as a
+    fake pin in a host test). The pins are scanned at most once per
+    interval, whenever events are read.
+    """
+
+    def __init__(self, pins, *, value_when_pressed, pull=True, interval=DEBOUNCE_INTERVAL, max_events=64):
+        self._inputs = [self._make_input(pin, value_when_pressed, pull) for pin in pins]
+        self._value_when_pressed = value_when_pressed
+        self._interval = int(interval * 1000)
+        self._max_events = max_events
+        self._state = [False] * len(pins)
+        self._queue = []
+        self._last_scan = None
+        self.key_count = len(pins)
+        self.overflowed = False
+
+    @staticmethod
+    def _make_input(pin, value_when_pressed, pull):
+        if hasattr(pin, "value"):
+            return pin
+        from digitalio import DigitalInOut, Direction, Pull
+        switch = DigitalInOut(pin)
+        switch.direction = Direction.INPUT
+        if pull:
+            switch.pull = Pull.DOWN if value_when_pressed else Pull.UP
+        return switch
+
+    @property
+    def events(self):
+        """The event queue; PolledKeys is its own queue."""
+        return self
+
+    def _scan(self):
+        now = ticks_ms()
+        if self._last_scan is not None and ticks_diff(now, self._last_scan) < self._interval:
+            return
+        self._last_scan = now
+        for i in range(self.key_count):
+            pressed = self._inputs[i].value == self._value_when_pressed
+            if pressed != self._state[i]:
+                self._state[i] = pressed
+                if len(self._queue) < self._max_events:
+                    self._queue.append((i, pressed, now))
+                else:
+                    self.overflowed = True
+
+    def get_into(self, event):
+        """Fill in event with the next queued event and return True, or return False if there is none."""
+        self._scan()
+        if not self._queue:
+            return False
+        event.key_number, event.pressed, event.timestamp = self._queue.pop(0)
+        return True
+
+    def get(self):
+        """Return the next queued event, or None."""
+        event = Event()
+        return event if self.get_into(event) else None
+
+    def clear(self):
+        """Drop any queued events."""
+        self._queue.clear()
+        self.overflowed = False
+
+    def reset(self):
+        """Assume every switch is released, so held ones report a new press."""
+        self._state = [False] * self.key_count
+
+    def __len__(self):
+        self._scan()
+        return len(self._queue)
+
+
+class Switches:
+    """A group of debounced switches that report press and release events.
+
+    Drain events with next_event() until it returns None. The returned event
+    object is reused, so read it before asking for the next one. pressed
+    holds the state of each switch as of the last event drained.
+    """
+
+    def __init__(self, pins, value_when_pressed, pull=True, interval=DEBOUNCE_INTERVAL):
+        if keypad is not None:
+            self._keys = keypad.Keys(pins, value_when_pressed=value_when_pressed, pull=pull, interval=interval)
+            self._event = keypad.Event()
+        else:
+            self._keys = PolledKeys(pins, value_when_pressed=value_when_pressed, pull=pull, interval=interval)
+            self._event = Event()
+        self.pressed = [False] * len(pins)
+
+    def next_event(self):
+        """Return the next switch event, or None if the queue is empty."""
+        if not self._keys.events.get_into(self._event):
+            return None
+        self.pressed[self._event.key_number] = self._event.pressed
+        return self._event
@@ -0,0 +1,104 @@
+"""Background music, looped without a gap, with a count of underruns.
+
+The music MP3 loops on the mixer's music voice with loop=True, so the
+audio engine seeks the decoder back to the start as soon as it reaches
+the end of the file, rather than the main loop noticing the music has
+stopped and starting it again. The decoder gets a bigger read buffer
+than its default, which it splits in half and refills one half while
+playing the other, so a main loop pass busy with neopixel show() calls
+doesn't leave it waiting on the SD card.
+
+update() checks that the decoder keeps up with the clock. Decoded
+samples always run ahead of what's been played, so if fewer samples
+have been decoded than the time since the music started calls for, the
+output ran dry: that's an underrun. One that lasts over several update()
+calls counts once, until the decoder is ahead of the clock again.
+Counting samples needs a CircuitPython whose MP3Decoder has
+samples_decoded. Without it, loops and underruns can't be counted, and
+report() says so rather than showing zeros.
+"""
+
+import audiomp3
+from ticks import ticks_diff
+
+READ_BUFFER_SIZE = 16384  # Bytes, split in two halves of about half a second each at 128 kbps
+UNDERRUN_MARGIN = 50      # ms the decoder may fall behind the clock before it counts as an underrun
+
+
+class MusicLoop:
+    """Loops an MP3 file on a SoundMixer's music voice.
+
+    The mixer is made to match the music's format, so it's created after
+    the MusicLoop and set as mixer before start().
+    """
+
+    def __init__(self, path, buffer_size=READ_BUFFER_SIZE):
+        self.mixer = None
+        self.decoder = audiomp3.MP3Decoder(open(path, "rb"), bytearray(buffer_size))
+        self.sample_rate = self.decoder.sample_rate
+        self.channel_count = self.decoder.channel_count
+        self.counts_samples = hasattr(self.decoder, "samples_decoded")
+        if not self.counts_samples:
+            print(f"{path}: MP3Decoder has no samples_decoded, so music loops and underruns won't be counted")
+        self.playing = False
+        self._start_ms = 0
+        self._start_decoded = 0
+        self._last_decoded = 0
+        self.loops = 0
+        self._starved = False
+        self._stalled = 0  # ms behind the clock in the current underrun
+        self.underruns = 0
+        self.max_lag = 0  # ms, the longest the decoder has been behind the clock
+
+    def start(self, now):
+        """Start the music, unless it's already playing."""
+        if self.playing:
+            return
+        self.mixer.play_music(self.decoder)
+        self.playing = True
+        if self.counts_samples:
+            self._mark(now, self.decoder.samples_decoded)
+
+    def stop(self):
+        """Stop the music."""
+        self.mixer.stop_music()
+        self.playing = False
+
+    def update(self, now):
+        """Count loops and underruns since the last call."""
+        if not self.playing or not self.counts_samples:
+            return
+        decoded = self.decoder.samples_decoded
+        if decoded < self._last_decoded:
+            # Back at the start of the file
+            self.loops += 1
+            self._mark(now, decoded)
+            return
+        self._last_decoded = decoded
+        played = ticks_diff(now, self._start_ms) * self.sample_rate // 1000
+        lag = (self._start_decoded + played - decoded) * 1000 // self.sample_rate
+        if lag > UNDERRUN_MARGIN:
+            if not self._starved:
+                self.underruns += 1
+                self._starved = True
+                self._stalled = 0
+            # The time lost is gone, so measure from here on
+            self._stalled += lag
+            lag = self._stalled
+            self._mark(now, decoded)
+        elif lag <= 0:
+            self._starved = False
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+    def report(self):
+        """Return the music's counters as a line of text."""
+        if not self.counts_samples:
+            return "music loops and underruns unavailable (no samples_decoded)"
+        return f"music loops={self.loops} underruns={self.underruns} max_lag={self.max_lag}ms"
+
+    def _mark(self, now, decoded):
+        # Measure from here on
+        self._start_ms = now
+        self._start_decoded = decoded
+        self._last_decoded = decoded
@@ -0,0 +1,304 @@
+"""Sound effects played on this board, mixed with the music.
+
+The audio FX board plays one sound at a time, and each one costs a UART
+round trip. SoundMixer plays through an audiomixer.Mixer on the board's
+own PWM audio output instead. Voice 0 loops the music, and the other
+voices play sound effects together. Short effects are decoded into RAM
+once and kept in a SampleCache, read from a SoundBank if there is one or
+else from their own WAV files. Longer ones stream from their WAV files
+on the SD card. The music is turned down while a high priority effect
+plays.
+
+Every sample played must match the mixer's format: 16-bit signed, with
+its channel count and sample rate, which code.py takes from the music.
+Files in any other format are left out, so those sounds still play on
+the audio FX board.
+"""
+
+import array
+import os
+import audiocore
+import audiomixer
+from fx_board import PRIORITY_HIGH
+
+MUSIC_VOICE = 0
+STREAM_BUFFER_SIZE = 1024  # Per voice, for effects streamed from the SD card
+
+
+def sound_files(directory, sample_rate, channel_count):
+    """Return a dict of sound number to path for the SOUND<n + 1>.WAV files in a directory the mixer can play."""
+    sounds = {}
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return sounds
+    for name in names:
+        upper = name.upper()
+        if upper.startswith("SOUND") and upper.endswith(".WAV") and upper[5:-4].isdigit():
+            path = directory + "/" + name
+            if wave_format(path) == (sample_rate, channel_count):
+                sounds[int(upper[5:-4]) - 1] = path
+            else:
+                print(f"{path} isn't 16-bit PCM at {sample_rate} Hz with {channel_count} channel(s), leaving it out")
+    return sounds
+
+
+def _read_header(f):
+    """Read a WAV file's header, leaving f at the start of its samples.
+
+    Returns (sample_rate, channels, bytes of samples), or None if it isn't
+    a 16-bit PCM WAV file.
+    """
+    header = f.read(12)
+    if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return None
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            return None
+        size = chunk[4] | chunk[5] << 8 | chunk[6] << 16 | chunk[7] << 24
+        if chunk[:4] == b"data":
+            break
+        if chunk[:4] == b"fmt ":
+            fmt = f.read(size)
+            f.seek(size & 1, 1)
+            continue
+        f.seek(size + (size & 1), 1)  # Chunks are padded to an even length
+    if fmt is None or len(fmt) < 16:
+        return None
+    audio_format = fmt[0] | fmt[1] << 8
+    channels = fmt[2] | fmt[3] << 8
+    rate = fmt[4] | fmt[5] << 8 | fmt[6] << 16 | fmt[7] << 24
+    bits = fmt[14] | fmt[15] << 8
+    if audio_format != 1 or bits != 16:
+        return None
+    return rate, channels, size
+
+
+def wave_format(path):
+    """Return (sample_rate, channels) of a 16-bit PCM WAV file, or None if it's in another format."""
+    try:
+        with open(path, "rb") as f:
+            header = _read_header(f)
+    except OSError:
+        return None
+    return header[:2] if header is not None else None
+
+
+def load_wave(path, sample_rate, channel_count, max_bytes):
+    """Read a 16-bit PCM WAV file into RAM.
+
+    Returns (RawSample, bytes), or None if the file is bigger than
+    max_bytes or in another format.
+    """
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        if header is None:
+            return None
+        rate, channels, size = header
+        if channels != channel_count or rate != sample_rate or size > max_bytes:
+            return None
+        data = bytearray(size & ~1)
+        f.readinto(data)
+    # Copies the bytes as they are into an array of 16-bit samples
+    sample = audiocore.RawSample(array.array("h", data), channel_count=channel_count, sample_rate=sample_rate)
+    return sample, len(data)
+
+
+class SampleCache:
+    """Decoded samples for recently played effects, kept under a RAM budget.
+
+    Samples are looked up by sound number, and load(sound) reads one in,
+    returning (RawSample, bytes) or None if it can't be cached. The least
+    recently used samples are dropped once they take up more than budget
+    bytes. A dropped sample that is still playing isn't freed until its
+    voice is done with it.
+    """
+
+    def __init__(self, budget, load):
+        self.budget = budget
+        self.load = load
+        self._entries = {}  # Sound -> (RawSample, bytes)
+        self._order = []    # Sounds, least recently used first
+        self._uncached = set()  # Sounds too big or in the wrong format to cache
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sound):
+        """Return the RawSample for a sound, loading it if it isn't cached, or None if it can't be cached."""
+        entry = self._entries.get(sound)
+        if entry is not None:
+            self.hits += 1
+            if self._order[-1] != sound:
+                self._order.remove(sound)
+                self._order.append(sound)
+            return entry[0]
+        if sound in self._uncached:
+            return None
+        self.misses += 1
+        loaded = self.load(sound)
+        if loaded is None:
+            self._uncached.add(sound)
+            return None
+        self.add(sound, loaded[0], loaded[1])
+        return loaded[0]
+
+    def add(self, sound, sample, size):
+        """Cache a sample of size bytes, dropping the least recently used ones to make room."""
+        while self._order and self.bytes + size > self.budget:
+            oldest = self._order.pop(0)
+            self.bytes -= self._entries.pop(oldest)[1]
+            self.evictions += 1
+        self._entries[sound] = (sample, size)
+        self._order.append(sound)
+        self.bytes += size
+
+
+class SoundMixer:
+    """Music on one voice of an audiomixer.Mixer, and effects on the rest, by priority.
+
+    An effect takes a free voice if there is one. Otherwise it cuts off
+    the lowest priority effect playing, the oldest of those first, as long
+    as that has no higher priority than the new one. Call update() once
+    per main loop pass to free finished voices and duck the music.
+    """
+
+    def __init__(self, audio, sounds, bank=None, sample_rate=22050, channel_count=1, sfx_voices=3,
+                 cache_bytes=32768, max_cached_bytes=8192, duck_level=0.25):
+        voice_count = sfx_voices + 1
+        self.mixer = audiomixer.Mixer(
+            voice_count=voice_count, sample_rate=sample_rate, channel_count=channel_count,
+            bits_per_sample=16, samples_signed=True,
+        )
+        self.sounds = sounds  # Sound number -> WAV file path, already in the mixer's format
+        self.bank = bank
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.max_cached_bytes = min(max_cached_bytes, cache_bytes)
+        self.cache = SampleCache(cache_bytes, self._load)
+        self.duck_level = duck_level
+        self._ducked = False
+        self._sound = [None] * voice_count   # Sound number on each voice, or None if free
+        self._priority = [0] * voice_count
+        self._started = [0] * voice_count    # Play count when each voice was started, for picking the oldest
+        self._file = [None] * voice_count    # Open file of an effect streamed from the SD card
+        self._buffers = [None] + [bytearray(STREAM_BUFFER_SIZE) for _ in range(sfx_voices)]
+        self.played = 0
+        self.preempted = 0
+        self.dropped = 0
+        audio.play(self.mixer)
+
+    def has(self, sound):
+        """Return True if there's a file in the mixer's format to play sound from."""
+        if sound in self.sounds:
+            return True
+        if self.bank is None:
+            return False
+        entry = self.bank.entry(sound)
+        # Sounds in the bank can only play from RAM
+        return (
+            entry is not None and entry[1] <= self.max_cached_bytes
+            and entry[2:] == (self.sample_rate, self.channel_count, 16)
+        )
+
+    def preload(self, sounds):
+        """Load sounds into the sample cache now, rather than the first time they play."""
+        for sound in sounds:
+            if self.has(sound):
+                self.cache.get(sound)
+
+    def play_music(self, sample):
+        """Loop the music, unless it's already playing."""
+        voice = self.mixer.voice[MUSIC_VOICE]
+        if not voice.playing:
+            voice.play(sample, loop=True)
+
+    def stop_music(self):
+        """Stop the music."""
+        self.mixer.voice[MUSIC_VOICE].stop()
+
+    def play(self, sound, priority):
+        """Play a sound effect. Returns False if every voice is busy with a higher priority one."""
+        voice = self._pick_voice(priority)
+        if voice is None:
+            self.dropped += 1
+            return False
+        if self._sound[voice] is not None:
+            if self.mixer.voice[voice].playing:
+                self.preempted += 1
+            self._release(voice)
+        sample = self.cache.get(sound)
+        if sample is None:
+            path = self.sounds.get(sound)
+            if path is None:
+                self.dropped += 1
+                return False
+            f = open(path, "rb")
+            sample = audiocore.WaveFile(f, self._buffers[voice])
+            self._file[voice] = f
+        self.played += 1
+        self._sound[voice] = sound
+        self._priority[voice] = priority
+        self._started[voice] = self.played
+        self.mixer.voice[voice].play(sample)
+        self._duck()
+        return True
+
+    def update(self):
+        """Free the voices of effects that have finished, and set the music level."""
+        voices = self.mixer.voice
+        for i in range(1, len(self._sound)):
+            if self._sound[i] is not None and not voices[i].playing:
+                self._release(i)
+        self._duck()
+
+    def report(self):
+        """Return the mixer's counters as a line of text."""
+        cache = self.cache
+        return (
+            f"mixer played={self.played} preempted={self.preempted} dropped={self.dropped} "
+            f"cache={cache.bytes}B hits={cache.hits} misses={cache.misses} evictions={cache.evictions}"
+        )
+
+    def _load(self, sound):
+        if self.bank is not None and self.bank.has(sound):
+            return self.bank.load(sound, self.sample_rate, self.channel_count, self.max_cached_bytes)
+        path = self.sounds.get(sound)
+        if path is None:
+            return None
+        return load_wave(path, self.sample_rate, self.channel_count, self.max_cached_bytes)
+
+    def _pick_voice(self, priority):
+        voices = self.mixer.voice
+        best = None
+        for i in range(1, len(self._sound)):
+            if self._sound[i] is None or not voices[i].playing:
+                return i
+            if best is None or self._priority[i] < self._priority[best] or (
+                self._priority[i] == self._priority[best] and self._started[i] < self._started[best]
+            ):
+                best = i
+        if best is None or self._priority[best] > priority:
+            return None
+        return best
+
+    def _release(self, voice):
+        self.mixer.voice[voice].stop()
+        self._sound[voice] = None
+        f = self._file[voice]
+        if f is not None:
+            f.close()
+            self._file[voice] = None
+
+    def _duck(self):
+        ducked = False
+        for i in range(1, len(self._sound)):
+            if self._sound[i] is not None and self._priority[i] >= PRIORITY_HIGH:
+                ducked = True
+                break
+        if ducked != self._ducked:
+            self._ducked = ducked
+            self.mixer.voice[MUSIC_VOICE].level = self.duck_level if ducked else 1.0
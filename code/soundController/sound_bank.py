@@ -0,0 +1,95 @@
+"""Reader for a sound bank, every effect's samples packed into one file.
+
+Opening a file on the SD card means walking the FAT directory, which
+costs more than reading a short effect. util/sound_bank packs the effects
+into one bank file instead, which is opened once at startup. The file
+starts with a fixed size index, one entry per sound number, so finding a
+sound is a single lookup and reading it a single seek.
+
+Layout, all little endian:
+
+    header  magic b"SBNK", u16 version, u16 sound count
+    index   per sound number from 0: u32 offset, u32 length in bytes,
+            u32 sample rate, u16 channels, u16 bits per sample
+            (length 0 if there's no such sound)
+    data    raw PCM samples of each sound, each starting on a 512 byte
+            boundary so it begins on an SD card sector
+"""
+
+import array
+import struct
+import audiocore
+
+MAGIC = b"SBNK"
+VERSION = 1
+HEADER_FORMAT = "<4sHH"
+HEADER_SIZE = 8
+ENTRY_FORMAT = "<IIIHH"
+ENTRY_SIZE = 16
+
+
+class SoundBankError(Exception):
+    """A sound bank file this reader can't use."""
+
+
+class SoundBank:
+    """Sounds read by number from a bank file, which stays open."""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        magic, version, count = struct.unpack(HEADER_FORMAT, self.file.read(HEADER_SIZE))
+        if magic != MAGIC or version != VERSION:
+            self.file.close()
+            raise SoundBankError(f"{path} isn't a version {VERSION} sound bank")
+        self.count = count
+        self._index = self.file.read(count * ENTRY_SIZE)
+        self.reads = 0
+
+    def entry(self, sound):
+        """Return (offset, length, sample_rate, channels, bits) for a sound, or None if the bank doesn't have it."""
+        if sound < 0 or sound >= self.count:
+            return None
+        entry = struct.unpack_from(ENTRY_FORMAT, self._index, sound * ENTRY_SIZE)
+        if entry[1] == 0:
+            return None
+        return entry
+
+    def has(self, sound):
+        """Return True if the bank has sound."""
+        return self.entry(sound) is not None
+
+    def length(self, sound):
+        """Bytes of samples for a sound, or 0 if the bank doesn't have it."""
+        entry = self.entry(sound)
+        return entry[1] if entry is not None else 0
+
+    def read_into(self, sound, buf):
+        """Read the start of a sound's samples into buf. Returns the number of bytes read."""
+        entry = self.entry(sound)
+        if entry is None:
+            return 0
+        self.file.seek(entry[0])
+        self.reads += 1
+        if len(buf) > entry[1]:
+            buf = memoryview(buf)[:entry[1]]
+        return self.file.readinto(buf)
+
+    def load(self, sound, sample_rate, channel_count, max_bytes):
+        """Read a 16-bit sound into RAM.
+
+        Returns (RawSample, bytes), or None if the bank doesn't have it,
+        it's bigger than max_bytes or it's in another format.
+        """
+        entry = self.entry(sound)
+        if entry is None:
+            return None
+        length, rate, channels, bits = entry[1:]
+        if channels != channel_count or bits != 16 or rate != sample_rate or length > max_bytes:
+            return None
+        data = bytearray(length & ~1)
+        self.read_into(sound, data)
+        sample = audiocore.RawSample(array.array("h", data), channel_count=channel_count, sample_rate=sample_rate)
+        return sample, len(data)
+
+    def close(self):
+        self.file.close()
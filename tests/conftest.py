@@ -0,0 +1,23 @@
+"""Put the boards' code on the import path, so their pure Python modules can be tested on the host.
+
+The lib/ modules are copied identically into each board, so the
+soundController's copies stand in for all three. The paths go on the
+end, as the board's code.py would otherwise hide the standard library's
+code module.
+
+CircuitPython's own modules (audiocore and the like) don't exist on the
+host, so tests/fakes has stand-ins with just what the tests use.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOUND_CONTROLLER = os.path.join(ROOT, "code", "soundController")
+DISPLAY_CONTROLLER = os.path.join(ROOT, "code", "displayController")
+SOLENOID_DRIVER = os.path.join(ROOT, "code", "solenoidDriver")
+FAKES = os.path.join(ROOT, "tests", "fakes")
+
+for path in (os.path.join(SOUND_CONTROLLER, "lib"), SOUND_CONTROLLER, DISPLAY_CONTROLLER, SOLENOID_DRIVER, FAKES):
+    if path not in sys.path:
+        sys.path.append(path)
@@ -0,0 +1,24 @@
+"""A stand-in for a displayio display whose refreshes take time on a test clock."""
+
+SPI_BYTES_PER_MS = 3000  # 24 MHz SPI
+BYTES_PER_PIXEL = 2
+
+
+class FakeDisplay:
+    """Each refresh advances clock by how long pushing area() pixels over SPI takes.
+
+    area is a function returning the pixels the refresh has to redraw, so
+    a test can say what displayio would have found dirty.
+    """
+
+    def __init__(self, clock, area=lambda: 0):
+        self.clock = clock
+        self.area = area
+        self.auto_refresh = True
+        self.refreshes = []  # Pixels redrawn by each refresh
+
+    def refresh(self, target_frames_per_second=60, minimum_frames_per_second=0):
+        pixels = self.area()
+        self.refreshes.append(pixels)
+        self.clock.now += pixels * BYTES_PER_PIXEL // SPI_BYTES_PER_MS
+        return True
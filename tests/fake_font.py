@@ -0,0 +1,25 @@
+"""A stand-in for terminalio.FONT: a fixed-width glyph sheet of printable ASCII."""
+
+from displayio import Bitmap
+
+GLYPH_WIDTH = 6
+GLYPH_HEIGHT = 12
+
+
+class Glyph:
+    def __init__(self, tile_index):
+        self.tile_index = tile_index
+        self.width = GLYPH_WIDTH
+        self.height = GLYPH_HEIGHT
+        self.shift_x = GLYPH_WIDTH
+
+
+class FakeFont:
+    def __init__(self):
+        self.bitmap = Bitmap(GLYPH_WIDTH * 95, GLYPH_HEIGHT, 2)
+
+    def get_bounding_box(self):
+        return GLYPH_WIDTH, GLYPH_HEIGHT, 0, 0
+
+    def get_glyph(self, code):
+        return Glyph(code - 32)
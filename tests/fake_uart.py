@@ -0,0 +1,93 @@
+"""A stand-in for busio.UART, fed by the test."""
+
+
+class FakeUART:
+    """Hands out only the bytes that have arrived so far, at most chunk at a time, and keeps what's written."""
+
+    def __init__(self, chunk=64):
+        self.pending = bytearray()
+        self.chunk = chunk
+        self.written = []
+
+    def arrive(self, data):
+        self.pending += data
+
+    @property
+    def in_waiting(self):
+        return len(self.pending)
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self.pending), self.chunk)
+        buf[:n] = self.pending[:n]
+        del self.pending[:n]
+        return n
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        return len(data)
+
+
+class WireUART:
+    """One end of a two-board link that carries bytes at the baud rate each end is set to.
+
+    Writes go into a FIFO, plus the shift register the byte going out sits
+    in, that drain at this end's baud rate as run() moves time on. A byte
+    only arrives intact if this end kept the same baud rate all the while
+    it was going out, and the far end is set to that rate too. Otherwise
+    it counts as garbled and arrives as GARBLED.
+    """
+
+    GARBLED = 0xFF
+
+    def __init__(self, baudrate=9600, fifo_size=32):
+        self.baudrate = baudrate
+        self.fifo_size = fifo_size
+        self.far = None
+        self.fifo = bytearray()  # The head is in the shift register
+        self.pending = bytearray()
+        self.sent = 0.0  # Byte times the head has been going out for
+        self._head_baudrate = None
+        self.garbled = 0
+        self.overruns = 0
+
+    @classmethod
+    def pair(cls, baudrate=9600):
+        a = cls(baudrate)
+        b = cls(baudrate)
+        a.far = b
+        b.far = a
+        return a, b
+
+    def write(self, data):
+        if len(self.fifo) + len(data) > self.fifo_size + 1:
+            self.overruns += 1  # A real uart.write() would have blocked here
+        if not self.fifo:
+            self._head_baudrate = self.baudrate
+        self.fifo += data
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self.pending)
+
+    def readinto(self, buf):
+        n = min(len(buf), len(self.pending))
+        buf[:n] = self.pending[:n]
+        del self.pending[:n]
+        return n
+
+    def run(self, ms):
+        """Send what ms of the wire can carry to the far end."""
+        if not self.fifo:
+            return
+        self.sent += ms * self.baudrate / 10000  # 10 bits per byte
+        while self.fifo and self.sent >= 1:
+            b = self.fifo.pop(0)
+            if self._head_baudrate != self.baudrate or self.far.baudrate != self.baudrate:
+                self.garbled += 1
+                b = self.GARBLED
+            self.far.pending.append(b)
+            self.sent -= 1
+            self._head_baudrate = self.baudrate
+        if not self.fifo:
+            self.sent = 0.0
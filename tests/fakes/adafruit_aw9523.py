@@ -0,0 +1,57 @@
+"""Just enough of adafruit_aw9523 for the host tests.
+
+Every I2C write is recorded on the bus as an (address, bytes) transaction,
+and lands in the device's registers with the address auto-incrementing,
+as on the chip.
+"""
+
+
+class I2C:
+    def __init__(self):
+        self.transactions = []
+
+    @property
+    def bytes_written(self):
+        return sum(len(data) for _, data in self.transactions)
+
+
+class I2CDevice:
+    def __init__(self, i2c, address, registers):
+        self.i2c = i2c
+        self.address = address
+        self.registers = registers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write(self, buf, start=0, end=None):
+        data = bytes(buf[start:end])
+        self.i2c.transactions.append((self.address, data))
+        self.registers[data[0]:data[0] + len(data) - 1] = data[1:]
+
+
+class AW9523:
+    def __init__(self, i2c_bus, address=0x58):
+        self.registers = bytearray(256)
+        self.i2c_device = I2CDevice(i2c_bus, address, self.registers)
+
+    def set_constant_current(self, pin, value):
+        if pin < 8:
+            reg = 0x24 + pin
+        elif pin < 12:
+            reg = 0x20 + pin - 8
+        else:
+            reg = 0x2C + pin - 12
+        with self.i2c_device as i2c:
+            i2c.write(bytes([reg, value]))
+
+    def current(self, pin):
+        """The LED current last written for a pin."""
+        if pin < 8:
+            return self.registers[0x24 + pin]
+        if pin < 12:
+            return self.registers[0x20 + pin - 8]
+        return self.registers[0x2C + pin - 12]
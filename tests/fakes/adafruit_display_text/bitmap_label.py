@@ -0,0 +1,31 @@
+"""Just enough of adafruit_display_text.bitmap_label for the host tests.
+
+A Label's bitmap is sized to its text the way the real one is, one glyph
+cell per character, and every Label built is counted in Label.built.
+"""
+
+from displayio import Bitmap
+
+
+class Label:
+    built = 0
+
+    def __init__(self, font, text="", color=0xFFFFFF, line_spacing=1.25, **kwargs):
+        Label.built += 1
+        self.font = font
+        self.text = text
+        self.color = color
+        self.line_spacing = line_spacing
+        self.x = kwargs.get("x", 0)
+        self.y = kwargs.get("y", 0)
+        self.scale = kwargs.get("scale", 1)
+        width, height = font.get_bounding_box()[:2]
+        lines = text.split("\n")
+        if not text:
+            self.bitmap = None
+        else:
+            self.bitmap = Bitmap(
+                max(len(line) for line in lines) * width,
+                height + int(height * line_spacing) * (len(lines) - 1),
+                2,
+            )
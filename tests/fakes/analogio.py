@@ -0,0 +1,18 @@
+"""Just enough of CircuitPython's analogio for the host tests.
+
+An AnalogIn reads from the values the test gives it, in turn, and counts
+its reads.
+"""
+
+
+class AnalogIn:
+    def __init__(self, pin, values=(0,)):
+        self.pin = pin
+        self.values = list(values)
+        self.reads = 0
+
+    @property
+    def value(self):
+        value = self.values[self.reads % len(self.values)]
+        self.reads += 1
+        return value
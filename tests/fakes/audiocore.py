@@ -0,0 +1,14 @@
+"""Just enough of CircuitPython's audiocore for the host tests."""
+
+
+class RawSample:
+    def __init__(self, buffer, channel_count=1, sample_rate=8000):
+        self.buffer = buffer
+        self.channel_count = channel_count
+        self.sample_rate = sample_rate
+
+
+class WaveFile:
+    def __init__(self, file, buffer=None):
+        self.file = file
+        self.buffer = buffer
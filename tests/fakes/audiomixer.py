@@ -0,0 +1,29 @@
+"""Just enough of CircuitPython's audiomixer for the host tests.
+
+A voice keeps playing until the test stops it.
+"""
+
+
+class MixerVoice:
+    def __init__(self):
+        self.sample = None
+        self.loop = False
+        self.playing = False
+        self.level = 1.0
+
+    def play(self, sample, loop=False):
+        self.sample = sample
+        self.loop = loop
+        self.playing = True
+
+    def stop(self):
+        self.playing = False
+
+
+class Mixer:
+    def __init__(self, voice_count=2, sample_rate=8000, channel_count=2, bits_per_sample=16, samples_signed=True):
+        self.voice = tuple(MixerVoice() for _ in range(voice_count))
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.bits_per_sample = bits_per_sample
+        self.samples_signed = samples_signed
@@ -0,0 +1,73 @@
+import random
+import time
+
+from analog_filter import AnalogFilter
+
+NUM_SAMPLES = 20  # NUM_POP_BUMPER_SAMPLES
+NUM_BUMPERS = 3
+PASSES = 20000
+
+
+def readings(seed=1):
+    rng = random.Random(seed)
+    # Mostly idle sensor noise, with the odd hit well above it
+    return [[rng.randint(30000, 31000) if rng.random() > 0.01 else 60000 for _ in range(NUM_BUMPERS)]
+            for _ in range(PASSES)]
+
+
+def test_sum_matches_a_list_average():
+    filt = AnalogFilter(NUM_BUMPERS, NUM_SAMPLES)
+    lists = [[0] * NUM_SAMPLES for _ in range(NUM_BUMPERS)]
+    for values in readings()[:500]:
+        for i in range(NUM_BUMPERS):
+            lists[i].append(values[i])
+            lists[i].pop(0)
+            assert filt.add(i, values[i]) == sum(lists[i])
+
+
+def test_sum_threshold_matches_an_average_threshold():
+    filt = AnalogFilter(1, NUM_SAMPLES)
+    threshold = filt.sum_threshold(30500)
+    samples = [30500] * (NUM_SAMPLES - 1) + [30501]
+    for value in samples:
+        total = filt.add(0, value)
+    assert (total > threshold) == (sum(samples) / NUM_SAMPLES > 30500)
+
+
+def list_pass(pop_bumper_vals, max_pb_val, values):
+    """The main loop's pop bumper check as it was, with lists and float averages."""
+    hits = 0
+    for i in range(NUM_BUMPERS):
+        pop_bumper_vals[i].append(values[i])
+        pop_bumper_vals[i].pop(0)
+        avg_val = sum(pop_bumper_vals[i]) / len(pop_bumper_vals[i])
+        if avg_val > max_pb_val[i]:
+            hits += 1
+    return hits
+
+
+def filter_pass(filt, max_pb_sum, values):
+    hits = 0
+    for i in range(NUM_BUMPERS):
+        if filt.add(i, values[i]) > max_pb_sum[i]:
+            hits += 1
+    return hits
+
+
+def test_benchmark_loop_rate():
+    data = readings()
+    pop_bumper_vals = [[0] * NUM_SAMPLES for _ in range(NUM_BUMPERS)]
+    max_pb_val = [32000] * NUM_BUMPERS
+    start = time.perf_counter()
+    list_hits = [list_pass(pop_bumper_vals, max_pb_val, values) for values in data]
+    list_time = time.perf_counter() - start
+
+    filt = AnalogFilter(NUM_BUMPERS, NUM_SAMPLES)
+    max_pb_sum = [filt.sum_threshold(32000)] * NUM_BUMPERS
+    start = time.perf_counter()
+    filter_hits = [filter_pass(filt, max_pb_sum, values) for values in data]
+    filter_time = time.perf_counter() - start
+
+    print(f"pop bumper passes/s: {PASSES / list_time:.0f} with lists, {PASSES / filter_time:.0f} with AnalogFilter")
+    # Same decisions, whatever the host's speed
+    assert filter_hits == list_hits
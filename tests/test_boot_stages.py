@@ -0,0 +1,180 @@
+"""Boots fake soundController peripherals through BootStages on a fake clock.
+
+The stages follow code.py's: the FX board is held in reset briefly and
+then takes a while to print its startup messages, the SD card blocks
+while it's set up and mounted, and the neopixels take a moment to show.
+"""
+
+import pytest
+
+import boot_stages
+from boot_stages import BootStages
+from fake_uart import FakeUART
+from ticks import TICKS_MAX, ticks_add, ticks_diff, ticks_expired
+from uartlink import LineReader
+
+FX_RESET_MS = 10
+FX_STARTUP_MS = 800  # From reset until the FX board has read its flash
+FX_BOOT_TIMEOUT = 2000
+SD_INIT_MS = 100
+SD_MOUNT_MS = 50
+LED_SHOW_MS = 5
+POLL_MS = 1  # Each idle() call, polling the other pico's UART
+BANNER = b"Adafruit FX Sound Board 9/10/14\r\n\r\nFAT16\r\nFiles: 12\r\n"
+
+
+class Clock:
+    def __init__(self, start=0):
+        self.now = start
+
+    def ticks_ms(self):
+        return self.now
+
+    def wait(self, ms):
+        self.now = ticks_add(self.now, ms)
+
+
+class FXBoardUART(FakeUART):
+    """The FX board's UART, which starts talking a while after it comes out of reset."""
+
+    def __init__(self, clock, startup_ms):
+        super().__init__()
+        self.clock = clock
+        self.startup_ms = startup_ms
+        self.ready = None
+
+    def release_reset(self):
+        if self.startup_ms is not None:
+            self.ready = ticks_add(self.clock.now, self.startup_ms)
+
+    @property
+    def in_waiting(self):
+        if self.ready is not None and ticks_diff(self.clock.now, self.ready) >= 0:
+            self.arrive(BANNER)
+            self.ready = None
+        return len(self.pending)
+
+
+def reset_fx_board(clock, uart, reader, log):
+    deadline = ticks_add(clock.now, FX_RESET_MS)
+    while not ticks_expired(deadline, clock.now):
+        yield
+    uart.release_reset()
+    deadline = ticks_add(clock.now, FX_BOOT_TIMEOUT)
+    while True:
+        length = reader.readline()
+        if length:
+            if reader.line[:3] == b"FAT":
+                log.append("fx ready")
+                break
+        elif ticks_expired(deadline, clock.now):
+            log.append("fx timed out")
+            break
+        else:
+            yield
+    uart.write(b"L\r\n")
+
+
+def mount_sd(clock, log):
+    yield
+    clock.wait(SD_INIT_MS)
+    yield
+    clock.wait(SD_MOUNT_MS)
+    log.append("sd mounted")
+
+
+def light_leds(clock, log):
+    clock.wait(LED_SHOW_MS)
+    yield
+    clock.wait(LED_SHOW_MS)
+    log.append("leds lit")
+
+
+def boot(clock, fx_startup_ms=FX_STARTUP_MS):
+    """Run the boot stages and return (BootStages, ms to INI, FX board UART, log, idle calls)."""
+    uart = FXBoardUART(clock, fx_startup_ms)
+    reader = LineReader(uart)
+    log = []
+    polls = []
+
+    def poll():
+        polls.append(clock.now)
+        clock.wait(POLL_MS)
+
+    start = clock.now
+    stages = BootStages(start)
+    stages.add("fx", reset_fx_board(clock, uart, reader, log))
+    stages.add("sd", mount_sd(clock, log))
+    stages.add("leds", light_leds(clock, log))
+    stages.run(poll)
+    ini_ms = ticks_diff(clock.now, start)
+    print(f"time to INI {ini_ms}ms: {stages.report()}")
+    return stages, ini_ms, uart, log, polls
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(boot_stages, "ticks_ms", clock.ticks_ms)
+    return clock
+
+
+def test_stages_overlap(clock):
+    stages, ini_ms, uart, log, polls = boot(clock)
+    sequential = FX_RESET_MS + FX_STARTUP_MS + SD_INIT_MS + SD_MOUNT_MS + 2 * LED_SHOW_MS
+    assert ini_ms < sequential
+    # The SD card and LEDs are done while the FX board is still starting up
+    assert log == ["leds lit", "sd mounted", "fx ready"]
+    # Only the SD card's blocking step, not its mount, holds up the FX board's reset
+    assert FX_RESET_MS + FX_STARTUP_MS <= ini_ms <= FX_STARTUP_MS + SD_INIT_MS + 2 * LED_SHOW_MS + 3 * POLL_MS
+    assert uart.written == [b"L\r\n"]
+
+
+def test_finish_and_busy_times(clock):
+    stages, ini_ms, _, _, _ = boot(clock)
+    fx, sd, leds = stages.finished
+    assert max(stages.finished) == fx <= ini_ms
+    assert sd < fx and leds < fx
+    assert stages.busy[1] == SD_INIT_MS + SD_MOUNT_MS
+    assert stages.busy[2] == 2 * LED_SHOW_MS
+    # Waiting on the FX board is spent on the other stages, not counted as its own
+    assert stages.busy[0] == 0
+    assert stages.report() == f"fx={fx}ms/0ms sd={sd}ms/150ms leds={leds}ms/10ms"
+
+
+def test_idle_called_after_every_round(clock):
+    stages, ini_ms, _, _, polls = boot(clock)
+    # Every round polls once, so the other pico's bytes never wait longer than a round
+    gaps = [ticks_diff(b, a) for a, b in zip(polls, polls[1:])]
+    assert max(gaps) <= SD_INIT_MS + LED_SHOW_MS + POLL_MS
+    assert len(polls) > FX_STARTUP_MS // (POLL_MS + SD_MOUNT_MS)
+
+
+def test_silent_fx_board_times_out_without_holding_up_the_rest(clock):
+    stages, ini_ms, uart, log, _ = boot(clock, fx_startup_ms=None)
+    assert log == ["leds lit", "sd mounted", "fx timed out"]
+    assert stages.finished[0] > FX_BOOT_TIMEOUT
+    assert stages.finished[1] < SD_INIT_MS + SD_MOUNT_MS + 2 * LED_SHOW_MS + 3 * POLL_MS
+    assert uart.written == [b"L\r\n"]
+
+
+def test_boot_across_the_tick_wrap(monkeypatch):
+    clock = Clock(TICKS_MAX - 300)
+    monkeypatch.setattr(boot_stages, "ticks_ms", clock.ticks_ms)
+    stages, ini_ms, _, log, _ = boot(clock)
+    assert log[-1] == "fx ready"
+    assert 0 < ini_ms < 1000
+    assert all(0 < t <= ini_ms for t in stages.finished)
+
+
+def test_a_stage_with_no_waits(clock):
+    def instant():
+        clock.wait(3)
+        return
+        yield
+
+    stages = BootStages(clock.now)
+    stages.add("now", instant())
+    stages.run()
+    assert stages.finished == [3]
+    assert stages.busy == [3]
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from digits import DigitDisplay
+from fake_font import GLYPH_HEIGHT, GLYPH_WIDTH, FakeFont
+
+SCORE_DIGITS = 8
+SCALE = 3  # The score's text group is scaled 3x on the TFT
+BYTES_PER_PIXEL = 2  # RGB565 over SPI
+TILE_BYTES = GLYPH_WIDTH * GLYPH_HEIGHT * SCALE * SCALE * BYTES_PER_PIXEL
+
+
+def shown(display):
+    """The number the tiles spell out, blanks dropped."""
+    grid = display.tile_grid
+    return "".join(chr(grid[col, 0] + 32) for col in range(display.num_digits)).strip()
+
+
+def test_digits_are_right_aligned():
+    display = DigitDisplay(FakeFont(), 0xFFFFFF, SCORE_DIGITS)
+    assert display.update()
+    assert shown(display) == "0"
+    display.value = 12345
+    display.update()
+    assert shown(display) == "12345"
+    assert display.tile_grid[SCORE_DIGITS - 1, 0] == ord("5") - 32
+    display.value = 10 ** SCORE_DIGITS + 7
+    display.update()
+    assert shown(display) == "9" * SCORE_DIGITS
+
+
+def test_only_changed_digits_are_written():
+    display = DigitDisplay(FakeFont(), 0xFFFFFF, SCORE_DIGITS, value=12000)
+    display.update()
+    writes = display.tile_grid.tile_writes
+    display.value = 12100
+    display.update()
+    assert display.tile_grid.tile_writes - writes == 1
+
+
+def test_several_changes_in_a_pass_update_once():
+    display = DigitDisplay(FakeFont(), 0xFFFFFF, SCORE_DIGITS)
+    display.update()
+    for points in (100, 200, 300):
+        display.value += points
+    assert display.update()
+    assert not display.update()
+    assert shown(display) == "600"
+
+
+def label_bytes(score):
+    """What redrawing the old scaled label pushed: every character of the score."""
+    return len(str(score)) * TILE_BYTES
+
+
+@pytest.mark.parametrize("points", [10, 100, 1000])
+def test_benchmark_spi_bytes_and_time_per_score_update(points):
+    display = DigitDisplay(FakeFont(), 0xFFFFFF, SCORE_DIGITS)
+    display.update()
+    score = 0
+    label_total = 0
+    updates = 500
+    writes = display.tile_grid.tile_writes
+    start = time.perf_counter()
+    for _ in range(updates):
+        score += points
+        display.value = score
+        display.update()
+        label_total += label_bytes(score)
+    elapsed = time.perf_counter() - start
+    tile_total = (display.tile_grid.tile_writes - writes) * TILE_BYTES
+    print(f"+{points} per update: {tile_total // updates} SPI bytes/update as tiles, {label_total // updates} as a label, "
+          f"{elapsed / updates * 1e6:.1f}us/update")
+    assert tile_total < label_total
@@ -0,0 +1,110 @@
+import pytest
+
+from fake_uart import FakeUART
+from frames import HEADER_LEN, MAX_FRAME_LEN, OPCODES, SYNC, crc8, decode_frame, encode_frame
+from protocol import Command
+from uartlink import LineReader
+
+# Typical traffic from the solenoidDriver and to the soundController
+TRAFFIC = [b"FLU", b"FRU", b"PB 1", b"FLD", b"DT 3", b"FRD", b"SND 12", b"PNT 2500", b"IR 2", b"RNK 4"]
+
+
+def encode(text, seq=0):
+    command = Command()
+    assert command.parse(text)
+    out = bytearray(MAX_FRAME_LEN)
+    length = encode_frame(command, seq, out)
+    return bytes(out[:length])
+
+
+def decode(frame):
+    line = bytearray(128)
+    length = decode_frame(frame, line)
+    return bytes(line[:length])
+
+
+def read_all(reader):
+    lines = []
+    while True:
+        n = reader.readline()
+        if not n:
+            return lines
+        lines.append(bytes(reader.line[:n]))
+
+
+@pytest.mark.parametrize("name", OPCODES)
+@pytest.mark.parametrize("args", [(), (0,), (127,), (128,), (16383, 16384), (1, 2, 3, (1 << 28) - 1)])
+def test_round_trip(name, args):
+    text = b" ".join([name] + [b"%d" % arg for arg in args]) + b"\r\n"
+    frame = encode(text, seq=7)
+    assert frame[0] == SYNC
+    assert frame[2] == 7
+    assert decode(frame) == text
+
+
+def test_what_frames_cannot_carry():
+    assert encode(b"SLG L\r\n") == b""
+    assert encode(b"PNT -5\r\n") == b""
+    assert encode(b"PNT %d\r\n" % (1 << 28)) == b""
+    assert encode(b"INI solenoidDriver BIN\r\n") == b""
+
+
+def test_crc_error_is_detected():
+    frame = bytearray(encode(b"PNT 2500\r\n"))
+    # The length byte is checked against what arrived before a frame is decoded
+    for i in range(2, len(frame)):
+        corrupt = bytearray(frame)
+        corrupt[i] ^= 0x10
+        assert decode(corrupt) == b""
+
+
+def test_truncated_varint_is_corrupt():
+    # The last argument byte says another follows, but the frame ends there
+    frame = bytearray([SYNC, 2, 0, OPCODES.index(b"PNT"), 0x85, 0])
+    frame[-1] = crc8(frame, 1, len(frame) - 1)
+    assert decode(frame) == b""
+
+
+def test_reader_skips_a_corrupt_frame_and_resyncs():
+    uart = FakeUART()
+    reader = LineReader(uart)
+    reader.frames = True
+    bad = bytearray(encode(b"PB 1\r\n", seq=0))
+    bad[-1] ^= 0xFF
+    uart.arrive(bad + encode(b"PB 2\r\n", seq=1) + b"STR ok\r\n")
+    assert read_all(reader) == [b"PB 2\r\n", b"STR ok\r\n"]
+    assert reader.frame_errors == 1
+    assert reader.seq_gaps == 0
+
+
+def test_reader_waits_for_a_truncated_frame():
+    uart = FakeUART()
+    reader = LineReader(uart)
+    reader.frames = True
+    frame = encode(b"PNT 2500\r\n")
+    uart.arrive(frame[:HEADER_LEN + 1])
+    assert reader.readline() == 0
+    uart.arrive(frame[HEADER_LEN + 1:])
+    assert read_all(reader) == [b"PNT 2500\r\n"]
+    assert reader.frame_errors == 0
+
+
+def test_reader_counts_seq_gaps():
+    uart = FakeUART()
+    reader = LineReader(uart)
+    reader.frames = True
+    for seq in (254, 255, 2, 3):  # 0 and 1 went missing, across the wrap
+        uart.arrive(encode(b"PB 1\r\n", seq=seq))
+    assert len(read_all(reader)) == 4
+    assert reader.seq_gaps == 2
+
+
+def test_frames_carry_more_messages_per_second():
+    text_bytes = sum(len(text) + 2 for text in TRAFFIC)
+    frame_bytes = sum(len(encode(text + b"\r\n")) for text in TRAFFIC)
+    text_rate = len(TRAFFIC) * 960 / text_bytes  # 9600 baud is 960 bytes/s
+    frame_rate = len(TRAFFIC) * 5760 / frame_bytes  # The 57600 baud binary links
+    print(f"{text_rate:.0f} messages/s as text at 9600 baud, {frame_rate:.0f} as frames at 57600 baud "
+          f"({text_bytes} vs {frame_bytes} bytes)")
+    assert frame_bytes < text_bytes
+    assert frame_rate > 6 * text_rate
@@ -0,0 +1,152 @@
+from fake_uart import FakeUART
+from fx_board import (
+    FXBoard, PLAY_TIMEOUT, PRIORITY_CRITICAL, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL,
+    START_TIMEOUT, STOP_TIMEOUT, STATE_IDLE, STATE_PLAYING, STATE_STARTING, STATE_STOPPING,
+)
+from ticks import TICKS_MAX, ticks_add
+from uartlink import LineReader
+
+
+def make_board():
+    uart = FakeUART()
+    return uart, FXBoard(uart, LineReader(uart))
+
+
+def test_plays_when_idle():
+    uart, fx = make_board()
+    assert fx.play(3, PRIORITY_NORMAL, 0)
+    assert uart.written == [b"#3\r\n"]
+    assert fx.state == STATE_STARTING
+    uart.arrive(b"play 3 SOUND4  WAV\r\n")
+    fx.update(10)
+    assert fx.state == STATE_PLAYING
+    uart.arrive(b"done\r\n")
+    fx.update(500)
+    assert fx.state == STATE_IDLE
+    assert fx.sound is None
+    assert fx.played == 1
+
+
+def test_reply_split_across_updates():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_NORMAL, 0)
+    uart.arrive(b"pl")
+    fx.update(5)
+    assert fx.state == STATE_STARTING
+    uart.arrive(b"ay\r\n")
+    fx.update(6)
+    assert fx.state == STATE_PLAYING
+
+
+def test_higher_priority_stops_the_playing_sound_then_starts():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_LOW, 0)
+    uart.arrive(b"play\r\n")
+    fx.update(10)
+    assert fx.play(7, PRIORITY_HIGH, 20)
+    assert uart.written[-1] == b"q\r\n"
+    assert fx.state == STATE_STOPPING
+    assert fx.preempted == 1
+    uart.arrive(b"done\r\n")
+    fx.update(30)
+    assert uart.written[-1] == b"#7\r\n"
+    assert fx.state == STATE_STARTING
+    assert fx.sound == 7
+    assert fx.priority == PRIORITY_HIGH
+
+
+def test_lower_priority_is_dropped():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_HIGH, 0)
+    assert not fx.play(2, PRIORITY_LOW, 5)
+    assert fx.dropped == 1
+    assert uart.written == [b"#1\r\n"]
+
+
+def test_queued_sound_is_replaced_by_a_later_one():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_LOW, 0)
+    fx.play(2, PRIORITY_NORMAL, 5)
+    assert not fx.play(3, PRIORITY_LOW, 6)
+    assert fx.play(4, PRIORITY_CRITICAL, 7)
+    assert fx.dropped == 2
+    # Only one q for the playing sound, however many times the queue changes
+    assert uart.written == [b"#1\r\n", b"q\r\n"]
+    uart.arrive(b"done\r\n")
+    fx.update(20)
+    assert uart.written[-1] == b"#4\r\n"
+
+
+def test_no_file_frees_the_board():
+    uart, fx = make_board()
+    fx.play(99, PRIORITY_NORMAL, 0)
+    uart.arrive(b"NoFile\r\n")
+    fx.update(10)
+    assert fx.state == STATE_IDLE
+    assert fx.timeouts == 0
+
+
+def test_start_timeout():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_NORMAL, 0)
+    fx.update(START_TIMEOUT)
+    assert fx.state == STATE_STARTING
+    fx.update(START_TIMEOUT + 1)
+    assert fx.state == STATE_IDLE
+    assert fx.timeouts == 1
+
+
+def test_late_done_after_a_start_timeout_is_ignored():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_NORMAL, 0)
+    fx.update(START_TIMEOUT + 1)
+    fx.play(2, PRIORITY_NORMAL, START_TIMEOUT + 2)
+    uart.arrive(b"done\r\n")
+    fx.update(START_TIMEOUT + 3)
+    assert fx.state == STATE_STARTING
+    assert fx.sound == 2
+
+
+def test_stop_timeout_starts_the_queued_sound():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_LOW, 0)
+    uart.arrive(b"play\r\n")
+    fx.update(1)
+    fx.play(2, PRIORITY_HIGH, 10)
+    fx.update(10 + STOP_TIMEOUT + 1)
+    assert fx.timeouts == 1
+    assert uart.written[-1] == b"#2\r\n"
+    assert fx.state == STATE_STARTING
+
+
+def test_play_timeout():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_NORMAL, 0)
+    uart.arrive(b"play\r\n")
+    fx.update(10)
+    fx.update(10 + PLAY_TIMEOUT)
+    assert fx.state == STATE_PLAYING
+    fx.update(10 + PLAY_TIMEOUT + 1)
+    assert fx.state == STATE_IDLE
+    assert fx.timeouts == 1
+
+
+def test_timeout_across_the_tick_wrap():
+    uart, fx = make_board()
+    now = TICKS_MAX - 100
+    fx.play(1, PRIORITY_NORMAL, now)
+    fx.update(ticks_add(now, START_TIMEOUT))
+    assert fx.state == STATE_STARTING
+    fx.update(ticks_add(now, START_TIMEOUT + 1))
+    assert fx.state == STATE_IDLE
+
+
+def test_stop_forgets_the_queued_sound():
+    uart, fx = make_board()
+    fx.play(1, PRIORITY_LOW, 0)
+    fx.play(2, PRIORITY_HIGH, 5)
+    fx.stop(6)
+    uart.arrive(b"done\r\n")
+    fx.update(10)
+    assert fx.state == STATE_IDLE
+    assert b"#2\r\n" not in uart.written
@@ -0,0 +1,18 @@
+import pytest
+
+from game_state import MODE_STARTUP, GameState
+
+
+def test_every_field_starts_set():
+    state = GameState(1234, "Launch Ball")
+    for name in GameState.__slots__:
+        getattr(state, name)
+    assert state.game_mode == MODE_STARTUP
+    assert state.cur_hyperspace_trigger_timer == 1234
+    assert state.current_status_text == "Launch Ball"
+
+
+def test_misspelt_field_fails():
+    state = GameState(0, "")
+    with pytest.raises(AttributeError):
+        state.scroe = 10
@@ -0,0 +1,326 @@
+import random
+import time
+
+import pytest
+
+from adafruit_aw9523 import AW9523, I2C
+from lamps import GAMMA, NUM_PINS, BlinkEngine, FadeEngine, LampFramebuffer, LampGroup, LampSequencer, chase
+
+# As in displayController/code.py
+pins = [0, 11, 10, 9, 8, 1, 2, 3, 4, 5, 6, 7, 12, 13, 14, 15]
+LIGHT_LEFT_FLIPPER = [0, pins[3]]
+LIGHT_DROP_TARGET = [[0, pins[5]], [0, pins[6]], [0, pins[7]]]
+LIGHT_HYPERSPACE_ARROW = [[1, pins[0]], [1, pins[1]], [1, pins[2]]]
+LIGHT_RE_ENTRY = [[1, pins[8]], [1, pins[9]], [1, pins[10]]]
+LIGHT_HYPERSPACE_BAR = [[1, pins[11]], [1, pins[12]], [1, pins[13]], [1, pins[14]]]
+ALL_LIGHTS = [[device, pin] for device in range(2) for pin in range(NUM_PINS)]
+
+
+def game_events():
+    """(name, [(light, state), ...]) for the game events that change the most lamps."""
+    rng = random.Random(3)
+    return [
+        ("boards initialized", [(light, False) for light in ALL_LIGHTS] + [(light, True) for light in LIGHT_DROP_TARGET]),
+        ("flipper up", [(LIGHT_LEFT_FLIPPER, True)] + [(light, i != 1) for i, light in enumerate(LIGHT_RE_ENTRY)]),
+        ("hyperspace", [(light, True) for light in LIGHT_HYPERSPACE_BAR + LIGHT_HYPERSPACE_ARROW]),
+        ("game over frame", [(light, rng.random() > 0.5) for light in ALL_LIGHTS]),
+    ]
+
+
+def make_devices():
+    bus = I2C()
+    return bus, [AW9523(bus), AW9523(bus, address=0x59)]
+
+
+def test_flush_writes_only_changed_registers():
+    bus, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    lamps.flush()
+    assert bus.transactions == []
+    lamps.set(0, 3, 255)
+    lamps.set(0, 3, 0)
+    lamps.set(1, 9, 128)
+    lamps.flush()
+    # Pin 3 is back where it started, but still gets written once
+    assert len(bus.transactions) == 2
+    assert devices[1].current(9) == 128
+    assert lamps.get(1, 9) == 128
+    lamps.flush()
+    assert len(bus.transactions) == 2
+
+
+def test_write_group_only_touches_the_group():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    lamps.set(1, 7, 255)
+    bar = LampGroup(LIGHT_HYPERSPACE_BAR)
+    lamps.write_group(bar, bar.frame([0, 2]))
+    lamps.flush()
+    assert [devices[1].current(pin) for _, pin in LIGHT_HYPERSPACE_BAR] == [255, 0, 255, 0]
+    assert devices[1].current(7) == 255
+
+
+@pytest.mark.parametrize("name, changes", game_events())
+def test_i2c_transactions_per_game_event(name, changes):
+    old_bus, old_devices = make_devices()
+    for (device, pin), state in changes:
+        old_devices[device].set_constant_current(pin, 255 if state else 0)
+
+    bus, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    for (device, pin), state in changes:
+        lamps.set(device, pin, 255 if state else 0)
+    lamps.flush()
+
+    print(f"{name}: {len(old_bus.transactions)} transactions/{old_bus.bytes_written} bytes lamp by lamp, "
+          f"{len(bus.transactions)}/{bus.bytes_written} from the framebuffer")
+    for device in range(2):
+        for pin in range(NUM_PINS):
+            assert devices[device].current(pin) == old_devices[device].current(pin)
+    assert len(bus.transactions) <= 2
+    assert len(bus.transactions) <= len(old_bus.transactions)
+
+
+def test_hyperspace_arrow_show_matches_per_lamp_writes():
+    # The old animation rotated a list of states every frame and wrote every lamp
+    old_bus, old_devices = make_devices()
+    animation = [False, False, False, False, False, False, True]
+
+    bus, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    shows = LampSequencer(lamps)
+    show = chase(LampGroup(LIGHT_HYPERSPACE_ARROW), 125, gap=4)
+    shows.start(show, 0)
+    frames = 3 * len(animation) + 2
+    for now in range(125, 125 * (frames + 1), 125):
+        animation = [animation[-1]] + animation[:-1]
+        for i, (device, pin) in enumerate(LIGHT_HYPERSPACE_ARROW):
+            old_devices[device].set_constant_current(pin, 255 if animation[i] else 0)
+        shows.update(now)
+        lamps.flush()
+        for device in range(2):
+            for pin in range(NUM_PINS):
+                assert devices[device].current(pin) == old_devices[device].current(pin), now
+
+    # Stopping turned every arrow lamp off
+    for device, pin in LIGHT_HYPERSPACE_ARROW:
+        old_devices[device].set_constant_current(pin, 0)
+    shows.stop(show)
+    lamps.flush()
+    for device, pin in LIGHT_HYPERSPACE_ARROW:
+        assert devices[device].current(pin) == old_devices[device].current(pin) == 0
+    print(f"{frames} arrow frames: {len(old_bus.transactions)} transactions lamp by lamp, "
+          f"{len(bus.transactions)} from the sequencer")
+    # Only frames that change a lamp are written, so the dark frames cost nothing
+    assert len(bus.transactions) < len(old_bus.transactions)
+
+
+def test_blink_toggles_then_settles_and_calls_back():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    blinks = BlinkEngine(lamps)
+    done = []
+    blinks.start(LIGHT_RE_ENTRY, 4, 100, True, 0, on_complete=lambda: done.append(1))
+    levels = []
+    for now in range(1, 700):
+        blinks.update(now)
+        levels.append(lamps.get(1, pins[8]))
+    # Toggles just after each period: on, off, on, off, then settles on
+    changes = [now for now in range(1, len(levels)) if levels[now] != levels[now - 1]]
+    assert len(changes) == 5
+    assert levels[-1] == 255
+    assert done == [1]
+
+
+def test_cancel_by_lamp_stops_the_whole_blink():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    blinks = BlinkEngine(lamps)
+    done = []
+    blinks.start(LIGHT_HYPERSPACE_BAR, 10, 50, False, 0, on_complete=lambda: done.append(1))
+    blinks.cancel([LIGHT_HYPERSPACE_BAR[2]], call_callback=False)
+    for now in range(1, 1000, 10):
+        blinks.update(now)
+    assert done == []
+    assert all(lamps.get(*light) == 0 for light in LIGHT_HYPERSPACE_BAR)
+
+
+def test_blink_with_every_slot_in_use_is_dropped():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    blinks = BlinkEngine(lamps)
+    # Blinks of no lamps can't be cancelled by a new blink's lamps
+    for _ in ALL_LIGHTS:
+        assert blinks.start([], 5, 50, False, 0)
+    assert not blinks.start([LIGHT_LEFT_FLIPPER], 5, 50, False, 0)
+    blinks.update(60)
+    assert lamps.get(*LIGHT_LEFT_FLIPPER) == 0
+
+
+def test_benchmark_32_lamps_blinking():
+    bus, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    blinks = BlinkEngine(lamps)
+    done = []
+    for i, light in enumerate(ALL_LIGHTS):
+        blinks.start([light], 20, 25 + i, i % 2 == 0, 0, on_complete=lambda i=i: done.append(i))
+    updates = 0
+    start = time.perf_counter()
+    now = 0
+    while len(done) < len(ALL_LIGHTS):
+        now += 1
+        blinks.update(now)
+        lamps.flush()
+        updates += 1
+    elapsed = time.perf_counter() - start
+    print(f"32 lamps blinking: {updates / elapsed:.0f} updates/s, {len(bus.transactions)} I2C transactions "
+          f"over {now}ms of blinking")
+    assert sorted(done) == list(range(len(ALL_LIGHTS)))
+    for i, (device, pin) in enumerate(ALL_LIGHTS):
+        assert devices[device].current(pin) == (255 if i % 2 == 0 else 0)
+    # One transaction per device per ms at most, whatever the number of lamps changing
+    assert len(bus.transactions) <= 2 * now
+
+
+def test_fade_ramp_values():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    fades = FadeEngine(lamps)
+    fades.update(0)
+    fades.fade_to(0, 5, 255, 255)
+    levels = []
+    for now in range(1, 300):
+        fades.update(now)
+        levels.append(lamps.get(0, 5))
+    # A linear ramp in brightness, one step per ms, through the gamma table
+    assert levels[:255] == [GAMMA[now] for now in range(1, 256)]
+    assert levels[-1] == 255
+    fades.fade_to(0, 5, 0, 100)
+    for now in range(300, 401, 10):
+        fades.update(now)
+    assert lamps.get(0, 5) == 0
+
+
+def test_pulse_bounces_between_its_levels():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    fades = FadeEngine(lamps)
+    fades.fade_to(*LIGHT_LEFT_FLIPPER, 20, 1)
+    fades.update(0)
+    fades.update(1)
+    fades.pulse([LIGHT_LEFT_FLIPPER], 500, low=20, high=200)
+    levels = []
+    for now in range(2, 1002):
+        fades.update(now)
+        levels.append(lamps.get(*LIGHT_LEFT_FLIPPER))
+    # Bouncing off the ends means a peak can fall just short of high
+    assert GAMMA[20] <= min(levels) <= GAMMA[21]
+    assert GAMMA[199] <= max(levels) <= GAMMA[200]
+    # Up for half the period, then down: peaks near 250ms and 750ms, a trough near 500ms
+    peak = max(levels)
+    assert abs(levels.index(peak) - 250) <= 4
+    assert abs(levels[500:].index(peak) + 500 - 750) <= 4
+    assert min(levels[490:510]) <= GAMMA[21]
+    fades.stop([LIGHT_LEFT_FLIPPER])
+    level = lamps.get(*LIGHT_LEFT_FLIPPER)
+    fades.update(1100)
+    assert lamps.get(*LIGHT_LEFT_FLIPPER) == level
+
+
+def test_pulse_from_below_its_low_level_rises_into_it():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    fades = FadeEngine(lamps)
+    fades.update(0)
+    fades.pulse([LIGHT_LEFT_FLIPPER], 500, low=100, high=200)
+    levels = []
+    for now in range(1, 260):
+        fades.update(now)
+        levels.append(lamps.get(*LIGHT_LEFT_FLIPPER))
+    assert levels == sorted(levels)
+    assert levels[-1] >= GAMMA[100]
+
+
+@pytest.mark.parametrize("fps", [30, 60, 100])
+def test_i2c_writes_per_second_while_fading(fps):
+    bus, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    fades = FadeEngine(lamps)
+    frame = 1000 // fps
+    fades.update(0)
+    # Mission arrows breathing while the rest of the lamps fade up
+    fades.pulse(LIGHT_HYPERSPACE_ARROW, 500)
+    for device, pin in ALL_LIGHTS:
+        if [device, pin] not in LIGHT_HYPERSPACE_ARROW:
+            fades.fade_to(device, pin, 255, 750)
+    for now in range(frame, 1000 + frame, frame):
+        fades.update(now)
+        lamps.flush()
+    frames = 1000 // frame
+    print(f"{fps} fps: {len(bus.transactions)} I2C writes/s, {bus.bytes_written} bytes/s")
+    # One burst per expander per frame, however many lamps are fading
+    assert len(bus.transactions) <= 2 * frames
+    assert bus.bytes_written <= 2 * frames * (NUM_PINS + 1)
+
+
+def make_engines():
+    _, devices = make_devices()
+    lamps = LampFramebuffer(devices)
+    return lamps, LampSequencer(lamps), BlinkEngine(lamps), FadeEngine(lamps)
+
+
+def test_blink_takes_its_lamps_from_a_fade():
+    lamps, _, blinks, fades = make_engines()
+    fades.pulse(LIGHT_HYPERSPACE_BAR, 400)
+    fades.update(0)
+    blinks.start([LIGHT_HYPERSPACE_BAR[1]], 4, 100, True, 0)
+    for now in range(1, 552, 10):
+        fades.update(now)
+        blinks.update(now)
+    # Only the blinking lamp stopped fading
+    assert lamps.get(*LIGHT_HYPERSPACE_BAR[1]) == 255
+    assert 0 < lamps.get(*LIGHT_HYPERSPACE_BAR[0]) < 255
+
+
+def test_fade_takes_its_lamp_from_a_blink_without_calling_back():
+    lamps, _, blinks, fades = make_engines()
+    done = []
+    blinks.start(LIGHT_DROP_TARGET, 10, 100, True, 0, on_complete=lambda: done.append(1))
+    fades.fade_to(*LIGHT_DROP_TARGET[0], 255, 1000)
+    for now in range(0, 2001, 10):
+        blinks.update(now)
+        fades.update(now)
+    # The whole blink stopped, as when a blink takes over another's lamps
+    assert done == []
+    assert lamps.get(*LIGHT_DROP_TARGET[0]) == 255
+    assert lamps.get(*LIGHT_DROP_TARGET[1]) == 0
+
+
+def test_shows_and_fades_take_lamps_from_each_other():
+    lamps, shows, _, fades = make_engines()
+    arrow = LampGroup(LIGHT_HYPERSPACE_ARROW)
+    show = chase(arrow, 100)
+    fades.pulse(LIGHT_HYPERSPACE_ARROW, 400)
+    shows.start(show, 0)
+    for now in range(0, 1000, 10):
+        fades.update(now)
+        shows.update(now)
+    assert [lamps.get(*light) for light in LIGHT_HYPERSPACE_ARROW] == [0, 0, 255]
+    fades.fade_to(*LIGHT_HYPERSPACE_ARROW[0], 128, 100)
+    assert not show.playing
+    for now in range(1000, 1500, 10):
+        fades.update(now)
+        shows.update(now)
+    assert [lamps.get(*light) for light in LIGHT_HYPERSPACE_ARROW] == [GAMMA[128], 0, 255]
+
+
+def test_set_group_stops_fades_on_the_group():
+    lamps, _, _, fades = make_engines()
+    bar = LampGroup(LIGHT_HYPERSPACE_BAR)
+    fades.pulse(LIGHT_HYPERSPACE_BAR + [LIGHT_LEFT_FLIPPER], 400)
+    fades.update(0)
+    fades.update(100)
+    lamps.set_group(bar, False)
+    fades.update(200)
+    assert all(lamps.get(*light) == 0 for light in LIGHT_HYPERSPACE_BAR)
+    assert lamps.get(*LIGHT_LEFT_FLIPPER) > GAMMA[200]
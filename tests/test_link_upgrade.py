@@ -0,0 +1,128 @@
+import pytest
+
+import uartlink
+from fake_uart import WireUART
+from protocol import Command, CommandTable
+from uartlink import LineReader, LinkUpgrade, TxQueue, UPGRADE_DONE, UPGRADE_TIMEOUT
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def ticks_ms(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(uartlink, "ticks_ms", clock.ticks_ms)
+    return clock
+
+
+class Board:
+    """One end of the link, run the way the boards' main loops run it."""
+
+    def __init__(self, uart):
+        self.uart = uart
+        self.reader = LineReader(uart)
+        self.tx = TxQueue(uart)
+        self.upgrade = LinkUpgrade(self.reader, self.tx)
+        self.received = []
+        self.busy_until = 0
+        self.command = Command()
+        self.commands = CommandTable({
+            b"BIN": lambda command, now: self.upgrade.accept(command, now),
+            b"BOK": lambda command, now: self.upgrade.confirmed(command, now),
+            b"INI": lambda command, now: self.upgrade.offer(57600, now),
+        })
+
+    def step(self, now):
+        if now < self.busy_until:
+            return
+        while True:
+            length = self.reader.readline()
+            if not length:
+                break
+            self.command.parse(self.reader.line, length)
+            if not self.commands.dispatch(self.command, now):
+                self.received.append(self.command.text())
+        self.tx.service(now)
+        self.upgrade.update(now)
+
+
+def run(clock, boards, until, sends=()):
+    """Step both boards every ms until until, sending (ms, board, message) as they come up."""
+    sends = list(sends)
+    while clock.now < until:
+        clock.now += 1
+        for board in boards:
+            board.uart.run(1)
+        for when, board, message in sends:
+            if when == clock.now:
+                board.tx.send(message)
+        for board in boards:
+            board.step(clock.now)
+
+
+def test_switch_loses_nothing(clock):
+    display_uart, peer_uart = WireUART.pair()
+    display = Board(display_uart)
+    peer = Board(peer_uart)
+    sends = [(1, peer, "INI solenoidDriver BIN")]
+    # Both boards keep talking the whole way through the switch
+    for ms in range(2, 400, 10):
+        sends.append((ms, peer, f"PB {ms}"))
+        sends.append((ms, display, f"SND {ms}"))
+    run(clock, (display, peer), 600, sends)
+
+    assert display.upgrade.state == UPGRADE_DONE
+    assert peer.upgrade.state == UPGRADE_DONE
+    assert display_uart.baudrate == peer_uart.baudrate == 57600
+    assert display.tx.frames and peer.tx.frames
+    for uart in (display_uart, peer_uart):
+        assert uart.garbled == 0
+        assert uart.overruns == 0
+    for board in (display, peer):
+        assert board.reader.frame_errors == 0
+        assert board.reader.seq_gaps == 0
+    assert display.received == [f"PB {ms}\r\n" for ms in range(2, 400, 10)]
+    assert peer.received == [f"SND {ms}\r\n" for ms in range(2, 400, 10)]
+
+
+def test_switch_waits_for_a_busy_board(clock):
+    display_uart, peer_uart = WireUART.pair()
+    display = Board(display_uart)
+    peer = Board(peer_uart)
+    peer.tx.send("INI soundController BIN")
+    # Loading sound effects right after sending INI
+    peer.busy_until = 3 * UPGRADE_TIMEOUT
+    sends = [(ms, display, f"SND {ms}") for ms in range(10, 2000, 50)]
+    run(clock, (display, peer), 2500, sends)
+
+    assert display.upgrade.state == UPGRADE_DONE
+    assert peer.upgrade.state == UPGRADE_DONE
+    assert peer_uart.garbled == 0
+    assert peer.received == [f"SND {ms}\r\n" for ms in range(10, 2000, 50)]
+
+
+def test_hold_lets_queued_lines_out_first(clock):
+    uart, _ = WireUART.pair()
+    tx = TxQueue(uart)
+    tx.send("PB 1")
+    tx.send("PB 2")
+    tx.hold()
+    tx.send("PB 3")
+    tx.send_ahead("BIN 57600")
+    for _ in range(100):
+        clock.now += 1
+        uart.run(1)
+        tx.service(clock.now)
+    assert bytes(uart.far.pending) == b"PB 1\r\nPB 2\r\nBIN 57600\r\n"
+    assert tx.idle
+    assert len(tx) == 1
+    tx.release()
+    tx.service(clock.now)
+    assert not tx.idle
+    assert len(tx) == 0
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from adafruit_display_text.bitmap_label import Label
+from fake_font import FakeFont
+from messages import LABEL_OVERHEAD, MessageCache, wrap_text
+
+STATUS_MESSAGE_CACHE_BYTES = 8192  # As in displayController/code.py
+# The messages a game cycles through, from displayController/code.py
+MESSAGES = [
+    "Hit Mission Select Targets",
+    "Launch Ball",
+    "Launch to Perform Orbital Refueling",
+    "Launch to Perform Thruster Tests",
+    "3 Slingshot Thruster Hits Left",
+    "2 Slingshot Thruster Hits Left",
+    "1 Slingshot Thruster Hit Left",
+    "Mission Completed",
+    "Promoted to Lieutenant Commander",
+    "1 Hyperspace Launch Left",
+]
+
+
+def old_wrap(text):
+    """set_status_text()'s word wrap as it was."""
+    final_str = ""
+    cur_len = 0
+    for s in text.split(" "):
+        if s == "":
+            continue
+        s_len = len(s)
+        if cur_len + s_len > 14:
+            final_str += "\n" + s
+            cur_len = s_len
+        else:
+            final_str += " " + s if cur_len > 0 else s
+            cur_len += s_len + 1
+    return final_str
+
+
+@pytest.mark.parametrize("text", MESSAGES + ["", "  Double  spaced ", "Supercalifragilistic word", "a" * 14, "a" * 15])
+def test_wrap(text):
+    lines = wrap_text(text).split("\n")
+    assert " ".join(lines).split() == text.split()
+    for i, line in enumerate(lines):
+        # Only a single word too long for any line goes over
+        assert len(line) <= 14 or " " not in line
+        # Greedy: the next line's first word wouldn't have fit on this one
+        if i + 1 < len(lines):
+            assert len(line) + 1 + len(lines[i + 1].split(" ")[0]) > 14
+
+
+def test_wrap_matches_the_old_wrap_where_it_fit():
+    for text in MESSAGES:
+        if all(len(line) <= 14 for line in old_wrap(text).split("\n")):
+            assert wrap_text(text) == old_wrap(text)
+    # The old wrap didn't count the space after the first word on a new line
+    assert old_wrap("Launch to Perform Orbital Refueling").split("\n")[1] == "Perform Orbital"
+    assert wrap_text("Launch to Perform Orbital Refueling").split("\n")[1] == "Perform"
+
+
+def test_cached_messages_are_not_rebuilt():
+    cache = MessageCache(FakeFont(), 0x727ACA, STATUS_MESSAGE_CACHE_BYTES)
+    built = Label.built
+    first = cache.get("Launch Ball")
+    again = cache.get("Launch Ball")
+    assert again[1] is first[1]
+    assert Label.built - built == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_is_dropped_over_budget():
+    font = FakeFont()
+    size = LABEL_OVERHEAD + (11 * 6 * 12 + 7) // 8  # One line of "Launch Ball"
+    cache = MessageCache(font, 0x727ACA, size * 2)
+    cache.get("Launch Ball")
+    cache.get("Mission Ok!")
+    cache.get("Launch Ball")  # Now the most recent
+    cache.get("Game Over!!")
+    assert "Launch Ball" in cache._entries
+    assert "Mission Ok!" not in cache._entries
+    assert cache._bytes <= size * 2
+
+
+def test_benchmark_message_switches_per_second():
+    font = FakeFont()
+    switches = 5000
+    start = time.perf_counter()
+    for i in range(switches):
+        Label(font, text=old_wrap(MESSAGES[i % len(MESSAGES)]), color=0x727ACA, line_spacing=0.9)
+    old_time = time.perf_counter() - start
+
+    cache = MessageCache(font, 0x727ACA, STATUS_MESSAGE_CACHE_BYTES)
+    start = time.perf_counter()
+    for i in range(switches):
+        cache.get(MESSAGES[i % len(MESSAGES)])
+    new_time = time.perf_counter() - start
+    print(f"message switches/s: {switches / old_time:.0f} wrapping and building a label, "
+          f"{switches / new_time:.0f} from the cache ({cache.misses} built)")
+    # The whole game's worth of messages fits the budget
+    assert cache.misses == len(MESSAGES)
+    assert new_time < old_time
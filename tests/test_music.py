@@ -0,0 +1,128 @@
+import pytest
+
+import music
+from music import UNDERRUN_MARGIN, MusicLoop
+from ticks import TICKS_MAX, ticks_add
+
+
+class FakeMixer:
+    def __init__(self):
+        self.music = None
+
+    def play_music(self, sample):
+        self.music = sample
+
+    def stop_music(self):
+        self.music = None
+
+
+@pytest.fixture
+def loop(tmp_path, monkeypatch):
+    # 1000 samples a second, so a sample is a millisecond
+    monkeypatch.setattr(music.audiomp3.MP3Decoder, "sample_rate", 1000)
+    path = tmp_path / "PINBALL.mp3"
+    path.write_bytes(b"\xff\xfb" + bytes(100))
+    loop = MusicLoop(str(path), buffer_size=64)
+    loop.mixer = FakeMixer()
+    return loop
+
+
+def run(loop, now, decoded):
+    loop.decoder.samples_decoded = decoded
+    loop.update(now)
+
+
+def test_takes_its_format_from_the_decoder(loop):
+    assert loop.sample_rate == 1000
+    assert loop.channel_count == 1
+    assert len(loop.decoder.buffer) == 64
+
+
+def test_start_and_stop(loop):
+    loop.start(0)
+    assert loop.mixer.music is loop.decoder
+    loop.mixer.music = None
+    loop.start(5)
+    assert loop.mixer.music is None  # Already playing
+    loop.stop()
+    assert not loop.playing
+    run(loop, 10000, 0)
+    assert loop.underruns == 0
+
+
+def test_keeping_up_is_no_underrun(loop):
+    loop.decoder.samples_decoded = 300
+    loop.start(0)
+    for now in range(0, 2000, 20):
+        run(loop, now, 300 + now)
+    assert loop.underruns == 0
+    assert loop.max_lag == 0
+
+
+def test_lag_within_the_margin_is_no_underrun(loop):
+    loop.start(0)
+    run(loop, 100, 100 - UNDERRUN_MARGIN)
+    assert loop.underruns == 0
+    assert loop.max_lag == UNDERRUN_MARGIN
+
+
+def test_loops_are_counted(loop):
+    loop.start(0)
+    run(loop, 1000, 1000)
+    run(loop, 1010, 5)
+    assert loop.loops == 1
+    # Measured from the start of the file again
+    run(loop, 1100, 95)
+    run(loop, 1200, 4)
+    assert loop.loops == 2
+    assert loop.underruns == 0
+
+
+def test_a_stall_over_several_updates_counts_once(loop):
+    loop.start(0)
+    run(loop, 100, 100)
+    run(loop, 160, 100)
+    assert loop.underruns == 1
+    assert loop.max_lag == 60
+    run(loop, 200, 100)
+    run(loop, 260, 100)
+    run(loop, 400, 100)
+    assert loop.underruns == 1
+    assert loop.max_lag == 60 + 100 + 140
+    assert "underruns=1" in loop.report()
+
+
+def test_a_second_stall_after_catching_up_counts_again(loop):
+    loop.start(0)
+    run(loop, 100, 0)
+    run(loop, 150, 100)  # Caught up
+    run(loop, 300, 100)
+    assert loop.underruns == 2
+
+
+def test_underrun_across_the_tick_wrap(loop):
+    start = TICKS_MAX - 30
+    loop.start(start)
+    run(loop, ticks_add(start, 40), 40)
+    assert loop.underruns == 0
+    run(loop, ticks_add(start, 140), 40)
+    assert loop.underruns == 1
+    assert loop.max_lag == 100
+
+
+def test_decoder_without_a_sample_count(tmp_path, monkeypatch, capsys):
+    class MP3Decoder(music.audiomp3.MP3Decoder):
+        def __init__(self, file, buffer=None):
+            self.file = file
+            self.buffer = buffer
+
+    monkeypatch.setattr(music.audiomp3, "MP3Decoder", MP3Decoder)
+    path = tmp_path / "PINBALL.mp3"
+    path.write_bytes(b"\xff\xfb" + bytes(100))
+    loop = MusicLoop(str(path))
+    assert "has no samples_decoded" in capsys.readouterr().out
+    loop.mixer = FakeMixer()
+    loop.start(0)
+    loop.update(10000)
+    assert not loop.counts_samples
+    assert loop.report() == "music loops and underruns unavailable (no samples_decoded)"
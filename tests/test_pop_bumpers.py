@@ -0,0 +1,90 @@
+from analog_filter import AnalogFilter
+from analogio import AnalogIn
+from pop_bumpers import PopBumperCalibration
+
+NUM_POP_BUMPER_SAMPLES = 20  # As in solenoidDriver/code.py
+POP_BUMPER_SENSITIVITY = 20
+SAMPLES = 100
+
+
+class Board:
+    """The parts of the solenoidDriver's main loop pass that calibration shares."""
+
+    def __init__(self, values):
+        self.pins = [AnalogIn(i, values[i]) for i in range(3)]
+        self.filter = AnalogFilter(3, NUM_POP_BUMPER_SAMPLES)
+        self.calibration = PopBumperCalibration(self.filter, SAMPLES, POP_BUMPER_SENSITIVITY)
+        self.flipper_presses = []  # Waiting, as keypad would queue them
+        self.flippers_handled = 0
+        self.hits = [0, 0, 0]
+        self.calibrated = 0
+
+    def run_pass(self):
+        while self.flipper_presses:
+            self.flipper_presses.pop()
+            self.flippers_handled += 1
+        thresholds = self.calibration.thresholds
+        for i in range(3):
+            if self.filter.add(i, self.pins[i].value) > thresholds[i]:
+                self.hits[i] += 1
+        if self.calibration.update():
+            self.calibrated += 1
+
+
+def test_one_reading_per_bumper_per_pass_and_flippers_every_pass():
+    board = Board([[30000, 30400], [20000], [41000, 40000, 40500]])
+    board.calibration.start()
+    passes = 0
+    while board.calibration.active:
+        board.flipper_presses.append(1)
+        board.run_pass()
+        passes += 1
+        assert [pin.reads for pin in board.pins] == [passes] * 3
+        # No flipper press waits for calibration to finish
+        assert board.flippers_handled == passes
+    assert passes == SAMPLES
+    assert board.calibrated == 1
+
+
+def test_thresholds_sit_a_margin_above_the_highest_sum():
+    board = Board([[30000, 30400], [20000], [41000, 40000, 40500]])
+    board.calibration.start()
+    for _ in range(SAMPLES):
+        board.run_pass()
+    margin = POP_BUMPER_SENSITIVITY * NUM_POP_BUMPER_SAMPLES
+    assert board.calibration.thresholds == [
+        10 * 30000 + 10 * 30400 + margin,
+        20 * 20000 + margin,
+        max(sum(([41000, 40000, 40500] * 20)[start:start + 20]) for start in range(3)) + margin,
+    ]
+    # Quiet sensors no longer trigger, but a hit does
+    for _ in range(50):
+        board.run_pass()
+    assert board.hits == [0, 0, 0]
+    board.pins[1].values = [60000]
+    for _ in range(NUM_POP_BUMPER_SAMPLES):
+        board.run_pass()
+    assert board.hits[1] > 0
+
+
+def test_nothing_triggers_before_the_first_calibration():
+    board = Board([[65535], [65535], [65535]])
+    board.calibration.start()
+    for _ in range(SAMPLES - 1):
+        board.run_pass()
+    assert board.hits == [0, 0, 0]
+
+
+def test_old_thresholds_stay_in_use_while_recalibrating():
+    board = Board([[30000], [30000], [30000]])
+    board.calibration.start()
+    for _ in range(SAMPLES):
+        board.run_pass()
+    thresholds = list(board.calibration.thresholds)
+    board.calibration.start()
+    for _ in range(SAMPLES - 1):
+        board.run_pass()
+        assert board.calibration.thresholds == thresholds
+    board.run_pass()
+    assert board.calibrated == 2
+    assert not board.calibration.active
@@ -0,0 +1,72 @@
+import pytest
+
+import profiler
+from profiler import MAX_LINE, NUM_BUCKETS, Profiler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+        self.reads = 0
+
+    def ticks_ms(self):
+        self.reads += 1
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(profiler, "ticks_ms", clock.ticks_ms)
+    return clock
+
+
+def test_sections_and_loop_rate(clock):
+    prof = Profiler(("read", "draw"), enabled=True)
+    for _ in range(10):
+        prof.start_loop()
+        clock.now += 1
+        prof.lap(0)
+        clock.now += 4
+        prof.lap(1)
+    prof.start_loop()
+    prof.off_overhead_ns = 0
+    lines = prof.report()
+    assert lines[0].startswith("loop n=10 hz=200 avg=5ms max=5ms")
+    assert "read n=10 min=1ms avg=1ms max=1ms" in lines
+    assert "read log2ms@0 0/10" in lines
+    assert "draw log2ms@0 0/0/0/10" in lines
+
+
+def test_disabled_profiler_never_reads_the_clock(clock):
+    prof = Profiler(("read",))
+    for _ in range(100):
+        prof.start_loop()
+        prof.lap(0)
+    assert clock.reads == 0
+
+
+def test_time_across_the_tick_wrap(clock):
+    prof = Profiler(("read",), enabled=True)
+    clock.now = (1 << 29) - 2
+    prof.start_loop()
+    clock.now = 3
+    prof.lap(0)
+    assert prof._maxes[0] == 5
+
+
+def test_lines_fit_the_line_reader(clock):
+    prof = Profiler(("a_section_with_a_long_name",), enabled=True)
+    prof.start_loop()
+    prof.lap(0)
+    prof.start_loop()
+    prof._hists[0] = [10 ** 12] * NUM_BUCKETS
+    prof.off_overhead_ns = 0
+    lines = prof.report()
+    assert all(len(line) <= MAX_LINE for line in lines)
+    hist = [line for line in lines if " log2ms@" in line]
+    assert len(hist) > 1
+    counts = []
+    for line in hist:
+        counts += line.split(" ")[2].split("/")
+    assert counts == [str(10 ** 12)] * NUM_BUCKETS
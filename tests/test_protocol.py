@@ -0,0 +1,185 @@
+import time
+import tracemalloc
+
+from protocol import CMD_PNT, CMD_SLG, Command, CommandTable, NO_COMMAND, command_key
+
+# What the displayController reads most: flipper spam, bumpers, scoring
+STREAM = [b"FLU\r\n", b"FLD\r\n", b"PB 2\r\n", b"FRU\r\n", b"SLG L\r\n", b"FRD\r\n", b"DT 1\r\n", b"IR 3\r\n"] * 50
+PASSES = 20
+
+
+def test_command_key():
+    assert command_key(b"PNT") == CMD_PNT
+    assert command_key(b"xPNTx", 1, 4) == CMD_PNT
+    assert command_key(b"TOOLONG") == NO_COMMAND
+    assert command_key(b"P\x01T") == NO_COMMAND
+
+
+def test_parse_in_place():
+    command = Command()
+    buf = bytearray(b"  PNT 2500  -7 x\r\n......")
+    assert command.parse(buf, 18)
+    assert command.key == CMD_PNT
+    assert command.argc == 3
+    assert command.int_arg(0) == 2500
+    assert command.int_arg(1) == -7
+    assert command.int_arg(2, default=99) == 99
+    assert command.int_arg(3) == 0
+    assert command.arg_str(2) == "x"
+    assert command.name() == "PNT"
+    assert not command.parse(b" \r\n")
+
+
+def test_arg_equals():
+    command = Command()
+    command.parse(b"SLG l\r\n")
+    assert command.key == CMD_SLG
+    assert not command.arg_equals(0, b"L")
+    assert command.arg_equals(0, b"L", ignore_case=True)
+    assert not command.arg_equals(1, b"L")
+
+
+def test_extra_args_are_dropped():
+    command = Command()
+    command.parse(b"A 1 2 3 4 5 6\r\n")
+    assert command.argc == 4
+    assert command.int_arg(3) == 4
+
+
+def old_parse(data):
+    """How a line was parsed before, into a string and a list of tokens."""
+    line = "".join([chr(b) for b in data])
+    tokens = line.split()
+    return tokens[0], [int(arg) for arg in tokens[1:] if arg.isdigit()]
+
+
+def new_parse(command, data):
+    command.parse(data)
+    return command.key, command.int_arg(0)
+
+
+def peak_bytes(parse):
+    """Return the most memory a single parse has held at once."""
+    tracemalloc.start()
+    try:
+        peak = 0
+        for data in STREAM[:8]:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            parse(data)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        return peak
+    finally:
+        tracemalloc.stop()
+
+
+def test_benchmark_parse_rate_and_allocations():
+    command = Command()
+    start = time.perf_counter()
+    for _ in range(PASSES):
+        for data in STREAM:
+            old_parse(data)
+    old_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(PASSES):
+        for data in STREAM:
+            new_parse(command, data)
+    new_time = time.perf_counter() - start
+
+    old_peak = peak_bytes(old_parse)
+    new_peak = peak_bytes(lambda data: new_parse(command, data))
+    count = PASSES * len(STREAM)
+    print(f"commands parsed/s: {count / old_time:.0f} with join and split, {count / new_time:.0f} in place; "
+          f"peak allocation per command: {old_peak} vs {new_peak} bytes")
+    assert new_peak < old_peak
+
+
+# A ball's worth of what the displayController hears, in order
+GAME = (
+    [b"INI solenoidDriver BIN\r\n", b"INI soundController BIN\r\n", b"BTN 1\r\n"]
+    + [b"FLU\r\n", b"FLD\r\n", b"FRU\r\n", b"FRD\r\n", b"PB 1\r\n", b"SLG L\r\n", b"PB 3\r\n", b"IR 2\r\n",
+       b"DT 0\r\n", b"HYP\r\n", b"SLG R\r\n", b"DT 2\r\n"] * 40
+    + [b"DTR\r\n", b"DRN\r\n"]
+)
+HANDLED = [b"HYP", b"DRN", b"DTR", b"BTN", b"INI", b"CAL", b"IR", b"DT", b"PB", b"SLG", b"FLU", b"FLD", b"FRU", b"FRD"]
+MISSION_TARGETS = [b"HYP", b"SLG", b"PB"]
+
+
+def old_readline(data, counts):
+    """displayController's readline() as it was: a string, a token list and an if/elif chain."""
+    tokens = "".join([chr(b) for b in data]).split()
+    name = tokens[0]
+    if name == "HYP":
+        counts["HYP"] += 1
+    elif name == "DRN":
+        counts["DRN"] += 1
+    elif name == "DTR":
+        counts["DTR"] += 1
+    elif name == "BTN":
+        counts["BTN"] += 1
+    elif name == "INI":
+        counts["INI"] += 1
+    elif name == "CAL":
+        counts["CAL"] += 1
+    elif name == "IR":
+        counts["IR"] += 1
+    elif name == "DT":
+        counts["DT"] += 1
+    elif name == "PB":
+        counts["PB"] += 1
+    elif name == "SLG":
+        counts["SLG"] += 1
+    elif name == "FLU":
+        counts["FLU"] += 1
+    elif name == "FLD":
+        counts["FLD"] += 1
+    elif name == "FRU":
+        counts["FRU"] += 1
+    elif name == "FRD":
+        counts["FRD"] += 1
+    # The mission check ran after every command
+    if name in ("HYP", "SLG", "PB"):
+        counts["mission"] += 1
+
+
+def test_command_table_dispatch():
+    calls = []
+    table = CommandTable({b"PB": lambda command, extra: calls.append((command.int_arg(0), extra))})
+    command = Command()
+    command.parse(b"PB 3\r\n")
+    assert table.dispatch(command, "reader")
+    command.parse(b"XYZ\r\n")
+    assert not table.dispatch(command, "reader")
+    assert calls == [(3, "reader")]
+
+
+def test_benchmark_events_per_second():
+    old_counts = dict.fromkeys([name.decode() for name in HANDLED] + ["mission"], 0)
+    start = time.perf_counter()
+    for data in GAME:
+        old_readline(data, old_counts)
+    old_time = time.perf_counter() - start
+
+    new_counts = dict.fromkeys(old_counts, 0)
+
+    def handler(name):
+        def handle(command):
+            new_counts[name] += 1
+        return handle
+
+    def mission_hook(command):
+        new_counts["mission"] += 1
+
+    table = CommandTable({name: handler(name.decode()) for name in HANDLED})
+    post_hooks = {command_key(name): mission_hook for name in MISSION_TARGETS}
+    command = Command()
+    start = time.perf_counter()
+    for data in GAME:
+        if command.parse(data) and table.dispatch(command):
+            hook = post_hooks.get(command.key)
+            if hook is not None:
+                hook(command)
+    new_time = time.perf_counter() - start
+    print(f"events/s for a recorded game: {len(GAME) / old_time:.0f} through the if/elif chain, "
+          f"{len(GAME) / new_time:.0f} through the CommandTable")
+    assert new_counts == old_counts
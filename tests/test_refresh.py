@@ -0,0 +1,89 @@
+import pytest
+
+import refresh as refresh_module
+from fake_display import FakeDisplay
+from refresh import RefreshScheduler
+
+# Screen regions of the widgets, roughly as laid out in displayController/code.py
+SCORE_REGION = (16, 96, 304, 144)
+BALL_REGION = (260, 8, 312, 28)
+STATUS_REGION = (0, 200, 320, 232)
+
+
+def area(region):
+    return (region[2] - region[0]) * (region[3] - region[1])
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def ticks_ms(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(refresh_module, "ticks_ms", clock.ticks_ms)
+    return clock
+
+
+def scripted_game(at):
+    """Return the regions changed at ms at: a run of scores, then a ball drain, then nothing."""
+    if at < 500 and at % 10 == 0:
+        return [SCORE_REGION]
+    if at == 600:
+        return [BALL_REGION, STATUS_REGION]
+    return []
+
+
+def test_refreshes_only_after_changes_and_at_most_max_fps(clock):
+    refresh = None
+    display = FakeDisplay(clock, area=lambda: refresh.last_area)
+    refresh = RefreshScheduler(display, max_fps=30)
+    assert not display.auto_refresh
+    refresh_times = []
+    marked = 0
+    while clock.now < 1000:
+        for region in scripted_game(clock.now):
+            refresh.mark(region)
+            marked += 1
+        start = clock.now
+        if refresh.update(clock.now):
+            refresh_times.append(start)
+        clock.now += 1
+    gaps = [b - a for a, b in zip(refresh_times, refresh_times[1:])]
+    print(f"{marked} regions marked, {len(refresh_times)} refreshes, refresh areas {sorted(set(display.refreshes))}")
+    assert min(gaps) >= 1000 // 30
+    # The score changes 50 times in 500ms, which the cap turns into one refresh per frame
+    assert len([t for t in refresh_times if t < 500]) == 500 // (1000 // 30) + 1
+    assert [t for t in refresh_times if t >= 500] == [600]
+    assert refresh.refreshes == len(refresh_times) == len(display.refreshes)
+    # The ball and status changes are refreshed together, over their bounding box
+    assert display.refreshes[-1] == 320 * (232 - 8)
+    assert set(display.refreshes[:-1]) == {area(SCORE_REGION)}
+    assert refresh.report().startswith(f"display refreshes={len(refresh_times)} ")
+
+
+def test_no_refresh_without_changes(clock):
+    display = FakeDisplay(clock)
+    refresh = RefreshScheduler(display)
+    for now in range(0, 1000, 5):
+        assert not refresh.update(now)
+    assert display.refreshes == []
+    refresh.mark(BALL_REGION)
+    assert refresh.update(1000)
+    assert refresh.last_area == area(BALL_REGION)
+    assert not refresh.update(1100)
+    assert len(display.refreshes) == 1
+
+
+def test_refresh_time_is_reported(clock):
+    display = FakeDisplay(clock, area=lambda: 320 * 240)
+    refresh = RefreshScheduler(display)
+    refresh.mark(SCORE_REGION)
+    refresh.update(0)
+    # A full screen redraw takes 51ms over the fake SPI bus
+    assert refresh.last_refresh_ms == refresh.max_refresh_ms == 320 * 240 * 2 // 3000
+    assert "avg=51ms max=51ms" in refresh.report()
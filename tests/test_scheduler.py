@@ -0,0 +1,102 @@
+import time
+
+import scheduler
+from scheduler import Scheduler, Timer
+from ticks import TICKS_PERIOD, ticks_add, ticks_diff
+
+NUM_TIMERS = 15  # Flipper sustains, slings and their rearms, pop bumpers, reload, drain, hyperspace, drop targets
+PASSES = 20000
+
+
+def make_timers(fired):
+    return [Timer(lambda now, i=i: fired.append((i, now))) for i in range(NUM_TIMERS)]
+
+
+def test_timers_fire_in_deadline_order():
+    fired = []
+    timers = make_timers(fired)
+    sched = Scheduler()
+    for i, timer in enumerate(timers):
+        sched.start(timer, (i * 7) % NUM_TIMERS + 1, 0)
+    for now in range(NUM_TIMERS + 2):
+        sched.run(now)
+    assert [now for _, now in fired] == list(range(1, NUM_TIMERS + 1))
+    assert not any(timer.armed for timer in timers)
+
+
+def test_restart_replaces_the_deadline_and_cancel_disarms():
+    fired = []
+    a, b = make_timers(fired)[:2]
+    sched = Scheduler()
+    sched.start(a, 10, 0)
+    sched.start(b, 5, 0)
+    sched.start(a, 2, 0)
+    sched.cancel(b)
+    for now in range(20):
+        sched.run(now)
+    assert fired == [(0, 2)]
+
+
+def test_deadlines_across_the_tick_wrap():
+    fired = []
+    a, b = make_timers(fired)[:2]
+    sched = Scheduler()
+    now = TICKS_PERIOD - 3
+    sched.start(a, 10, now)  # Due after the wrap
+    sched.start(b, 1, now)   # Due before it
+    for _ in range(12):
+        sched.run(now)
+        now = ticks_add(now, 1)
+    assert fired == [(1, TICKS_PERIOD - 2), (0, 7)]
+
+
+def test_idle_pass_is_one_comparison(monkeypatch):
+    calls = []
+
+    def counting_ticks_diff(a, b):
+        calls.append(1)
+        return ticks_diff(a, b)
+
+    monkeypatch.setattr(scheduler, "ticks_diff", counting_ticks_diff)
+    sched = Scheduler()
+    sched.run(0)
+    assert calls == []
+    for timer in make_timers([]):
+        sched.start(timer, 1000, 0)
+    del calls[:]
+    sched.run(500)
+    assert len(calls) == 1
+
+
+def old_checks(deadlines, cur_time):
+    """The main loop's deadline checks as they were, one branch per timer."""
+    fired = 0
+    for deadline in deadlines:
+        if cur_time > deadline:
+            fired += 1
+    return fired
+
+
+def test_benchmark_loop_rate_idle_and_armed():
+    sched = Scheduler()
+    start = time.perf_counter()
+    for now in range(PASSES):
+        sched.run(now)
+    idle_time = time.perf_counter() - start
+
+    for timer in make_timers([]):
+        sched.start(timer, PASSES * 2, 0)
+    start = time.perf_counter()
+    for now in range(PASSES):
+        sched.run(now)
+    armed_time = time.perf_counter() - start
+
+    deadlines = [PASSES * 2] * NUM_TIMERS
+    start = time.perf_counter()
+    for now in range(PASSES):
+        old_checks(deadlines, now)
+    old_time = time.perf_counter() - start
+
+    print(f"scheduler passes/s: {PASSES / idle_time:.0f} idle, {PASSES / armed_time:.0f} with {NUM_TIMERS} armed, "
+          f"{PASSES / old_time:.0f} checking {NUM_TIMERS} deadlines in turn")
+    assert len(sched._armed) == NUM_TIMERS
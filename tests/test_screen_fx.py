@@ -0,0 +1,107 @@
+import displayio
+import pytest
+
+import refresh as refresh_module
+from fake_display import FakeDisplay
+from refresh import RefreshScheduler
+from screen_fx import (
+    AnimationLayer, PaletteCycle, Sprite, burst_sheet, chevron_sheet, gradient_palette, sprite_palette, streak_sheet,
+)
+
+SCREEN = (0, 0, 320, 240)
+HYPERSPACE_STREAK_COLORS = 8  # As in displayController/code.py
+BURST_FRAMES = ((1,), (2,), (3,), (4,), (5,), (6,))
+RANK_CHEVRON_FRAMES = ((1, 0, 0), (1, 1, 0), (1, 1, 1), (0, 0, 0), (1, 1, 1), (0, 0, 0))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def ticks_ms(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(refresh_module, "ticks_ms", clock.ticks_ms)
+    return clock
+
+
+def test_palette_cycle_rotates_then_restores():
+    palette = gradient_palette(0x000000, 0x0000FF, 4)
+    colors = [palette[i] for i in range(5)]
+    group = displayio.Group()
+    group.hidden = True
+    cycle = PaletteCycle(palette, 1, 4, group)
+    cycle.start(2, 50, 0)
+    assert not group.hidden
+    assert cycle.update(0)
+    assert [palette[i] for i in range(1, 5)] == colors[2:5] + colors[1:2]
+    assert not cycle.update(49)
+    assert cycle.update(50)
+    assert cycle.update(100)
+    assert [palette[i] for i in range(5)] == colors
+    assert group.hidden
+    assert not cycle.playing
+
+
+def test_sprite_steps_frames_and_hides():
+    sprite = Sprite(chevron_sheet(8), sprite_palette(0x727ACA), 8, 8, RANK_CHEVRON_FRAMES, width=3, scale=2)
+    sprite.play(150, 0, loops=1)
+    shown = []
+    for now in range(0, 1000, 150):
+        if sprite.update(now) and not sprite.group.hidden:
+            shown.append(tuple(sprite.tile_grid[col] for col in range(3)))
+    assert shown == list(RANK_CHEVRON_FRAMES)
+    assert sprite.group.hidden
+    # Only tiles that differ from the last frame are written
+    changed = sum(a != b for prev, frame in zip(((0, 0, 0),) + RANK_CHEVRON_FRAMES, RANK_CHEVRON_FRAMES)
+                  for a, b in zip(prev, frame))
+    assert sprite.tile_grid.tile_writes == changed
+
+
+def run_animation(clock, animation, region):
+    refresh = RefreshScheduler(FakeDisplay(clock), max_fps=30)
+    refresh.display.area = lambda: refresh.last_area
+    layer = AnimationLayer(refresh)
+    layer.add(animation, region)
+    while True:
+        clock.now += 1
+        layer.update(clock.now)
+        if refresh.update(clock.now):
+            layer.refreshed()
+        if not animation.playing and refresh._dirty is None:
+            return layer, refresh
+
+
+def test_benchmark_refresh_time_per_animation_frame(clock):
+    band = displayio.Group(scale=2, x=24, y=96)
+    palette = gradient_palette(0x101850, 0xC0D0FF, HYPERSPACE_STREAK_COLORS)
+    band.append(displayio.TileGrid(streak_sheet(96, 16, HYPERSPACE_STREAK_COLORS), pixel_shader=palette))
+    cycle = PaletteCycle(palette, 1, HYPERSPACE_STREAK_COLORS, band)
+    cycle.start(16, 40, 0)
+    band_layer, band_refresh = run_animation(clock, cycle, (24, 96, 24 + 96 * 2, 96 + 16 * 2))
+
+    # The same cycle on the background's palette redraws the whole screen every step
+    clock.now = 0
+    background = gradient_palette(0x101850, 0xC0D0FF, HYPERSPACE_STREAK_COLORS)
+    cycle = PaletteCycle(background, 1, HYPERSPACE_STREAK_COLORS)
+    cycle.start(16, 40, 0)
+    screen_layer, _ = run_animation(clock, cycle, SCREEN)
+
+    clock.now = 0
+    burst = Sprite(burst_sheet(16, len(BURST_FRAMES)), sprite_palette(0xFFE070), 16, 16, BURST_FRAMES,
+                   scale=2, x=150, y=140)
+    burst.play(60, 0, 3)
+    burst_layer, _ = run_animation(clock, burst, burst.region)
+
+    for name, layer in (("streak band", band_layer), ("background palette", screen_layer), ("burst sprite", burst_layer)):
+        print(f"{name}: {layer.report()}")
+    assert band_layer.frames == 17  # 16 steps and putting the colors back
+    assert band_refresh.last_area == 96 * 2 * 16 * 2
+    # A 30 fps frame has 33ms
+    assert band_layer.max_frame_refresh_ms < 33
+    assert burst_layer.max_frame_refresh_ms < 33
+    assert screen_layer.max_frame_refresh_ms > 33
@@ -0,0 +1,210 @@
+import wave
+
+import pytest
+
+from fx_board import PRIORITY_CRITICAL, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
+from sfx_mixer import MUSIC_VOICE, SampleCache, SoundMixer, load_wave, sound_files, wave_format
+
+RATE = 22050
+
+
+def write_wave(path, frames, rate=RATE, channels=1, width=2):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(width)
+        w.setframerate(rate)
+        w.writeframes(bytes(frames * channels * width))
+
+
+class FakeAudio:
+    def __init__(self):
+        self.playing = None
+
+    def play(self, sample):
+        self.playing = sample
+
+
+@pytest.fixture
+def sfx(tmp_path):
+    for n in range(1, 6):
+        write_wave(tmp_path / f"SOUND{n}.WAV", 100 * n)
+    write_wave(tmp_path / "SOUND9.WAV", 20000)  # Too big to cache, so it streams
+    return tmp_path
+
+
+def make_mixer(sfx, **kwargs):
+    return SoundMixer(FakeAudio(), sound_files(str(sfx), RATE, 1), **kwargs)
+
+
+def load_sizes(sizes):
+    loads = []
+
+    def load(sound):
+        loads.append(sound)
+        size = sizes.get(sound)
+        return None if size is None else (f"sample {sound}", size)
+
+    return load, loads
+
+
+def test_cache_evicts_least_recently_used():
+    load, loads = load_sizes({1: 40, 2: 40, 3: 40})
+    cache = SampleCache(100, load)
+    cache.get(1)
+    cache.get(2)
+    assert cache.get(1) == "sample 1"
+    cache.get(3)
+    # 2 was used longest ago
+    assert cache.bytes == 80
+    assert cache.evictions == 1
+    assert cache.get(1) == "sample 1"
+    cache.get(2)
+    assert loads == [1, 2, 3, 2]
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_cache_evicts_as_many_as_it_takes():
+    load, _ = load_sizes({1: 30, 2: 30, 3: 30, 4: 90})
+    cache = SampleCache(100, load)
+    for sound in (1, 2, 3, 4):
+        cache.get(sound)
+    assert cache.evictions == 3
+    assert cache.bytes == 90
+
+
+def test_cache_remembers_sounds_it_cant_load():
+    load, loads = load_sizes({})
+    cache = SampleCache(100, load)
+    assert cache.get(5) is None
+    assert cache.get(5) is None
+    assert loads == [5]
+    assert cache.misses == 1
+
+
+def test_sound_files_leaves_out_other_formats(sfx):
+    write_wave(sfx / "SOUND6.WAV", 100, channels=2)
+    write_wave(sfx / "SOUND7.WAV", 100, rate=44100)
+    write_wave(sfx / "SOUND8.WAV", 100, width=1)
+    sounds = sound_files(str(sfx), RATE, 1)
+    assert sorted(sounds) == [0, 1, 2, 3, 4, 8]
+    assert wave_format(str(sfx / "SOUND6.WAV")) == (RATE, 2)
+    assert wave_format(str(sfx / "SOUND8.WAV")) is None
+
+
+def test_load_wave_size_limit(sfx):
+    sample, size = load_wave(str(sfx / "SOUND1.WAV"), RATE, 1, 8192)
+    assert size == 200
+    assert len(sample.buffer) == 100
+    assert load_wave(str(sfx / "SOUND9.WAV"), RATE, 1, 8192) is None
+
+
+def test_mixer_matches_the_music_format(sfx):
+    mixer = make_mixer(sfx, sample_rate=RATE, channel_count=2)
+    assert mixer.mixer.channel_count == 2
+    assert mixer.mixer.sample_rate == RATE
+    assert len(mixer.mixer.voice) == 4
+
+
+def test_effects_take_free_voices(sfx):
+    mixer = make_mixer(sfx)
+    for sound in (0, 1, 2):
+        assert mixer.play(sound, PRIORITY_NORMAL)
+    voices = mixer.mixer.voice
+    assert not voices[MUSIC_VOICE].playing
+    assert all(v.playing for v in voices[1:])
+    assert mixer.preempted == 0
+
+
+def test_oldest_lowest_priority_effect_is_cut_off(sfx):
+    mixer = make_mixer(sfx)
+    mixer.play(0, PRIORITY_NORMAL)
+    mixer.play(1, PRIORITY_LOW)
+    mixer.play(2, PRIORITY_LOW)
+    assert mixer.play(3, PRIORITY_NORMAL)
+    assert mixer.preempted == 1
+    assert mixer._sound[1:] == [0, 3, 2]
+    assert mixer.play(4, PRIORITY_LOW)
+    assert mixer._sound[1:] == [0, 3, 4]
+
+
+def test_effect_dropped_when_all_voices_are_more_important(sfx):
+    mixer = make_mixer(sfx)
+    for sound in (0, 1, 2):
+        mixer.play(sound, PRIORITY_HIGH)
+    assert not mixer.play(3, PRIORITY_NORMAL)
+    assert mixer.dropped == 1
+    assert mixer.play(3, PRIORITY_CRITICAL)
+
+
+def test_finished_voice_is_freed(sfx):
+    mixer = make_mixer(sfx)
+    for sound in (0, 1, 2):
+        mixer.play(sound, PRIORITY_HIGH)
+    mixer.mixer.voice[2].stop()
+    mixer.update()
+    assert mixer._sound[2] is None
+    assert mixer.play(3, PRIORITY_LOW)
+    assert mixer.preempted == 0
+
+
+def test_long_effect_streams_and_closes_its_file(sfx):
+    mixer = make_mixer(sfx)
+    assert mixer.play(8, PRIORITY_NORMAL)
+    f = mixer._file[1]
+    assert f is not None
+    assert mixer.mixer.voice[1].sample.file is f
+    mixer.mixer.voice[1].stop()
+    mixer.update()
+    assert f.closed
+    assert mixer.cache.bytes == 0
+
+
+def test_cached_effects_are_reused(sfx):
+    mixer = make_mixer(sfx)
+    mixer.preload([0, 1, 8])
+    mixer.play(0, PRIORITY_NORMAL)
+    mixer.play(1, PRIORITY_NORMAL)
+    assert mixer.cache.hits == 2
+    assert mixer.cache.misses == 3
+
+
+def test_unknown_sound_is_dropped(sfx):
+    mixer = make_mixer(sfx)
+    assert not mixer.has(40)
+    assert not mixer.play(40, PRIORITY_NORMAL)
+    assert mixer.dropped == 1
+    assert mixer._sound[1] is None
+
+
+def test_music_ducks_under_high_priority_effects(sfx):
+    mixer = make_mixer(sfx)
+    music = mixer.mixer.voice[MUSIC_VOICE]
+    mixer.play_music("music")
+    assert music.loop
+    mixer.play(0, PRIORITY_NORMAL)
+    assert music.level == 1.0
+    mixer.play(1, PRIORITY_HIGH)
+    assert music.level == mixer.duck_level
+    mixer.mixer.voice[2].stop()
+    mixer.update()
+    assert music.level == 1.0
+
+
+class FakeBank:
+    def __init__(self, entries):
+        self.entries = entries
+
+    def entry(self, sound):
+        return self.entries.get(sound)
+
+
+def test_has_only_bank_sounds_in_the_mixer_format():
+    bank = FakeBank({
+        0: (512, 200, RATE, 1, 16),
+        1: (1024, 200, RATE, 2, 16),
+        2: (1536, 200, 44100, 1, 16),
+        3: (2048, 200, RATE, 1, 8),
+        4: (2560, 20000, RATE, 1, 16),
+    })
+    mixer = SoundMixer(FakeAudio(), {}, bank, RATE, 1)
+    assert [sound for sound in range(6) if mixer.has(sound)] == [0]
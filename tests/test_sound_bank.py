@@ -0,0 +1,142 @@
+import importlib.util
+import os
+import struct
+import wave
+
+import pytest
+
+from sound_bank import SoundBank, SoundBankError
+
+# The packing tool has the same module name as the board's reader, so load it by path
+TOOL = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "util", "sound_bank", "sound_bank.py")
+_spec = importlib.util.spec_from_file_location("sound_bank_tool", TOOL)
+tool = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(tool)
+
+RATE = 22050
+
+
+def samples(n, seed):
+    return bytes((seed + i) & 0xFF for i in range(n))
+
+
+SOUNDS = {
+    0: (RATE, 1, 16, samples(1000, 1)),
+    1: (RATE, 1, 16, samples(512, 2)),
+    3: (44100, 2, 16, samples(3000, 3)),
+    4: (RATE, 1, 8, samples(7, 4)),
+}
+
+
+@pytest.fixture
+def bank_path(tmp_path):
+    path = tmp_path / "SFX.BNK"
+    path.write_bytes(tool.pack(SOUNDS))
+    return str(path)
+
+
+def offsets(bank):
+    count = struct.unpack_from(tool.HEADER_FORMAT, bank)[2]
+    return [struct.unpack_from(tool.ENTRY_FORMAT, bank, tool.HEADER_SIZE + i * tool.ENTRY_SIZE)[0] for i in range(count)]
+
+
+def test_round_trip():
+    assert tool.read_bank(tool.pack(SOUNDS)) == SOUNDS
+
+
+def test_sounds_start_on_sector_boundaries():
+    bank = tool.pack(SOUNDS)
+    starts = offsets(bank)
+    for sound in SOUNDS:
+        assert starts[sound] % tool.ALIGN == 0
+    assert len(bank) % tool.ALIGN == 0
+
+
+def test_empty_sound_is_refused():
+    with pytest.raises(tool.BankError):
+        tool.pack({0: (RATE, 1, 16, b"")})
+
+
+def test_read_bank_refuses_other_files():
+    with pytest.raises(tool.BankError):
+        tool.read_bank(b"RIFF\0\0\0\0WAVE")
+    with pytest.raises(tool.BankError):
+        tool.read_bank(b"SB")
+    bank = tool.pack(SOUNDS)
+    with pytest.raises(tool.BankError):
+        tool.read_bank(bank[:600])
+
+
+def test_wave_files_round_trip(tmp_path):
+    for n, channels in ((1, 1), (2, 2), (5, 1)):
+        with wave.open(str(tmp_path / f"SOUND{n}.WAV"), "wb") as w:
+            w.setnchannels(channels)
+            w.setsampwidth(2)
+            w.setframerate(RATE)
+            w.writeframes(samples(400 * channels, n))
+    (tmp_path / "README.TXT").write_text("not a sound")
+    paths = tool.sound_files(str(tmp_path))
+    assert sorted(paths) == [0, 1, 4]
+    sounds = {sound: tool.read_wave(path) for sound, path in paths.items()}
+    assert tool.read_bank(tool.pack(sounds)) == sounds
+    assert sounds[1][:3] == (RATE, 2, 16)
+
+    bank_path = tmp_path / "SFX.BNK"
+    bank_path.write_bytes(tool.pack(sounds))
+    from_bank, from_files, bank_open = tool.bench(str(bank_path), paths, repeat=2)
+    assert from_bank > 0 and from_files > 0 and bank_open > 0
+
+
+def test_board_reads_the_tools_bank(bank_path):
+    bank = SoundBank(bank_path)
+    try:
+        assert bank.count == 5
+        assert [sound for sound in range(7) if bank.has(sound)] == [0, 1, 3, 4]
+        assert bank.entry(2) is None
+        assert bank.entry(-1) is None
+        assert bank.length(3) == 3000
+        assert bank.entry(3)[2:] == (44100, 2, 16)
+        for sound, (_, _, _, data) in SOUNDS.items():
+            buf = bytearray(len(data))
+            assert bank.read_into(sound, buf) == len(data)
+            assert bytes(buf) == data
+    finally:
+        bank.close()
+
+
+def test_board_reads_only_the_start_into_a_short_buffer(bank_path):
+    bank = SoundBank(bank_path)
+    try:
+        buf = bytearray(100)
+        assert bank.read_into(0, buf) == 100
+        assert bytes(buf) == SOUNDS[0][3][:100]
+        # A buffer longer than the sound doesn't pick up the next one's bytes
+        buf = bytearray(b"\xff" * 20)
+        assert bank.read_into(4, buf) == 7
+        assert bytes(buf[:7]) == SOUNDS[4][3]
+        assert buf[7:] == b"\xff" * 13
+        assert bank.reads == 2
+    finally:
+        bank.close()
+
+
+def test_board_loads_only_its_own_format(bank_path):
+    bank = SoundBank(bank_path)
+    try:
+        sample, size = bank.load(0, RATE, 1, 8192)
+        assert size == 1000
+        assert sample.buffer.tobytes() == SOUNDS[0][3]
+        assert sample.sample_rate == RATE
+        assert bank.load(0, RATE, 1, 999) is None
+        assert bank.load(3, RATE, 1, 8192) is None
+        assert bank.load(4, RATE, 1, 8192) is None
+        assert bank.load(2, RATE, 1, 8192) is None
+    finally:
+        bank.close()
+
+
+def test_board_refuses_other_files(tmp_path):
+    path = tmp_path / "SOUND1.WAV"
+    path.write_bytes(b"RIFF\0\0\0\0WAVEfmt ")
+    with pytest.raises(SoundBankError):
+        SoundBank(str(path))
@@ -0,0 +1,105 @@
+import importlib
+import sys
+import types
+
+import pytest
+
+import switches as switches_module
+from ticks import TICKS_MAX, ticks_add
+
+
+class Clock:
+    def __init__(self, now=0):
+        self.now = now
+
+    def ticks_ms(self):
+        return self.now
+
+
+class Pin:
+    def __init__(self, value=False):
+        self.value = value
+
+
+@pytest.fixture
+def load_switches(monkeypatch):
+    """Return a function that reimports switches with the given keypad module (None makes the import fail)."""
+    def load(keypad):
+        monkeypatch.setitem(sys.modules, "keypad", keypad)
+        return importlib.reload(switches_module)
+    yield load
+    monkeypatch.undo()
+    importlib.reload(switches_module)
+
+
+def polled_switches(load_switches, monkeypatch, clock, pins, value_when_pressed=True):
+    switches = load_switches(None)
+    monkeypatch.setattr(switches, "ticks_ms", clock.ticks_ms)
+    return switches.Switches(pins, value_when_pressed=value_when_pressed)
+
+
+def test_falls_back_to_polled_keys_without_keypad(load_switches, monkeypatch):
+    clock = Clock()
+    pins = [Pin(True), Pin(True)]
+    buttons = polled_switches(load_switches, monkeypatch, clock, pins, value_when_pressed=False)
+    assert switches_module.keypad is None
+    assert isinstance(buttons._keys, switches_module.PolledKeys)
+    assert buttons.next_event() is None
+    clock.now = 20
+    pins[1].value = False
+    event = buttons.next_event()
+    assert (event.key_number, event.pressed, event.timestamp) == (1, True, 20)
+    assert buttons.pressed == [False, True]
+    assert buttons.next_event() is None
+    clock.now = 40
+    pins[1].value = True
+    event = buttons.next_event()
+    assert (event.key_number, event.released) == (1, True)
+    assert buttons.pressed == [False, False]
+
+
+def test_uses_keypad_when_it_imports(load_switches):
+    made = []
+
+    class Keys:
+        def __init__(self, pins, **kwargs):
+            made.append((pins, kwargs))
+
+    switches = load_switches(types.SimpleNamespace(Keys=Keys, Event=switches_module.Event))
+    buttons = switches.Switches(["GP7"], value_when_pressed=False)
+    assert isinstance(buttons._keys, Keys)
+    assert made == [(["GP7"], {"value_when_pressed": False, "pull": True, "interval": switches.DEBOUNCE_INTERVAL})]
+
+
+def test_bounces_within_the_debounce_interval_are_ignored(load_switches, monkeypatch):
+    clock = Clock()
+    pin = Pin()
+    buttons = polled_switches(load_switches, monkeypatch, clock, [pin])
+    assert buttons.next_event() is None
+    pin.value = True
+    clock.now = 4
+    assert buttons.next_event() is None
+    pin.value = False
+    clock.now = 10
+    # The press came and went between scans
+    assert buttons.next_event() is None
+    pin.value = True
+    clock.now = 20
+    assert buttons.next_event().pressed
+
+
+def test_scans_across_the_ticks_wrap(load_switches, monkeypatch):
+    start = TICKS_MAX - 5
+    clock = Clock(start)
+    pin = Pin()
+    buttons = polled_switches(load_switches, monkeypatch, clock, [pin])
+    assert buttons.next_event() is None
+    pin.value = True
+    # Wrapped to 0, but only 6ms after the last scan, so too soon to scan again
+    clock.now = ticks_add(start, 6)
+    assert clock.now == 0
+    assert buttons.next_event() is None
+    # Subtracting the ticks here would give a large negative number, and never scan again
+    clock.now = ticks_add(start, 10)
+    event = buttons.next_event()
+    assert (event.key_number, event.pressed, event.timestamp) == (0, True, 4)
@@ -0,0 +1,44 @@
+from ticks import TICKS_MAX, TICKS_PERIOD, ticks_add, ticks_diff, ticks_expired, ticks_less
+
+
+def test_add_wraps_past_the_period():
+    assert ticks_add(TICKS_MAX, 1) == 0
+    assert ticks_add(TICKS_MAX - 5, 10) == 4
+
+
+def test_add_negative_wraps_below_zero():
+    assert ticks_add(0, -1) == TICKS_MAX
+    assert ticks_add(3, -10) == TICKS_PERIOD - 7
+
+
+def test_diff_across_the_wrap():
+    before = TICKS_MAX - 2
+    after = ticks_add(before, 5)
+    assert after == 2
+    assert ticks_diff(after, before) == 5
+    assert ticks_diff(before, after) == -5
+
+
+def test_diff_is_signed_up_to_half_the_period():
+    half = TICKS_PERIOD // 2
+    assert ticks_diff(ticks_add(100, half - 1), 100) == half - 1
+    # Any further apart and the order flips
+    assert ticks_diff(ticks_add(100, half + 1), 100) == -(half - 1)
+
+
+def test_less_across_the_wrap():
+    assert ticks_less(TICKS_MAX, 0)
+    assert not ticks_less(0, TICKS_MAX)
+    assert not ticks_less(7, 7)
+
+
+def test_expired_across_the_wrap():
+    deadline = ticks_add(TICKS_MAX - 1, 3)
+    assert not ticks_expired(deadline, TICKS_MAX)
+    assert not ticks_expired(deadline, deadline)
+    assert ticks_expired(deadline, ticks_add(deadline, 1))
+
+
+def test_expired_with_no_deadline():
+    assert not ticks_expired(None, 0)
+    assert not ticks_expired(None, TICKS_MAX)
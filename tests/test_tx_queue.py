@@ -0,0 +1,151 @@
+import pytest
+
+import uartlink
+from fake_uart import FakeUART
+from frames import SYNC, decode_frame
+from protocol import CMD_DRN, CMD_DTR, CMD_FLD, CMD_FRD, CMD_HYP
+from uartlink import TxQueue
+
+# A flipper-happy few hundred ms on the solenoidDriver's link, with a drain in the middle
+BURST = ["FLU", "FRU", "SLG L", "FLD", "PB 1", "FRD", "FLU", "PB 2", "SLG R", "FRU", "FLD", "PB 3", "FRD"] * 2
+DRAIN_AT = 20  # Index in BURST the drain is sent after
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def ticks_ms(self):
+        return self.now
+
+
+class TimedUART(FakeUART):
+    """Records when each write happened."""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+        self.times = []
+
+    def write(self, data):
+        self.times.append(self.clock.now)
+        return super().write(data)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(uartlink, "ticks_ms", clock.ticks_ms)
+    return clock
+
+
+def replay(clock, tx, uart):
+    """Send BURST one message per ms, plus DRN, servicing the queue every ms. Returns the ms DRN took to go out."""
+    messages = BURST[:DRAIN_AT] + ["DRN"] + BURST[DRAIN_AT:]
+    for message in messages:
+        tx.send(message)
+        clock.now += 1
+        tx.service(clock.now)
+    while len(tx):
+        clock.now += 1
+        tx.service(clock.now)
+    index = [bytes(data) for data in uart.written].index(b"DRN\r\n")
+    return uart.times[index] - (DRAIN_AT + 1) + 1
+
+
+def test_critical_messages_jump_the_burst(clock):
+    uart = TimedUART(clock)
+    fifo = TxQueue(uart)
+    fifo_latency = replay(clock, fifo, uart)
+
+    clock.now = 0
+    uart = TimedUART(clock)
+    tx = TxQueue(uart, critical=(CMD_DRN, CMD_HYP, CMD_DTR), cosmetic=(CMD_FLD, CMD_FRD))
+    tx._last_service = 0
+    latency = replay(clock, tx, uart)
+    print(f"DRN delivered after {latency}ms by priority, {fifo_latency}ms in order sent")
+    # Only waits for the bytes it has to share the FIFO budget with, not the whole backlog
+    assert latency <= 5
+    assert latency * 4 < fifo_latency
+    assert len(uart.written) == len(BURST) + 1
+
+
+def test_cosmetic_messages_wait_for_the_rest(clock):
+    uart = FakeUART()
+    tx = TxQueue(uart, cosmetic=(CMD_FLD,), fifo_size=8)
+    tx.send("FLD")
+    tx.send("SLG L")
+    tx.send("FLD")
+    tx.send("PB 1")
+    while len(tx):
+        clock.now += 10
+        tx.service(clock.now)
+    assert uart.written == [b"FLD\r\n", b"SLG L\r\n", b"PB 1\r\n", b"FLD\r\n"]
+
+
+def test_never_writes_more_than_the_link_has_carried(clock):
+    uart = TimedUART(clock)
+    tx = TxQueue(uart, baudrate=9600)
+    for message in BURST:
+        tx.send(message)
+    written = sum(len(data) for data in uart.written)
+    assert written <= uartlink.UART_FIFO_SIZE
+    clock.now = 100
+    tx.service(clock.now)
+    # 9600 baud is 0.96 bytes per ms
+    assert sum(len(data) for data in uart.written) <= uartlink.UART_FIFO_SIZE + 96
+
+
+def test_frames_are_encoded_once_and_numbered_as_written(clock, monkeypatch):
+    encoded = []
+    encode_frame = uartlink.encode_frame
+
+    def counting_encode_frame(command, seq, out):
+        encoded.append(command.key)
+        return encode_frame(command, seq, out)
+
+    monkeypatch.setattr(uartlink, "encode_frame", counting_encode_frame)
+    uart = FakeUART()
+    tx = TxQueue(uart, critical=(CMD_DRN,), cosmetic=(CMD_FLD, CMD_FRD))
+    tx.frames = True
+    for message in BURST[:DRAIN_AT] + ["DRN"] + BURST[DRAIN_AT:]:
+        tx.send(message)
+    # Lots of passes with no budget for the next message
+    for _ in range(50):
+        tx.service(clock.now)
+    while len(tx):
+        clock.now += 1
+        tx.service(clock.now)
+    assert len(encoded) == len(BURST) + 1
+
+    line = bytearray(32)
+    texts = []
+    seq = 0
+    for data in uart.written:
+        if data[0] != SYNC:
+            # Slingshot sides are letters, which frames can't carry
+            assert data.startswith(b"SLG ")
+            texts.append(data)
+            continue
+        assert data[2] == seq
+        seq += 1
+        length = decode_frame(data, line)
+        assert length
+        texts.append(bytes(line[:length]))
+    assert seq == len(BURST) + 1 - BURST.count("SLG L") - BURST.count("SLG R")
+    assert texts[0] == b"FLU\r\n"
+    assert texts.index(b"DRN\r\n") < DRAIN_AT
+    assert texts.count(b"FLD\r\n") == BURST.count("FLD")
+
+
+def test_unframeable_messages_stay_text(clock):
+    uart = FakeUART()
+    tx = TxQueue(uart)
+    tx.frames = True
+    tx.send("INI solenoidDriver BIN")
+    tx.send("SND 3")
+    clock.now = 1000
+    tx.service(clock.now)
+    assert uart.written[0] == b"INI solenoidDriver BIN\r\n"
+    assert uart.written[1][0] == SYNC
+    assert uart.written[1][2] == 0
@@ -0,0 +1,177 @@
+import pytest
+
+from fake_uart import FakeUART
+from frames import MAX_FRAME_LEN, encode_frame
+from protocol import Command
+from uartlink import LineReader
+
+
+def read_all(reader):
+    lines = []
+    while True:
+        n = reader.readline()
+        if not n:
+            return lines
+        lines.append(bytes(reader.line[:n]))
+
+
+def test_line_split_across_arrivals():
+    uart = FakeUART()
+    reader = LineReader(uart)
+    uart.arrive(b"SND 1")
+    assert reader.readline() == 0
+    uart.arrive(b"2\r")
+    assert reader.readline() == 0
+    uart.arrive(b"\n")
+    assert read_all(reader) == [b"SND 12\r\n"]
+
+
+def test_several_lines_in_one_arrival():
+    uart = FakeUART()
+    reader = LineReader(uart)
+    uart.arrive(b"BTN 1\nBTN 2\nBT")
+    assert read_all(reader) == [b"BTN 1\n", b"BTN 2\n"]
+    uart.arrive(b"N 3\n")
+    assert read_all(reader) == [b"BTN 3\n"]
+
+
+def test_lines_across_the_ring_wrap():
+    uart = FakeUART(chunk=3)
+    reader = LineReader(uart, size=16)
+    expected = [b"PNT %d\n" % i for i in range(20)]
+    for line in expected:
+        uart.arrive(line)
+    assert read_all(reader) == expected
+    assert reader.overflows == 0
+
+
+def test_line_split_exactly_at_the_ring_end():
+    uart = FakeUART()
+    reader = LineReader(uart, size=8)
+    uart.arrive(b"AB\n")
+    assert read_all(reader) == [b"AB\n"]
+    # Starts 3 bytes in, so this line wraps to the start of the ring
+    uart.arrive(b"CDEFG")
+    assert reader.readline() == 0
+    uart.arrive(b"\n")
+    assert read_all(reader) == [b"CDEFG\n"]
+
+
+def test_more_waiting_than_the_ring_holds():
+    uart = FakeUART()
+    reader = LineReader(uart, size=16)
+    expected = [b"RNK %d\n" % i for i in range(10)]
+    uart.arrive(b"".join(expected))
+    assert read_all(reader) == expected
+    assert reader.overflows == 0
+
+
+def test_overlong_line_is_dropped_whole():
+    uart = FakeUART()
+    reader = LineReader(uart, size=16)
+    uart.arrive(b"X" * 40 + b"\nOK\n")
+    assert read_all(reader) == [b"OK\n"]
+    assert reader.overflows == 1
+
+
+def test_overlong_line_split_across_arrivals():
+    uart = FakeUART()
+    reader = LineReader(uart, size=16)
+    uart.arrive(b"Y" * 20)
+    assert reader.readline() == 0
+    uart.arrive(b"Y" * 20)
+    assert reader.readline() == 0
+    uart.arrive(b"YY\nOK\n")
+    assert read_all(reader) == [b"OK\n"]
+    assert reader.overflows == 1
+
+
+STREAM = b"SND 12\r\nPNT 2500\nBTN 1\r\nRNK 4\n"
+STREAM_LINES = [b"SND 12\r\n", b"PNT 2500\n", b"BTN 1\r\n", b"RNK 4\n"]
+
+
+@pytest.mark.parametrize("split", range(len(STREAM) + 1))
+def test_stream_split_at_every_index(split):
+    uart = FakeUART()
+    reader = LineReader(uart)
+    uart.arrive(STREAM[:split])
+    lines = read_all(reader)
+    uart.arrive(STREAM[split:])
+    assert lines + read_all(reader) == STREAM_LINES
+
+
+@pytest.mark.parametrize("split", range(len(STREAM) + 1))
+def test_stream_split_at_every_index_across_the_ring_wrap(split):
+    uart = FakeUART(chunk=5)
+    reader = LineReader(uart, size=16)
+    # Leaves the head 15 bytes in, so the stream wraps the ring in its first line
+    uart.arrive(b"ACC 1\nDTR\nPB 9\n")
+    assert read_all(reader) == [b"ACC 1\n", b"DTR\n", b"PB 9\n"]
+    uart.arrive(STREAM[:split])
+    lines = read_all(reader)
+    uart.arrive(STREAM[split:])
+    assert lines + read_all(reader) == STREAM_LINES
+    assert reader.overflows == 0
+
+
+@pytest.mark.parametrize("split", range(1, 41))
+def test_overlong_line_split_at_every_index(split):
+    uart = FakeUART(chunk=7)
+    reader = LineReader(uart, size=16)
+    data = b"Z" * 30 + b"\nSND 1\n"
+    uart.arrive(data[:split])
+    lines = read_all(reader)
+    uart.arrive(data[split:])
+    assert lines + read_all(reader) == [b"SND 1\n"]
+    assert reader.overflows == 1
+
+
+def test_discarding_stops_at_the_next_line():
+    uart = FakeUART()
+    reader = LineReader(uart, size=16)
+    uart.arrive(b"W" * 16)
+    assert reader.readline() == 0
+    assert reader.overflows == 1
+    # The end of the dropped line, then lines that fit again
+    uart.arrive(b"WW\nA\nB\n")
+    assert read_all(reader) == [b"A\n", b"B\n"]
+    uart.arrive(b"V" * 20 + b"\n")
+    assert read_all(reader) == []
+    assert reader.overflows == 2
+
+
+def frame(text, seq):
+    command = Command()
+    command.parse(text)
+    out = bytearray(MAX_FRAME_LEN)
+    return bytes(out[:encode_frame(command, seq, out)])
+
+
+FRAMED = frame(b"PNT 2500", 0) + b"INI soundController\r\n" + frame(b"SND 12", 1) + frame(b"DT 3", 2)
+FRAMED_LINES = [b"PNT 2500\r\n", b"INI soundController\r\n", b"SND 12\r\n", b"DT 3\r\n"]
+
+
+@pytest.mark.parametrize("split", range(len(FRAMED) + 1))
+def test_frames_and_lines_split_at_every_index(split):
+    uart = FakeUART(chunk=3)
+    reader = LineReader(uart, size=32)
+    reader.frames = True
+    uart.arrive(b"ACC 1\nDTR\n")  # Puts the frames across the ring wrap
+    assert read_all(reader) == [b"ACC 1\n", b"DTR\n"]
+    uart.arrive(FRAMED[:split])
+    lines = read_all(reader)
+    uart.arrive(FRAMED[split:])
+    assert lines + read_all(reader) == FRAMED_LINES
+    assert reader.frame_errors == 0
+    assert reader.seq_gaps == 0
+
+
+def test_frames_are_noise_until_frame_mode():
+    uart = FakeUART()
+    reader = LineReader(uart)
+    uart.arrive(frame(b"PB 1", 0) + b"\nSND 1\n")
+    assert read_all(reader)[1:] == [b"SND 1\n"]
+    reader.frames = True
+    uart.arrive(b"garbage" + frame(b"PB 2", 1) + b"SND 2\n")
+    # Text with no line ending before a frame is dropped
+    assert read_all(reader) == [b"PB 2\r\n", b"SND 2\n"]
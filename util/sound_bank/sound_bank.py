@@ -0,0 +1,176 @@
+"""Pack the soundController's effect WAVs into one sound bank file.
+
+The soundController reads effects into RAM from a bank file it keeps open
+(code/soundController/sound_bank.py), rather than opening a WAV file on
+the SD card for each one. This packs every SOUND<n + 1>.WAV in a
+directory, the same names the audio FX board uses, into a bank where
+sound n is entry n of a fixed size index at the start of the file. Only
+the PCM samples are kept; the WAV headers become the index's format
+fields. Each sound starts on a 512 byte boundary.
+
+The bank is read back and compared with the WAV files before it is
+written. With --bench, the time to find a sound and read its first
+block from the open bank is compared with opening and parsing its WAV
+file, on this computer. That shows the difference in file-open cost,
+but not the SD card's.
+
+Runs on a host computer with plain Python 3:
+
+    python3 sound_bank.py sfx/ SFX.BNK
+"""
+
+import argparse
+import os
+import struct
+import sys
+import time
+import wave
+
+MAGIC = b"SBNK"
+VERSION = 1
+HEADER_FORMAT = "<4sHH"
+HEADER_SIZE = 8
+ENTRY_FORMAT = "<IIIHH"
+ENTRY_SIZE = 16
+ALIGN = 512
+FIRST_BLOCK = 512  # Bytes read by --bench, a buffer's worth of samples
+
+
+class BankError(Exception):
+    """Sound files this tool can't pack, or a bank it can't read."""
+
+
+def sound_files(directory):
+    """Return a dict of sound number to path for the SOUND<n + 1>.WAV files in a directory."""
+    sounds = {}
+    for name in os.listdir(directory):
+        upper = name.upper()
+        if upper.startswith("SOUND") and upper.endswith(".WAV") and upper[5:-4].isdigit():
+            sounds[int(upper[5:-4]) - 1] = os.path.join(directory, name)
+    return sounds
+
+
+def read_wave(path):
+    """Return (sample_rate, channels, bits, samples) of an uncompressed PCM WAV file."""
+    try:
+        with wave.open(path, "rb") as w:
+            return w.getframerate(), w.getnchannels(), w.getsampwidth() * 8, w.readframes(w.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise BankError(f"{path}: {e}") from None
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def pack(sounds):
+    """Build a bank from a dict of sound number to (sample_rate, channels, bits, samples)."""
+    count = max(sounds) + 1 if sounds else 0
+    if count > 0xFFFF:
+        raise BankError(f"sound {count - 1} is past the end of the index")
+    index = bytearray(count * ENTRY_SIZE)
+    offset = _aligned(HEADER_SIZE + len(index))
+    data = bytearray()
+    for sound in sorted(sounds):
+        rate, channels, bits, samples = sounds[sound]
+        if not samples:
+            raise BankError(f"sound {sound} has no samples")
+        struct.pack_into(ENTRY_FORMAT, index, sound * ENTRY_SIZE, offset + len(data), len(samples), rate, channels, bits)
+        data += samples
+        data += bytes(_aligned(len(data)) - len(data))
+    padding = bytes(offset - HEADER_SIZE - len(index))
+    return struct.pack(HEADER_FORMAT, MAGIC, VERSION, count) + bytes(index) + padding + bytes(data)
+
+
+def read_bank(bank):
+    """Decode a bank into a dict of sound number to (sample_rate, channels, bits, samples)."""
+    if len(bank) < HEADER_SIZE:
+        raise BankError("not a sound bank")
+    magic, version, count = struct.unpack_from(HEADER_FORMAT, bank)
+    if magic != MAGIC or version != VERSION:
+        raise BankError(f"not a version {VERSION} sound bank")
+    sounds = {}
+    for sound in range(count):
+        offset, length, rate, channels, bits = struct.unpack_from(ENTRY_FORMAT, bank, HEADER_SIZE + sound * ENTRY_SIZE)
+        if length:
+            if offset + length > len(bank):
+                raise BankError(f"sound {sound} runs past the end of the bank")
+            sounds[sound] = (rate, channels, bits, bank[offset:offset + length])
+    return sounds
+
+
+def bench(bank_path, paths, repeat=200):
+    """Time finding each sound and reading its first block, from the bank and from its own WAV file.
+
+    Both sides run the same loop over the sounds. The bank is opened and
+    its index read once beforehand, as the soundController does at
+    startup; each WAV file is opened and its header parsed every time, as
+    it would be to play it. Returns the average seconds per sound for
+    each, and the seconds the one-off bank open took.
+    """
+    sounds = sorted(paths)
+    buf = bytearray(FIRST_BLOCK)
+    frames = FIRST_BLOCK // 2
+
+    start = time.perf_counter()
+    bank = open(bank_path, "rb")
+    count = struct.unpack(HEADER_FORMAT, bank.read(HEADER_SIZE))[2]
+    index = bank.read(count * ENTRY_SIZE)
+    bank_open = time.perf_counter() - start
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for sound in sounds:
+                offset = struct.unpack_from(ENTRY_FORMAT, index, sound * ENTRY_SIZE)[0]
+                bank.seek(offset)
+                bank.readinto(buf)
+        from_bank = (time.perf_counter() - start) / (repeat * len(sounds))
+    finally:
+        bank.close()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for sound in sounds:
+            with wave.open(paths[sound], "rb") as w:
+                w.readframes(frames)
+    from_files = (time.perf_counter() - start) / (repeat * len(sounds))
+    return from_bank, from_files, bank_open
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("directory", help="directory of SOUND<n>.WAV files")
+    parser.add_argument("output", help="sound bank to write")
+    parser.add_argument("--bench", action="store_true", help="time reads from the bank against reads from the WAV files")
+    args = parser.parse_args()
+
+    paths = sound_files(args.directory)
+    if not paths:
+        sys.exit(f"No SOUND<n>.WAV files in {args.directory}")
+    sounds = {sound: read_wave(path) for sound, path in paths.items()}
+    bank = pack(sounds)
+    if read_bank(bank) != sounds:
+        sys.exit("Round trip check failed, not writing " + args.output)
+    with open(args.output, "wb") as f:
+        f.write(bank)
+
+    samples = sum(len(s[3]) for s in sounds.values())
+    print(f"{args.output}: {len(sounds)} sounds, {samples} bytes of samples, {len(bank)} bytes")
+    formats = set()
+    for sound in sorted(sounds):
+        rate, channels, bits, _ = sounds[sound]
+        if bits != 16:
+            print(f"Sound {sound} is {bits} bit; the mixer only plays 16-bit sounds")
+        formats.add((rate, channels))
+    if len(formats) > 1:
+        print(f"Sounds come in {len(formats)} formats; only those matching the music's sample rate and channels play")
+    if args.bench:
+        from_bank, from_files, bank_open = bench(args.output, paths)
+        print(
+            f"Lookup and first {FIRST_BLOCK} bytes per sound: bank {from_bank * 1e6:.1f} us, "
+            f"separate files {from_files * 1e6:.1f} us (bank opened once in {bank_open * 1e6:.1f} us)"
+        )
+
+
+if __name__ == "__main__":
+    main()